@@ -0,0 +1,182 @@
+"""
+تردد فحص تكيفي يتعلم أوقات ظهور المواعيد لكل مدينة حسب الوقت من اليوم
+Adaptive polling cadence learned from recorded slot-release history per
+(city, visa_type) and time-of-day bucket, kept within configurable bounds
+"""
+
+import atexit
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+DEFAULT_HISTORY_PATH = os.environ.get('CADENCE_HISTORY', '.cadence_history.json')
+
+# طول نافذة الوقت من اليوم بالدقائق (96 نافذة يومياً)
+BUCKET_MINUTES = 15
+BUCKETS_PER_DAY = 24 * 60 // BUCKET_MINUTES
+
+
+def bucket_of(when):
+    return (when.hour * 60 + when.minute) // BUCKET_MINUTES
+
+
+def bucket_label(bucket):
+    minutes = bucket * BUCKET_MINUTES
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+class CadenceModel:
+    """سجل ظهور المواعيد لكل هدف ونافذة زمنية وتحويله إلى فاصل فحص
+
+    الفحص مكثف (min_interval) داخل النوافذ التي ظهرت فيها مواعيد سابقاً وقبلها
+    بـ lead_buckets نافذة، ويتباعد تدريجياً حتى max_interval في باقي اليوم.
+    قبل توفر بيانات كافية يُستخدم default_interval.
+    السجل يُحفظ كل save_every تسجيلاً أو كل save_interval ثانية، وعند إيقاف البرنامج.
+    """
+
+    def __init__(self, history_path=DEFAULT_HISTORY_PATH, min_interval=5, max_interval=120,
+                 default_interval=15, hot_rate=0.5, lead_buckets=1, min_days=2, save_every=20,
+                 save_interval=300):
+        self.history_path = history_path
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.default_interval = default_interval
+        self.hot_rate = hot_rate
+        self.lead_buckets = lead_buckets
+        self.min_days = min_days
+        self.save_every = save_every
+        self.save_interval = save_interval
+        self._lock = threading.Lock()
+        self._unsaved = 0
+        self._saved_at = time.monotonic()
+        self._history = self.load_history() or {}
+        # المراقبة قليلة التكرار قد لا تصل إلى save_every قبل إعادة التشغيل
+        atexit.register(self.flush)
+
+    @staticmethod
+    def _key(key):
+        return '|'.join(key)
+
+    def load_history(self):
+        try:
+            with open(self.history_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save_history(self):
+        with self._lock:
+            snapshot = json.dumps(self._history, ensure_ascii=False)
+            self._unsaved = 0
+            self._saved_at = time.monotonic()
+        try:
+            with open(self.history_path, 'w', encoding='utf-8') as f:
+                f.write(snapshot)
+        except OSError as e:
+            print(f"⚠️ تعذر حفظ سجل أوقات ظهور المواعيد: {e}")
+
+    def flush(self):
+        """حفظ التسجيلات التي لم تُحفظ بعد (إن وُجدت)"""
+        with self._lock:
+            pending = self._unsaved
+        if pending:
+            self.save_history()
+
+    def _entry(self, key):
+        name = self._key(key)
+        entry = self._history.get(name)
+        if entry is None:
+            entry = {
+                'days': [0] * BUCKETS_PER_DAY,        # عدد الأيام التي رُوقبت فيها كل نافذة
+                'last_day': [None] * BUCKETS_PER_DAY,
+                'releases': [0] * BUCKETS_PER_DAY,    # عدد مرات ظهور مواعيد بعد غيابها
+                'observations': 0,
+                'available': False
+            }
+            self._history[name] = entry
+        return entry
+
+    def record(self, key, available, when=None):
+        """تسجيل نتيجة فحص - ظهور المواعيد بعد غيابها يُحسب إطلاقاً في نافذته"""
+        when = when or datetime.now()
+        bucket = bucket_of(when)
+        day = when.strftime('%Y-%m-%d')
+        with self._lock:
+            entry = self._entry(key)
+            entry['observations'] += 1
+            if entry['last_day'][bucket] != day:
+                entry['last_day'][bucket] = day
+                entry['days'][bucket] += 1
+            if available and not entry['available']:
+                entry['releases'][bucket] += 1
+            entry['available'] = bool(available)
+            self._unsaved += 1
+            should_save = (self._unsaved >= self.save_every
+                           or time.monotonic() - self._saved_at >= self.save_interval)
+        if should_save:
+            self.save_history()
+
+    def _rate(self, entry, bucket):
+        bucket %= BUCKETS_PER_DAY
+        days = entry['days'][bucket]
+        return entry['releases'][bucket] / days if days else 0.0
+
+    def release_score(self, key, when=None):
+        """متوسط الإطلاقات اليومية حول النافذة الحالية والنوافذ القادمة"""
+        bucket = bucket_of(when or datetime.now())
+        with self._lock:
+            entry = self._history.get(self._key(key))
+            if entry is None:
+                return None
+            upcoming = [self._rate(entry, bucket + i) for i in range(self.lead_buckets + 1)]
+            neighbours = [self._rate(entry, bucket - 1), self._rate(entry, bucket + self.lead_buckets + 1)]
+            return max(upcoming + [rate / 2 for rate in neighbours])
+
+    def interval_for(self, key, when=None):
+        """فاصل الفحص التالي بالثواني ضمن [min_interval, max_interval]"""
+        when = when or datetime.now()
+        with self._lock:
+            entry = self._history.get(self._key(key))
+            if entry is None or max(entry['days']) < self.min_days:
+                return self.default_interval
+            if entry['available']:
+                # المواعيد متاحة الآن - متابعتها بأقصى سرعة حتى تختفي
+                return self.min_interval
+        score = self.release_score(key, when) or 0.0
+        heat = min(1.0, score / self.hot_rate)
+        interval = self.max_interval - (self.max_interval - self.min_interval) * heat
+        return round(max(self.min_interval, min(self.max_interval, interval)), 1)
+
+    def describe(self):
+        """وصف نطاق التردد لرسائل الإشعار"""
+        return f"تكيفي بين {self.min_interval:g} و {self.max_interval:g} ثانية حسب أوقات ظهور المواعيد"
+
+    def stats(self, key=None, top=5):
+        """أكثر النوافذ الزمنية نشاطاً والفاصل الحالي لكل هدف"""
+        with self._lock:
+            names = [self._key(key)] if key else list(self._history)
+            entries = {name: self._history[name] for name in names if name in self._history}
+        result = {}
+        for name, entry in entries.items():
+            rates = sorted(
+                ((self._rate(entry, b), b) for b in range(BUCKETS_PER_DAY) if entry['releases'][b]),
+                reverse=True
+            )[:top]
+            result[name] = {
+                'observations': entry['observations'],
+                'available': entry['available'],
+                'current_interval': self.interval_for(tuple(name.split('|'))),
+                'hot_windows': [{'window': bucket_label(b), 'releases_per_day': round(rate, 2)} for rate, b in rates]
+            }
+        return result
+
+
+def cadence_from_env():
+    """إنشاء نموذج التردد من متغيرات البيئة"""
+    return CadenceModel(
+        min_interval=float(os.environ.get('CADENCE_MIN_INTERVAL', '5')),
+        max_interval=float(os.environ.get('CADENCE_MAX_INTERVAL', '120')),
+        default_interval=float(os.environ.get('CADENCE_DEFAULT_INTERVAL', '15'))
+    )
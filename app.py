@@ -1,21 +1,33 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for
-from selenium import webdriver
+from flask import Flask, render_template, request, jsonify, redirect, url_for, Response
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait, Select
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.options import Options
-from webdriver_manager.chrome import ChromeDriverManager
-from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.common.action_chains import ActionChains
 from selenium.common.exceptions import StaleElementReferenceException, TimeoutException
-import threading
+from browser_pool import get_browser_pool, BLS_BASE_URL
+from driver_resolver import startup_timings
+from page_waits import PageWaiter
+from page_watcher import PageWatcher, forget_document_scripts, modal_appeared, latest_slots
+from session_registry import SessionRegistry, STATUS_BOOKED, STATUS_FAILED
+from observation_hub import ObservationHub
+from job_scheduler import JobScheduler, Job, JOB_DONE
+from adaptive_cadence import cadence_from_env
+from pipeline_metrics import pipeline_metrics, traced
+from page_model_cache import page_model_cache, LearnedLookup
+from dom_fingerprint import page_changes
+from storage import get_storage
+from http_probe import HttpProbe, TieredProbe
+from booking_standby import BookingPayload, StandbyManager, install_fill_function
+from selector_engine import (
+    SelectorEngine, WARNING_CLOSE_SELECTORS, POPUP_CLOSE_SELECTORS, APPOINTMENT_BUTTON_SELECTORS,
+    AVAILABLE_SLOT_SELECTORS, SUBMIT_SELECTORS, SUCCESS_INDICATOR_SELECTORS,
+    BOOKING_CONFIRMATION_SELECTORS, NEXT_BUTTON_SELECTORS, ERROR_INDICATOR_SELECTORS, field_locators
+)
 import time
 import json
 import os
 from datetime import datetime
 # import pywhatkit as pwk  # Disabled for server deployment
-import schedule
-import sqlite3
 from werkzeug.security import generate_password_hash
 import secrets
 
@@ -31,276 +43,164 @@ except ImportError as e:
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', secrets.token_hex(16))
 
-# Global variables
-monitoring_active = False
-user_data = {}
-monitoring_thread = None
+# جلسات المراقبة المتزامنة - كل جلسة بحالتها وإشارة إيقافها الخاصة
+session_registry = SessionRegistry(max_sessions=int(os.environ.get('MAX_MONITORING_SESSIONS', '50')))
 
-# Database setup
-def init_db():
-    """Initialize database for storing user data - supports both SQLite and PostgreSQL"""
-    database_url = os.environ.get('DATABASE_URL')
-    
-    if database_url and database_url.startswith('postgres'):
-        # Cloud PostgreSQL database
-        import psycopg2
-        from urllib.parse import urlparse
-        
-        # Parse the database URL
-        parsed_url = urlparse(database_url)
-        
-        # Connect to PostgreSQL
-        conn = psycopg2.connect(
-            host=parsed_url.hostname,
-            database=parsed_url.path[1:],
-            user=parsed_url.username,
-            password=parsed_url.password,
-            port=parsed_url.port
-        )
-        cursor = conn.cursor()
-        
-        # Create table with PostgreSQL syntax
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS bookings (
-                id SERIAL PRIMARY KEY,
-                session_id VARCHAR(255) UNIQUE,
-                full_name VARCHAR(255),
-                passport_number VARCHAR(50),
-                birth_date VARCHAR(20),
-                phone_number VARCHAR(20),
-                email VARCHAR(255),
-                visa_type VARCHAR(100),
-                preferred_city VARCHAR(100),
-                whatsapp_number VARCHAR(20),
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                status VARCHAR(20) DEFAULT 'active'
-            )
-        ''')
-        conn.commit()
-        conn.close()
-        print("PostgreSQL database initialized successfully")
-        
-    else:
-        # Local SQLite database
-        conn = sqlite3.connect('visa_bookings.db')
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS bookings (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                session_id TEXT UNIQUE,
-                full_name TEXT,
-                passport_number TEXT,
-                birth_date TEXT,
-                phone_number TEXT,
-                email TEXT,
-                visa_type TEXT,
-                preferred_city TEXT,
-                whatsapp_number TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                status TEXT DEFAULT 'active'
-            )
-        ''')
-        conn.commit()
-        conn.close()
-        print("SQLite database initialized successfully")
+# ملء النموذج بسكريبت واحد داخل الصفحة (0 للرجوع إلى البحث حقلاً بحقل)
+BULK_FORM_FILL = os.environ.get('BULK_FORM_FILL', '1') != '0'
 
-def get_db_connection():
-    """Get database connection - supports both SQLite and PostgreSQL"""
-    database_url = os.environ.get('DATABASE_URL')
-    
-    if database_url and database_url.startswith('postgres'):
-        import psycopg2
-        from urllib.parse import urlparse
-        parsed_url = urlparse(database_url)
-        
-        return psycopg2.connect(
-            host=parsed_url.hostname,
-            database=parsed_url.path[1:],
-            user=parsed_url.username,
-            password=parsed_url.password,
-            port=parsed_url.port
-        )
-    else:
-        return sqlite3.connect('visa_bookings.db')
+# Database setup - one pooled storage layer (bookings + notification logs) for the whole process
+storage = get_storage()
+print(f"{'PostgreSQL' if storage.backend == 'postgres' else 'SQLite'} database initialized successfully "
+      f"(schema v{storage.schema_version()})")
 
 def save_user_data(session_id, data):
     """Save user data to database"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
     try:
-        if os.environ.get('DATABASE_URL', '').startswith('postgres'):
-            # PostgreSQL syntax
-            cursor.execute('''
-                INSERT INTO bookings (session_id, full_name, passport_number, birth_date, 
-                                    phone_number, email, visa_type, preferred_city, whatsapp_number)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-                ON CONFLICT (session_id) DO UPDATE SET
-                    full_name = EXCLUDED.full_name,
-                    passport_number = EXCLUDED.passport_number,
-                    birth_date = EXCLUDED.birth_date,
-                    phone_number = EXCLUDED.phone_number,
-                    email = EXCLUDED.email,
-                    visa_type = EXCLUDED.visa_type,
-                    preferred_city = EXCLUDED.preferred_city,
-                    whatsapp_number = EXCLUDED.whatsapp_number
-            ''', (session_id, data.get('full_name'), data.get('passport_number'), 
-                  data.get('birth_date'), data.get('phone_number'), data.get('email'),
-                  data.get('visa_type'), data.get('preferred_city'), data.get('whatsapp_number')))
-        else:
-            # SQLite syntax
-            cursor.execute('''
-                INSERT OR REPLACE INTO bookings (session_id, full_name, passport_number, birth_date, 
-                                               phone_number, email, visa_type, preferred_city, whatsapp_number)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (session_id, data.get('full_name'), data.get('passport_number'), 
-                  data.get('birth_date'), data.get('phone_number'), data.get('email'),
-                  data.get('visa_type'), data.get('preferred_city'), data.get('whatsapp_number')))
-        
-        conn.commit()
+        storage.bookings.save(session_id, data)
         return True
     except Exception as e:
         print(f"Error saving user data: {e}")
         return False
-    finally:
-        conn.close()
 
 def load_user_data(session_id):
     """Load user data from database"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
     try:
-        if os.environ.get('DATABASE_URL', '').startswith('postgres'):
-            cursor.execute('SELECT * FROM bookings WHERE session_id = %s', (session_id,))
-        else:
-            cursor.execute('SELECT * FROM bookings WHERE session_id = ?', (session_id,))
-        
-        row = cursor.fetchone()
-        if row:
-            columns = [desc[0] for desc in cursor.description]
-            return dict(zip(columns, row))
-        return None
+        return storage.bookings.load(session_id)
     except Exception as e:
         print(f"Error loading user data: {e}")
         return None
-    finally:
-        conn.close()
-
-# Initialize database on startup
-init_db()
 
 class VisaBookingBot:
-    def __init__(self, user_data):
+    def __init__(self, user_data, base_url=None, payload=None):
         self.user_data = user_data
+        self.base_url = base_url or BLS_BASE_URL
+        self.payload = payload
         self.driver = None
         self.wait = None
+        self.selectors = None
+        self.waits = None
+        self.watcher = None
+        self.lease = None
+        self.home_handle = None
+        self.standby_handle = None
+        self.fill_installed = False
         
-    def setup_driver(self):
-        """إعداد متصفح Chrome للبيئة السحابية"""
-        chrome_options = Options()
+    def setup_driver(self, timeout=120):
+        """الحصول على متصفح Chrome دافئ من مجمع المتصفحات"""
+        self.lease = get_browser_pool().acquire(timeout=timeout)
+        self._attach_driver()
         
-        # إعدادات للبيئة السحابية
-        chrome_options.add_argument("--headless")  # تشغيل بدون واجهة
-        chrome_options.add_argument("--no-sandbox")
-        chrome_options.add_argument("--disable-dev-shm-usage")
-        chrome_options.add_argument("--disable-gpu")
-        chrome_options.add_argument("--window-size=1920,1080")
-        chrome_options.add_argument("--disable-blink-features=AutomationControlled")
-        chrome_options.add_argument("--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36")
-        chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
-        chrome_options.add_experimental_option('useAutomationExtension', False)
+    def reset_driver(self):
+        """استبدال المتصفح المعطوب بجلسة دافئة من المجمع بدلاً من إعادة تشغيل Chrome"""
+        print("🔄 استبدال جلسة المتصفح...")
+        self.lease = get_browser_pool().swap(self.lease)
+        self._attach_driver()
         
-        # استخدام ChromeDriverManager للتحديث التلقائي
-        try:
-            service = Service(ChromeDriverManager().install())
-            self.driver = webdriver.Chrome(service=service, options=chrome_options)
-        except:
-            # Fallback للبيئة المحلية
-            self.driver = webdriver.Chrome(options=chrome_options)
-            
-        self.driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
+    def release_driver(self):
+        """إعادة جلسة المتصفح إلى المجمع"""
+        if self.standby_handle:
+            try:
+                self.close_standby_tab()
+            except Exception as e:
+                print(f"⚠️ خطأ في إغلاق تبويب الحجز الاحتياطي: {e}")
+        if self.lease:
+            self.lease.release()
+            self.lease = None
+        self.driver = None
+        
+    def _attach_driver(self):
+        self.driver = self.lease.driver
         self.wait = WebDriverWait(self.driver, 10)
+        self.selectors = SelectorEngine(self.driver)
+        self.waits = PageWaiter(self.driver, self.selectors)
+        self.watcher = PageWatcher(self.driver)
+        
+    def open_standby_tab(self):
+        """فتح تبويب ثانٍ على مسار الحجز مع تثبيت دالة الملء - التبويب الأصلي يبقى كما هو للمجمع"""
+        self.home_handle = self.driver.current_window_handle
+        self.driver.switch_to.new_window('tab')
+        self.standby_handle = self.driver.current_window_handle
+        self.fill_installed = install_fill_function(self.driver)
+        self.refresh_standby()
+        
+    def refresh_standby(self):
+        """إعادة التبويب الاحتياطي إلى صفحة المواعيد حتى لا تنتهي جلسة الموقع"""
+        if not self.open_appointments_page():
+            raise RuntimeError("لم يتم العثور على زر المواعيد في تبويب الحجز الاحتياطي")
         
+    def close_standby_tab(self):
+        """إغلاق التبويب الاحتياطي والعودة إلى التبويب الأصلي"""
+        handle, self.standby_handle = self.standby_handle, None
+        self.fill_installed = False
+        if handle:
+            self.driver.close()
+            forget_document_scripts(self.driver, handle)
+            self.driver.switch_to.window(self.home_handle)
+        
+    def book_on_standby(self):
+        """الحجز من التبويب الاحتياطي: تحديث صفحة المواعيد مباشرة دون المرور بالصفحة الرئيسية"""
+        print("🛡️ الحجز من تبويب الحجز الاحتياطي...")
+        try:
+            with pipeline_metrics.span('navigate', self.driver):
+                self.driver.refresh()
+                self.waits.page_ready('navigate')
+            self.check_and_close_warning_window()
+            available_appointments = self.find_available_appointments()
+            if available_appointments:
+                return self._book_available(available_appointments)
+        except Exception as e:
+            print(f"⚠️ خطأ في تبويب الحجز الاحتياطي: {e}")
+        
+        # ربما انتهت جلسة الموقع في التبويب - المسار الكامل من الصفحة الرئيسية
+        return self.check_appointments()
+        
+    def _learned(self, role, selectors, **options):
+        """بحث عن عناصر دور معين يجرب المحدد الفائز سابقاً في هذه الصفحة أولاً"""
+        return LearnedLookup(page_model_cache, self.selectors, role, selectors, **options)
+        
+    @traced('popup')
     def check_and_close_warning_window(self, city_name=""):
         """فحص وإغلاق نافذة التحذير إذا كانت موجودة - نسخة محسنة من test_visible.py"""
-        warning_selectors = [
-            "//button[@class='btn-close']",
-            "//button[contains(@class, 'close')]",
-            "//span[contains(@class, 'close')]",
-            "//div[contains(@class, 'modal')]//button",
-            "//div[contains(@class, 'modal')]//*[text()='×']",
-            "//div[contains(@class, 'modal')]//*[text()='X']",
-            "//*[text()='×']",
-            "//*[text()='X']",
-            "//button[text()='×']",
-            "//button[text()='X']",
-            "//*[@class='close']",
-            "//*[contains(@onclick, 'close')]",
-            "//div[contains(@class, 'disclaimer')]//*[text()='×']",
-            "//div[contains(@class, 'disclaimer')]//*[text()='X']",
-            "//button[contains(@class, 'btn-close')]",
-            "//*[@id='closeModal']",
-            "//*[@id='close']",
-            "//a[contains(@class, 'close')]",
-            "//i[contains(@class, 'close')]",
-            "//span[text()='×']",
-            "//span[text()='X']",
-            "//*[contains(@aria-label, 'close')]",
-            "//*[contains(@title, 'close')]",
-            "//div[@class='modal-header']//button",
-            "//div[@class='modal-header']//*[text()='×']"
-        ]
+        # المحدد الفائز سابقاً في هذه الصفحة أولاً ثم بقية المحددات في استدعاء واحد
+        lookup = self._learned('warning_close', WARNING_CLOSE_SELECTORS)
         
-        # فحص كل محدد للبحث عن نافذة التحذير
-        for i, selector in enumerate(warning_selectors):
+        for match in lookup:
             try:
-                close_buttons = self.driver.find_elements(By.XPATH, selector)
-                if close_buttons:
-                    for j, close_button in enumerate(close_buttons):
-                        try:
-                            if close_button.is_displayed() and close_button.is_enabled():
-                                print(f"🎉 تم العثور على نافذة التحذير!")
-                                print(f"🎯 المحدد المستخدم: {selector}")
-                                print(f"🖱️ النقر على زر الإغلاق...")
-                                close_button.click()
-                                print(f"✅ تم إغلاق نافذة التحذير في صفحة {city_name}")
-                                time.sleep(2)  # انتظار إغلاق النافذة
-                                return True
-                        except Exception as click_error:
-                            continue
-            except Exception as selector_error:
+                print(f"🎉 تم العثور على نافذة التحذير!")
+                print(f"🎯 المحدد المستخدم: {match['selector']}")
+                print(f"🖱️ النقر على زر الإغلاق...")
+                match['element'].click()
+                print(f"✅ تم إغلاق نافذة التحذير في صفحة {city_name}")
+                lookup.win(match)
+                self.waits.gone(match['element'])  # انتظار إغلاق النافذة
+                return True
+            except Exception as click_error:
                 continue
         
+        lookup.fail()
         return False
     
+    @traced('popup')
     def close_warning_popup(self):
         """إغلاق النافذة المنبثقة للتحذير إن وجدت - نسخة محسنة من test_visible.py"""
         try:
             print("🔍 البحث عن نافذة التحذير...")
-            # البحث عن أزرار الإغلاق المختلفة
-            close_selectors = [
-                "//button[contains(@class, 'close')]",
-                "//button[contains(text(), 'Close')]",
-                "//button[contains(text(), 'OK')]",
-                "//button[contains(text(), 'Accept')]",
-                "//span[contains(@class, 'close')]",
-                "//*[@id='closeButton']",
-                "//*[contains(@onclick, 'close')]"
-            ]
+            # البحث عن أزرار الإغلاق المختلفة (أول تطابق لكل محدد)
+            lookup = self._learned('popup_close', POPUP_CLOSE_SELECTORS, first_only=True, require_enabled=False)
             
-            for selector in close_selectors:
+            for match in lookup:
                 try:
-                    close_button = self.driver.find_element(By.XPATH, selector)
-                    if close_button.is_displayed():
-                        print("✅ تم العثور على زر إغلاق التحذير")
-                        close_button.click()
-                        print("🖱️ تم إغلاق نافذة التحذير")
-                        time.sleep(2)
-                        return True
+                    print("✅ تم العثور على زر إغلاق التحذير")
+                    match['element'].click()
+                    print("🖱️ تم إغلاق نافذة التحذير")
+                    lookup.win(match)
+                    self.waits.gone(match['element'])
+                    return True
                 except:
                     continue
             
+            lookup.fail()
             print("ℹ️ لم يتم العثور على نافذة تحذير")
             return True
             
@@ -324,48 +224,68 @@ class VisaBookingBot:
         except Exception as e:
             print(f"خطأ في إرسال WhatsApp: {str(e)}")
     
+    def open_appointments_page(self):
+        """الانتقال إلى صفحة المواعيد مع إغلاق نوافذ التحذير - يعيد False إذا لم يوجد زر المواعيد"""
+        print("🌐 الانتقال إلى موقع BLS Spain Morocco...")
+        with pipeline_metrics.span('navigate', self.driver):
+            self.driver.get(self.base_url)
+            self.waits.page_ready('navigate')
+        
+        # إغلاق نوافذ التحذير
+        self.close_warning_popup()
+        self.check_and_close_warning_window()
+        
+        # البحث عن أزرار المواعيد باستخدام الطريقة المحسنة
+        if not self.find_and_click_appointment_button():
+            return False
+        
+        print("✅ تم العثور على زر المواعيد والنقر عليه")
+        self.waits.dom_quiet('settle')
+        
+        # إغلاق أي نوافذ تحذير جديدة
+        self.check_and_close_warning_window()
+        return True
+    
+    def observe_availability(self, duration, should_continue=lambda: True):
+        """فحص توفر المواعيد دون حجز ثم مراقبة الصفحة حتى duration ثانية - يستخدمه المراقب المشترك"""
+        if not self.open_appointments_page():
+            print("❌ لم يتم العثور على زر المواعيد")
+            return {'available': False, 'count': 0, 'page_found': False}
+        
+        # تسجيل المناطق التي تغيرت منذ الدورة السابقة مع نتيجة الفحص (الفحص يتم دائماً)
+        key = ObservationHub.make_key(self.user_data.get('preferred_city'), self.user_data.get('visa_type'))
+        change = page_changes.observe(key, self.driver)
+        count = len(self.find_available_appointments())
+        page_changes.record_scan(key, count)
+        
+        if not count:
+            self.watcher.install()
+            if self.watch_page(duration, should_continue):
+                page_changes.observe(key, self.driver)
+                count = len(self.find_available_appointments())
+                page_changes.record_scan(key, count)
+        
+        return {
+            'available': bool(count),
+            'count': count,
+            'page_found': True,
+            'changed_regions': change['regions'],
+            'url': self.driver.current_url
+        }
+    
     def check_appointments(self):
         """فحص المواعيد المتاحة - نسخة محسنة مع معالجة التحذيرات"""
         try:
-            print("🌐 الانتقال إلى موقع BLS Spain Morocco...")
-            self.driver.get("https://blsspainmorocco.com/")
-            time.sleep(5)
-            
-            # إغلاق نوافذ التحذير
-            self.close_warning_popup()
-            self.check_and_close_warning_window()
-            
-            # البحث عن أزرار المواعيد باستخدام الطريقة المحسنة
-            if self.find_and_click_appointment_button():
-                print("✅ تم العثور على زر المواعيد والنقر عليه")
-                time.sleep(3)
-                
-                # إغلاق أي نوافذ تحذير جديدة
-                self.check_and_close_warning_window()
-                
+            if self.open_appointments_page():
                 # البحث عن المواعيد المتاحة
                 available_appointments = self.find_available_appointments()
                 if available_appointments:
-                    print(f"🎉 تم العثور على {len(available_appointments)} موعد متاح!")
-                    self.send_whatsapp_notification("🎉 تم العثور على موعد متاح لفيزا إسبانيا! سيتم الحجز الآن...")
-                    
-                    # محاولة حجز أول موعد متاح
-                    if self.click_appointment(available_appointments[0]):
-                        print("✅ تم النقر على الموعد المتاح")
-                        
-                        # ملء النموذج
-                        if self.fill_appointment_form():
-                            print("✅ تم ملء النموذج بنجاح")
-                            self.send_whatsapp_notification("✅ تم حجز الموعد بنجاح! تحقق من بريدك الإلكتروني للتأكيد.")
-                            return True
-                        else:
-                            print("❌ فشل في ملء النموذج")
-                            self.send_whatsapp_notification("⚠️ تم العثور على موعد لكن فشل الحجز التلقائي. يرجى الحجز يدوياً.")
-                    else:
-                        print("❌ فشل في النقر على الموعد")
-                        self.send_whatsapp_notification("⚠️ تم العثور على موعد لكن فشل النقر عليه. يرجى الحجز يدوياً.")
+                    return self._book_available(available_appointments)
                 else:
                     print("❌ لا توجد مواعيد متاحة حالياً")
+                    
+                # تثبيت المراقب داخل الصفحة لرصد ظهور المواعيد حتى الفحص التالي
+                self.watcher.install()
             else:
                 print("❌ لم يتم العثور على زر المواعيد")
                 
@@ -375,102 +295,100 @@ class VisaBookingBot:
             
         return False
     
+    def _book_available(self, available_appointments):
+        """حجز أول موعد متاح من قائمة عناصر المواعيد"""
+        print(f"🎉 تم العثور على {len(available_appointments)} موعد متاح!")
+        self.send_whatsapp_notification("🎉 تم العثور على موعد متاح لفيزا إسبانيا! سيتم الحجز الآن...")
+        
+        # محاولة حجز أول موعد متاح
+        previous_url = self.driver.current_url
+        if self.click_appointment(available_appointments[0]):
+            print("✅ تم النقر على الموعد المتاح")
+            self.waits.after_action(previous_url, 'form_ready')
+            
+            # ملء النموذج
+            if self.fill_appointment_form():
+                print("✅ تم ملء النموذج بنجاح")
+                self.send_whatsapp_notification("✅ تم حجز الموعد بنجاح! تحقق من بريدك الإلكتروني للتأكيد.")
+                return True
+            else:
+                print("❌ فشل في ملء النموذج")
+                self.send_whatsapp_notification("⚠️ تم العثور على موعد لكن فشل الحجز التلقائي. يرجى الحجز يدوياً.")
+        else:
+            print("❌ فشل في النقر على الموعد")
+            self.send_whatsapp_notification("⚠️ تم العثور على موعد لكن فشل النقر عليه. يرجى الحجز يدوياً.")
+        return False
+    
+    def watch_page(self, duration, should_continue=lambda: True, tick=1):
+        """مراقبة الصفحة الحالية عبر المراقب المحقون - يعيد True فور ظهور مواعيد متاحة"""
+        deadline = time.time() + duration
+        while should_continue() and time.time() < deadline:
+            events = self.watcher.wait_for_events(min(tick, max(deadline - time.time(), 0)))
+            if modal_appeared(events):
+                print("🔔 المراقب رصد نافذة تحذير")
+                self.check_and_close_warning_window()
+            slots = latest_slots(events)
+            if slots and slots.get('count'):
+                print(f"🔔 المراقب رصد {slots['count']} موعد متاح")
+                return True
+        return False
+    
+    def book_from_current_page(self):
+        """حجز موعد من الصفحة الحالية بعد أن رصد المراقب توفره"""
+        available_appointments = self.find_available_appointments()
+        if available_appointments:
+            return self._book_available(available_appointments)
+        return False
+    
+    @traced('button_search')
     def find_and_click_appointment_button(self):
         """البحث عن زر المواعيد والنقر عليه - نسخة محسنة من test_visible.py"""
-        appointment_selectors = [
-            "//a[contains(text(), 'Appointment')]",
-            "//button[contains(text(), 'Appointment')]",
-            "//a[contains(text(), 'موعد')]",
-            "//button[contains(text(), 'موعد')]",
-            "//a[contains(@href, 'appointment')]",
-            "//a[contains(@href, 'booking')]",
-            "//button[contains(@onclick, 'appointment')]",
-            "//*[contains(@class, 'appointment')]",
-            "//*[contains(@id, 'appointment')]",
-            "//a[contains(text(), 'Book')]",
-            "//button[contains(text(), 'Book')]",
-            "//a[contains(text(), 'Schedule')]",
-            "//button[contains(text(), 'Schedule')]",
-            "//*[contains(text(), 'حجز موعد')]",
-            "//*[contains(text(), 'تحديد موعد')]"
-        ]
-        
         print("🔍 البحث عن زر المواعيد...")
         
-        for i, selector in enumerate(appointment_selectors):
+        lookup = self._learned('appointment_button', APPOINTMENT_BUTTON_SELECTORS)
+        
+        for j, match in enumerate(lookup):
             try:
-                buttons = self.driver.find_elements(By.XPATH, selector)
-                if buttons:
-                    for j, button in enumerate(buttons):
-                        try:
-                            if button.is_displayed() and button.is_enabled():
-                                print(f"🎯 تم العثور على زر المواعيد: {selector}")
-                                
-                                # محاولة النقر بطرق متعددة
-                                if self.click_element_multiple_ways(button):
-                                    print("✅ تم النقر على زر المواعيد بنجاح")
-                                    time.sleep(3)
-                                    
-                                    # التحقق من تغيير الصفحة
-                                    current_url = self.driver.current_url
-                                    if "appointment" in current_url.lower() or "booking" in current_url.lower():
-                                        print("✅ تم الانتقال إلى صفحة المواعيد")
-                                        return True
-                                    
-                        except Exception as click_error:
-                            print(f"⚠️ خطأ في النقر على الزر {j}: {click_error}")
-                            continue
-                            
-            except Exception as selector_error:
+                print(f"🎯 تم العثور على زر المواعيد: {match['selector']}")
+                
+                # محاولة النقر بطرق متعددة
+                previous_url = self.driver.current_url
+                if self.click_element_multiple_ways(match['element']):
+                    print("✅ تم النقر على زر المواعيد بنجاح")
+                    self.waits.after_action(previous_url)
+                    
+                    # التحقق من تغيير الصفحة
+                    current_url = self.driver.current_url
+                    if "appointment" in current_url.lower() or "booking" in current_url.lower():
+                        print("✅ تم الانتقال إلى صفحة المواعيد")
+                        lookup.win(match)
+                        return True
+                        
+            except Exception as click_error:
+                print(f"⚠️ خطأ في النقر على الزر {j}: {click_error}")
                 continue
         
+        lookup.fail()
         print("❌ لم يتم العثور على زر المواعيد")
         return False
     
+    @traced('slot_scan')
     def find_available_appointments(self):
         """البحث عن المواعيد المتاحة - نسخة محسنة من test_visible.py"""
-        appointment_selectors = [
-            "//button[contains(@class, 'available')]",
-            "//a[contains(@class, 'available')]",
-            "//div[contains(@class, 'available')]",
-            "//td[contains(@class, 'available')]",
-            "//span[contains(@class, 'available')]",
-            "//*[contains(@class, 'appointment-slot')]",
-            "//*[contains(@class, 'time-slot')]",
-            "//*[contains(@class, 'booking-slot')]",
-            "//button[not(contains(@class, 'disabled'))]",
-            "//a[not(contains(@class, 'disabled'))]",
-            "//*[contains(text(), 'متاح')]",
-            "//*[contains(text(), 'Available')]",
-            "//*[contains(@data-available, 'true')]",
-            "//button[contains(@onclick, 'book')]",
-            "//a[contains(@href, 'book')]"
-        ]
-        
-        available_appointments = []
-        
         print("🔍 البحث عن المواعيد المتاحة...")
         
-        for selector in appointment_selectors:
-            try:
-                elements = self.driver.find_elements(By.XPATH, selector)
-                for element in elements:
-                    try:
-                        if element.is_displayed() and element.is_enabled():
-                            # التحقق من أن العنصر ليس معطلاً
-                            if "disabled" not in element.get_attribute("class").lower():
-                                available_appointments.append(element)
-                                print(f"✅ تم العثور على موعد متاح: {element.text[:50]}")
-                    except:
-                        continue
-            except:
-                continue
+        # المحدد الذي وجد المواعيد سابقاً في هذه الصفحة أولاً، ثم جميع المحددات مع إزالة التكرارات
+        lookup = self._learned('slot', AVAILABLE_SLOT_SELECTORS)
+        matches = lookup.first_nonempty(
+            lambda found: self.selectors.deduplicate(found, exclude_class='disabled')
+        )
+        if matches:
+            lookup.win(matches[0])
         
-        # إزالة التكرارات
         unique_appointments = []
-        for appointment in available_appointments:
-            if appointment not in unique_appointments:
-                unique_appointments.append(appointment)
+        for match in matches:
+            unique_appointments.append(match['element'])
+            print(f"✅ تم العثور على موعد متاح: {match['text'][:50]}")
         
         print(f"📅 إجمالي المواعيد المتاحة: {len(unique_appointments)}")
         return unique_appointments
@@ -484,6 +402,7 @@ class VisaBookingBot:
             print(f"❌ خطأ في النقر على الموعد: {e}")
             return False
     
+    @traced('click')
     def click_element_multiple_ways(self, element):
         """النقر على عنصر بطرق متعددة لتجنب StaleElementReferenceException"""
         from selenium.webdriver.common.action_chains import ActionChains
@@ -499,7 +418,6 @@ class VisaBookingBot:
             try:
                 print(f"🔄 محاولة {method_name}...")
                 method(element)
-                time.sleep(1)
                 print(f"✅ نجح {method_name}")
                 return True
             except Exception as e:
@@ -511,8 +429,8 @@ class VisaBookingBot:
     
     def _scroll_and_click(self, element):
         """التمرير إلى العنصر ثم النقر عليه"""
-        self.driver.execute_script("arguments[0].scrollIntoView(true);", element)
-        time.sleep(1)
+        # التمرير الفوري متزامن فلا حاجة لانتظار انتهائه
+        self.driver.execute_script("arguments[0].scrollIntoView({block: 'center', behavior: 'instant'});", element)
         element.click()
     
     def fill_appointment_form(self):
@@ -520,59 +438,22 @@ class VisaBookingBot:
         try:
             print("📝 بدء ملء النموذج المحسن...")
             
-            # قائمة الحقول المحتملة مع دعم العربية والإنجليزية
-            form_fields = {
-                'full_name': {
-                    'selectors': [
-                        'full_name', 'fullName', 'name', 'الاسم الكامل', 'اسم كامل',
-                        'first_name', 'firstName', 'fname', 'given_name', 'الاسم الأول',
-                        'last_name', 'lastName', 'lname', 'family_name', 'الاسم الأخير'
-                    ],
-                    'value': self.user_data.get('full_name', '')
-                },
-                'email': {
-                    'selectors': [
-                        'email', 'email_address', 'البريد الإلكتروني', 'بريد إلكتروني',
-                        'e_mail', 'emailAddress'
-                    ],
-                    'value': self.user_data.get('email', '')
-                },
-                'phone_number': {
-                    'selectors': [
-                        'phone', 'telephone', 'mobile', 'رقم الهاتف', 'هاتف',
-                        'phone_number', 'phoneNumber', 'tel', 'contact'
-                    ],
-                    'value': self.user_data.get('phone_number', '')
-                },
-                'passport_number': {
-                    'selectors': [
-                        'passport', 'passport_number', 'رقم الجواز', 'جواز السفر',
-                        'passportNumber', 'passport_no', 'document_number'
-                    ],
-                    'value': self.user_data.get('passport_number', '')
-                },
-                'nationality': {
-                    'selectors': [
-                        'nationality', 'country', 'الجنسية', 'بلد',
-                        'birth_country', 'citizen'
-                    ],
-                    'value': self.user_data.get('nationality', 'Morocco')
-                },
-                'birth_date': {
-                    'selectors': [
-                        'birth_date', 'dob', 'date_of_birth', 'تاريخ الميلاد',
-                        'birthDate', 'dateOfBirth', 'birthday'
-                    ],
-                    'value': self.user_data.get('birth_date', '')
-                }
-            }
+            # بيانات النموذج المُطبّعة (مُجهزة مسبقاً عند بدء الجلسة إن وُجدت)
+            payload = self.payload or BookingPayload(self.user_data)
+            form_fields = payload.form_fields()
             
             filled_fields = 0
-            total_fields = len([f for f in form_fields.values() if f['value']])
+            total_fields = len(form_fields)
             
-            # ملء كل حقل باستخدام طرق متعددة
-            for field_type, field_info in form_fields.items():
-                if field_info['value']:
+            # ملء جميع الحقول بسكريبت واحد، ثم البحث حقلاً بحقل عن الحقول التي لم يجدها فقط
+            with pipeline_metrics.span('form_fill', self.driver):
+                remaining = form_fields
+                if BULK_FORM_FILL:
+                    bulk_filled = self._bulk_fill_fields(payload)
+                    filled_fields += len(bulk_filled)
+                    remaining = {name: info for name, info in remaining.items() if name not in bulk_filled}
+                
+                for field_type, field_info in remaining.items():
                     if self._fill_field_advanced(field_info['selectors'], field_info['value'], field_type):
                         filled_fields += 1
             
@@ -589,28 +470,37 @@ class VisaBookingBot:
             print(f"❌ خطأ في ملء النموذج: {e}")
             return False
     
+    def _bulk_fill_fields(self, payload):
+        """ملء الحقول دفعة واحدة داخل الصفحة وطباعة تقرير كل حقل - يعيد أسماء الحقول التي مُلئت"""
+        try:
+            report = self.selectors.bulk_fill(payload.serialized, installed=self.fill_installed)
+        except Exception as e:
+            print(f"⚠️ تعذر الملء الجماعي للنموذج: {e}")
+            return set()
+        
+        filled = set()
+        for name, result in report.items():
+            if result.get('filled'):
+                filled.add(name)
+                print(f"✅ تم ملء {name} ({result.get('strategy')}: {result.get('alias')} → {result.get('tag')})")
+            else:
+                print(f"⚠️ لم يُملأ {name} في الملء الجماعي: {result.get('error') or 'لم يتم العثور على الحقل'}")
+        return filled
+    
     def _fill_field_advanced(self, selectors, value, field_name):
         """ملء حقل معين باستخدام طرق متعددة ومحددات متنوعة"""
-        search_methods = [
-            ("البحث بالاسم", lambda selector: self.driver.find_element(By.NAME, selector)),
-            ("البحث بالـ ID", lambda selector: self.driver.find_element(By.ID, selector)),
-            ("البحث بالـ placeholder", lambda selector: self.driver.find_element(By.XPATH, f"//input[@placeholder='{selector}']")),
-            ("البحث بالـ placeholder (يحتوي)", lambda selector: self.driver.find_element(By.XPATH, f"//input[contains(@placeholder, '{selector}')]")),
-            ("البحث بالـ label", lambda selector: self.driver.find_element(By.XPATH, f"//input[following-sibling::label[contains(text(), '{selector}')] or preceding-sibling::label[contains(text(), '{selector}')]]")),
-            ("البحث بالنص القريب", lambda selector: self.driver.find_element(By.XPATH, f"//input[..//*[contains(text(), '{selector}')]]"))
-        ]
+        # بناء جميع محددات الحقل (الأسماء البديلة × طرق البحث) مع تجربة المحدد الفائز سابقاً أولاً
+        locators = field_locators(selectors)
+        method_names = {xpath: method_name for method_name, xpath in reversed(locators)}
+        lookup = self._learned(f"field:{field_name}", [xpath for _, xpath in locators], first_only=True)
         
-        for selector in selectors:
-            for method_name, method in search_methods:
-                try:
-                    element = method(selector)
-                    if element.is_displayed() and element.is_enabled():
-                        # محاولة ملء الحقل بطرق متعددة
-                        if self._fill_element_safely(element, value, field_name, method_name):
-                            return True
-                except:
-                    continue
+        for match in lookup:
+            # محاولة ملء الحقل بطرق متعددة
+            if self._fill_element_safely(match['element'], value, field_name, method_names[match['selector']]):
+                lookup.win(match)
+                return True
         
+        lookup.fail()
         print(f"⚠️ لم يتم العثور على حقل {field_name}")
         return False
     
@@ -649,70 +539,47 @@ class VisaBookingBot:
         element.clear()
         element.send_keys(value)
     
+    @traced('submit')
     def _submit_form(self):
         """إرسال النموذج باستخدام طرق متعددة"""
-        submit_selectors = [
-            "//button[contains(text(), 'Book')]",
-            "//button[contains(text(), 'Submit')]",
-            "//button[contains(text(), 'Continue')]",
-            "//button[contains(text(), 'Next')]",
-            "//button[contains(text(), 'Proceed')]",
-            "//input[@type='submit']",
-            "//button[@type='submit']",
-            "//*[contains(text(), 'حجز')]",
-            "//*[contains(text(), 'إرسال')]",
-            "//*[contains(text(), 'متابعة')]",
-            "//*[contains(text(), 'التالي')]",
-            "//button[contains(@class, 'submit')]",
-            "//button[contains(@class, 'book')]"
-        ]
-        
         print("🔍 البحث عن زر الإرسال...")
         
-        for selector in submit_selectors:
+        lookup = self._learned('submit', SUBMIT_SELECTORS, first_only=True)
+        
+        for match in lookup:
             try:
-                submit_button = self.driver.find_element(By.XPATH, selector)
-                if submit_button.is_displayed() and submit_button.is_enabled():
-                    print(f"🎯 تم العثور على زر الإرسال: {submit_button.text}")
+                print(f"🎯 تم العثور على زر الإرسال: {match['text']}")
+                
+                # محاولة النقر بطرق متعددة
+                previous_url = self.driver.current_url
+                if self.click_element_multiple_ways(match['element']):
+                    print("✅ تم إرسال النموذج بنجاح")
+                    lookup.win(match)
+                    self.waits.after_action(previous_url, 'submit')
+                    
+                    # التحقق من نجاح الإرسال
+                    return self._check_submission_success()
                     
-                    # محاولة النقر بطرق متعددة
-                    if self.click_element_multiple_ways(submit_button):
-                        print("✅ تم إرسال النموذج بنجاح")
-                        time.sleep(3)
-                        
-                        # التحقق من نجاح الإرسال
-                        return self._check_submission_success()
-                        
             except Exception as e:
                 print(f"⚠️ خطأ في زر الإرسال: {e}")
                 continue
         
+        lookup.fail()
         print("❌ لم يتم العثور على زر الإرسال")
         return False
     
+    @traced('confirmation')
     def _check_submission_success(self):
         """التحقق من نجاح إرسال النموذج"""
-        success_indicators = [
-            "//div[contains(text(), 'Success')]",
-            "//div[contains(text(), 'Confirmed')]",
-            "//div[contains(text(), 'Thank you')]",
-            "//div[contains(text(), 'Booked')]",
-            "//div[contains(text(), 'نجح')]",
-            "//div[contains(text(), 'تأكيد')]",
-            "//div[contains(text(), 'شكراً')]",
-            "//div[contains(text(), 'تم الحجز')]",
-            "//*[contains(@class, 'success')]",
-            "//*[contains(@class, 'confirmation')]"
-        ]
-        
-        for indicator in success_indicators:
-            try:
-                success_element = self.driver.find_element(By.XPATH, indicator)
-                if success_element.is_displayed():
-                    print(f"✅ تم تأكيد نجاح الحجز: {success_element.text}")
-                    return True
-            except:
-                continue
+        try:
+            success_match = self.selectors.first_match(
+                SUCCESS_INDICATOR_SELECTORS, first_only=True, require_enabled=False
+            )
+            if success_match:
+                print(f"✅ تم تأكيد نجاح الحجز: {success_match['text']}")
+                return True
+        except:
+            pass
         
         # التحقق من تغيير URL كمؤشر على النجاح
         current_url = self.driver.current_url
@@ -725,36 +592,27 @@ class VisaBookingBot:
     
     def proceed_to_next_page(self):
         """الانتقال إلى الصفحة التالية - نسخة محسنة من test_visible.py"""
-        next_button_selectors = [
-            "//button[contains(text(), 'Next')]",
-            "//button[contains(text(), 'Continue')]",
-            "//button[contains(text(), 'Submit')]",
-            "//button[contains(text(), 'Proceed')]",
-            "//input[@type='submit']",
-            "//button[@type='submit']",
-            "//*[contains(text(), 'التالي')]",
-            "//*[contains(text(), 'متابعة')]",
-            "//*[contains(text(), 'إرسال')]",
-            "//*[contains(text(), 'المتابعة')]",
-            "//button[contains(@class, 'next')]",
-            "//button[contains(@class, 'continue')]",
-            "//a[contains(text(), 'Next')]",
-            "//a[contains(text(), 'Continue')]"
-        ]
-        
         print("🔍 البحث عن زر الانتقال للصفحة التالية...")
         
-        for selector in next_button_selectors:
+        try:
+            # استدعاء واحد للصفحة في كل دورة انتظار بدلاً من انتظار كل محدد على حدة
+            matches = self.wait.until(
+                lambda driver: self.selectors.iter_matches(NEXT_BUTTON_SELECTORS, first_only=True)
+            )
+        except Exception as e:
+            print(f"⚠️ خطأ في زر التالي: {e}")
+            matches = []
+        
+        for match in matches:
             try:
-                next_button = self.wait.until(EC.element_to_be_clickable((By.XPATH, selector)))
-                if next_button.is_displayed():
-                    print(f"🎯 تم العثور على زر التالي: {next_button.text}")
+                print(f"🎯 تم العثور على زر التالي: {match['text']}")
+                
+                previous_url = self.driver.current_url
+                if self.click_element_multiple_ways(match['element']):
+                    print("✅ تم الانتقال للصفحة التالية")
+                    self.waits.after_action(previous_url)
+                    return True
                     
-                    if self.click_element_multiple_ways(next_button):
-                        print("✅ تم الانتقال للصفحة التالية")
-                        time.sleep(3)
-                        return True
-                        
             except Exception as e:
                 print(f"⚠️ خطأ في زر التالي: {e}")
                 continue
@@ -765,7 +623,7 @@ class VisaBookingBot:
     def handle_next_appointment_page(self):
         """معالجة صفحة الموعد التالية - نسخة محسنة من test_visible.py"""
         print("🔄 معالجة صفحة الموعد الجديدة...")
-        time.sleep(3)  # انتظار تحميل الصفحة
+        self.waits.page_ready('navigate')  # انتظار تحميل الصفحة
         
         # إعادة تطبيق مراقبة المواعيد على الصفحة الجديدة
         return self.monitor_appointments()
@@ -776,8 +634,8 @@ class VisaBookingBot:
             # انتظار حتى يكتمل تحميل الصفحة
             self.wait.until(lambda driver: driver.execute_script("return document.readyState") == "complete")
             
-            # انتظار إضافي للتأكد من تحميل العناصر الديناميكية
-            time.sleep(2)
+            # انتظار استقرار العناصر الديناميكية
+            self.waits.dom_quiet('settle')
             
             print("✅ تم تحميل الصفحة بالكامل")
             return True
@@ -790,25 +648,14 @@ class VisaBookingBot:
         """تحديث الصفحة إذا لزم الأمر"""
         try:
             # التحقق من وجود رسائل خطأ تتطلب تحديث الصفحة
-            error_indicators = [
-                "//div[contains(text(), 'Error')]",
-                "//div[contains(text(), 'خطأ')]",
-                "//div[contains(text(), 'Something went wrong')]",
-                "//div[contains(text(), 'حدث خطأ')]",
-                "//*[contains(@class, 'error')]",
-                "//*[contains(@class, 'alert-danger')]"
-            ]
-            
-            for indicator in error_indicators:
-                try:
-                    error_element = self.driver.find_element(By.XPATH, indicator)
-                    if error_element.is_displayed():
-                        print("🔄 تم اكتشاف خطأ - تحديث الصفحة...")
-                        self.driver.refresh()
-                        self.wait_for_page_load()
-                        return True
-                except:
-                    continue
+            error_match = self.selectors.first_match(
+                ERROR_INDICATOR_SELECTORS, first_only=True, require_enabled=False
+            )
+            if error_match:
+                print("🔄 تم اكتشاف خطأ - تحديث الصفحة...")
+                self.driver.refresh()
+                self.wait_for_page_load()
+                return True
             
             return False
             
@@ -856,9 +703,7 @@ class VisaBookingBot:
             elif method == "action_chains":
                 ActionChains(self.driver).move_to_element(element).click().perform()
             elif method == "scroll_and_click":
-                self.driver.execute_script("arguments[0].scrollIntoView(true);", element)
-                time.sleep(1)
-                element.click()
+                self._scroll_and_click(element)
             
             return True
             
@@ -875,41 +720,37 @@ class VisaBookingBot:
             if self.fill_appointment_form():
                 print("✅ تم ملء النموذج بنجاح")
                 
-                # انتظار التأكيد
-                time.sleep(5)
-                
-                # التحقق من نجاح الحجز
-                success_indicators = [
-                    "//div[contains(text(), 'Success')]",
-                    "//div[contains(text(), 'Confirmed')]",
-                    "//div[contains(text(), 'Thank you')]",
-                    "//div[contains(text(), 'Booked')]",
-                    "//div[contains(text(), 'نجح')]",
-                    "//div[contains(text(), 'تأكيد')]",
-                    "//div[contains(text(), 'شكراً')]",
-                    "//div[contains(text(), 'تم الحجز')]"
-                ]
-                
-                booking_confirmed = False
-                confirmation_message = ""
-                
-                for indicator in success_indicators:
+                with pipeline_metrics.span('confirmation', self.driver):
+                    # انتظار ظهور مؤشر التأكيد أو تغير الرابط لصفحة النجاح
+                    self.waits.any_of([
+                        lambda driver: self.selectors.first_match(
+                            BOOKING_CONFIRMATION_SELECTORS, first_only=True, require_enabled=False
+                        ),
+                        lambda driver: any(keyword in driver.current_url.lower()
+                                           for keyword in ['success', 'confirmation', 'thank', 'complete'])
+                    ], 'confirmation')
+                    
+                    # التحقق من نجاح الحجز
+                    booking_confirmed = False
+                    confirmation_message = ""
+                    
                     try:
-                        success_element = self.driver.find_element(By.XPATH, indicator)
-                        if success_element.is_displayed():
-                            confirmation_message = success_element.text
+                        success_match = self.selectors.first_match(
+                            BOOKING_CONFIRMATION_SELECTORS, first_only=True, require_enabled=False
+                        )
+                        if success_match:
+                            confirmation_message = success_match['text']
                             print(f"✅ تم تأكيد الحجز: {confirmation_message}")
                             booking_confirmed = True
-                            break
                     except:
-                        continue
-                
-                # التحقق من URL للتأكد من النجاح
-                current_url = self.driver.current_url
-                if not booking_confirmed and any(keyword in current_url.lower() for keyword in ['success', 'confirmation', 'thank', 'complete']):
-                    print("✅ تم تأكيد الحجز من خلال URL")
-                    booking_confirmed = True
-                    confirmation_message = f"تأكيد من URL: {current_url}"
+                        pass
+                    
+                    # التحقق من URL للتأكد من النجاح
+                    current_url = self.driver.current_url
+                    if not booking_confirmed and any(keyword in current_url.lower() for keyword in ['success', 'confirmation', 'thank', 'complete']):
+                        print("✅ تم تأكيد الحجز من خلال URL")
+                        booking_confirmed = True
+                        confirmation_message = f"تأكيد من URL: {current_url}"
                 
                 # إرسال الإشعارات في حالة نجاح الحجز
                 if booking_confirmed and NOTIFICATIONS_ENABLED:
@@ -934,6 +775,8 @@ class VisaBookingBot:
                             print("✅ تم إرسال إشعار الإيميل بنجاح")
                         if notification_results.get('telegram_sent'):
                             print("✅ تم إرسال إشعار تيليجرام بنجاح")
+                        if notification_results.get('email_queued') or notification_results.get('telegram_queued'):
+                            print("📥 تمت إضافة إشعارات الإيميل وتيليجرام إلى صندوق الإرسال")
                         if notification_results.get('logged'):
                             print("✅ تم تسجيل الحجز في قاعدة البيانات")
                         
@@ -963,16 +806,77 @@ class VisaBookingBot:
             print(f"❌ خطأ في حجز الموعد: {e}")
             return False
 
-def monitor_appointments():
-    """مراقبة المواعيد بشكل مستمر - نسخة محسنة مع فحص كل 5 ثوان ونظام إشعارات متقدم"""
-    global monitoring_active, user_data
+# فحص HTTP خفيف قبل المتصفح (0 لتشغيل المتصفح في كل دورة فحص)
+HTTP_PROBE = os.environ.get('HTTP_PROBE', '1') != '0'
+
+def create_browser_probe(key):
+    """إنشاء بوت مراقبة (بدون بيانات مستخدم) لهدف مشترك"""
+    city, visa_type = key
+    probe = VisaBookingBot({'preferred_city': city, 'visa_type': visa_type})
+    probe.setup_driver()
+    return probe
+
+def create_target_probe(key):
+    """مراقب الهدف المشترك الذي يستخدمه ObservationHub - طبقة HTTP تصعّد إلى المتصفح عند الحاجة"""
+    if not HTTP_PROBE:
+        return create_browser_probe(key)
+    http_probe = HttpProbe(
+        BLS_BASE_URL,
+        timeout=int(os.environ.get('HTTP_PROBE_TIMEOUT', '15')),
+        max_quiet=int(os.environ.get('HTTP_PROBE_MAX_QUIET', '300'))
+    )
+    return TieredProbe(http_probe, lambda: create_browser_probe(key))
+
+# مجدول واحد بعدد محدود من العمال يشغّل جميع مهام المراقبة والحجز
+job_scheduler = JobScheduler(
+    max_workers=int(os.environ.get('MONITOR_WORKERS', '8')),
+    group_limits={'booking': int(os.environ.get('MAX_CONCURRENT_BOOKINGS', '2'))}
+)
+
+# فاصل الفحص يتعلم أوقات ظهور المواعيد لكل مدينة ويبقى ضمن حدود CADENCE_*
+polling_cadence = cadence_from_env()
+
+def alert_slot_subscribers(key, snapshot, subscriber_ids):
+    """تنبيه كل الجلسات المشتركة في الهدف بظهور مواعيد (إيميل وتيليجرام ضمن حدود المعدل)"""
+    sessions = [session_registry.get(subscriber_id) for subscriber_id in subscriber_ids]
+    subscribers = [session.user_data for session in sessions if session is not None and session.is_active()]
+    event = {'city': key[0], 'visa_type': key[1], 'count': snapshot.get('count'), 'observed_at': snapshot.get('observed_at')}
+    notification_system.send_slot_alert(event, subscribers)
+    print(f"📣 جدولة تنبيه المواعيد لـ {len(subscribers)} مشترك في الهدف {key}")
+
+SLOT_ALERTS = NOTIFICATIONS_ENABLED and os.environ.get('SLOT_ALERTS', '1') != '0'
+
+# مراقب واحد لكل (مدينة، نوع فيزا) يخدم جميع الجلسات التي تنتظر نفس الهدف
+observation_hub = ObservationHub(
+    create_target_probe, job_scheduler, interval=5, cadence=polling_cadence,
+    on_available=alert_slot_subscribers if SLOT_ALERTS else None
+)
+
+# تبويب حجز احتياطي جاهز على صفحة المواعيد لعدد محدود من الجلسات (كل تبويب يحجز متصفحاً من المجمع)
+standby_manager = StandbyManager(
+    job_scheduler,
+    lambda session: VisaBookingBot(session.user_data, payload=session.booking_payload),
+    max_standby=int(os.environ.get('BOOKING_STANDBY_TABS', '1')),
+    refresh_interval=int(os.environ.get('BOOKING_STANDBY_REFRESH', '90')),
+    pool_factory=get_browser_pool
+)
+
+# عدد أخطاء الحجز المتتالية قبل إنهاء الجلسة
+MAX_CONSECUTIVE_ERRORS = 5
+
+def start_session_monitoring(session):
+    """جدولة مراقبة جلسة واحدة عبر المراقب المشترك - المتصفح الخاص يُستخدم فقط للحجز"""
+    user_data = session.user_data
     
-    bot = VisaBookingBot(user_data)
-    consecutive_errors = 0
-    max_consecutive_errors = 5
+    # تجهيز بيانات الحجز وتبويب الحجز الاحتياطي قبل ظهور أي موعد
+    standby_manager.arm(session)
     
-    # إعداد المتصفح مرة واحدة
-    bot.setup_driver()
+    # الاشتراك في مراقب الهدف المشترك بدلاً من تشغيل متصفح خاص للفحص
+    key = ObservationHub.make_key(user_data.get('preferred_city'), user_data.get('visa_type'))
+    subscription = observation_hub.subscribe(
+        key, session.session_id, lambda snapshot: on_target_snapshot(session, snapshot)
+    )
+    session.add_stop_callback(subscription.close)
     
     # إرسال إشعار بدء المراقبة
     if NOTIFICATIONS_ENABLED:
@@ -982,84 +886,81 @@ def monitor_appointments():
 👤 المستخدم: {user_data.get('full_name', 'غير محدد')}
 📧 الإيميل: {user_data.get('email', 'غير محدد')}
 🕐 وقت البدء: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-⚡ تردد الفحص: كل 5 ثوان
+⚡ تردد الفحص: {polling_cadence.describe()}
             """
-            bot.send_whatsapp_notification(start_message)
+            VisaBookingBot(user_data).send_whatsapp_notification(start_message)
             print("✅ تم إرسال إشعار بدء المراقبة")
         except Exception as e:
             print(f"⚠️ خطأ في إرسال إشعار البدء: {e}")
+
+def on_target_snapshot(session, snapshot):
+    """استقبال لقطة من المراقب المشترك وجدولة مهمة حجز عند توفر مواعيد"""
+    if not session.is_active():
+        return
+    session.record_check()
     
+    if not snapshot.get('available'):
+        return
+    if session.booking_job and not session.booking_job.done:
+        return
+    
+    print(f"🕐 {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - المراقب رصد {snapshot.get('count')} موعد - جدولة الحجز للجلسة {session.session_id}...")
+    session.booking_job = job_scheduler.submit(Job(
+        f"book-{session.session_id}", lambda token: book_for_session(session, token),
+        priority=10, group='booking'
+    ))
+
+def book_for_session(session, token):
+    """مهمة حجز لمرة واحدة: متصفح خاص من المجمع ثم إعادته فوراً"""
+    if token.cancelled or not session.is_active():
+        return JOB_DONE
+    
+    user_data = session.user_data
+    # التبويب الاحتياطي الجاهز على صفحة المواعيد إن وُجد، وإلا متصفح من المجمع
+    bot = standby_manager.take(session.session_id)
+    standby = bot is not None
+    if not standby:
+        bot = VisaBookingBot(user_data, payload=session.booking_payload)
     try:
-        while monitoring_active:
-            try:
-                print(f"🕐 {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - فحص المواعيد...")
-                
-                # فحص المواعيد
-                appointment_found = bot.check_appointments()
-                
-                if appointment_found:
-                    print("🎉 تم العثور على موعد وحجزه بنجاح!")
-                    
-                    # إرسال إشعار واتساب فوري
-                    success_message = f"""
+        if not standby:
+            bot.setup_driver()
+        try:
+            appointment_found = bot.book_on_standby() if standby else bot.check_appointments()
+        finally:
+            bot.release_driver()
+            print("🔒 تمت إعادة المتصفح إلى المجمع")
+    except Exception as e:
+        session.consecutive_errors += 1
+        print(f"❌ خطأ في المراقبة (المحاولة {session.consecutive_errors}): {e}")
+        
+        if session.consecutive_errors >= MAX_CONSECUTIVE_ERRORS:
+            print(f"❌ تم الوصول للحد الأقصى من الأخطاء المتتالية ({MAX_CONSECUTIVE_ERRORS})")
+            bot.send_whatsapp_notification(f"❌ توقفت مراقبة المواعيد بسبب أخطاء متتالية: {str(e)}")
+            session.finish(STATUS_FAILED, e)
+        return JOB_DONE
+    
+    # إعادة تعيين عداد الأخطاء عند النجاح
+    session.consecutive_errors = 0
+    
+    if appointment_found:
+        print("🎉 تم العثور على موعد وحجزه بنجاح!")
+        
+        # إرسال إشعار واتساب فوري
+        success_message = f"""
 🎉 نجح حجز موعد فيزا إسبانيا!
 👤 الاسم: {user_data.get('full_name', 'غير محدد')}
 📅 وقت الحجز: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
 ✅ تم إرسال تأكيد مفصل عبر الإيميل والتيليجرام
 📧 تحقق من بريدك الإلكتروني للحصول على التفاصيل الكاملة
-                    """
-                    bot.send_whatsapp_notification(success_message)
-                    
-                    # إيقاف المراقبة بعد النجاح
-                    monitoring_active = False
-                    break
-                
-                # إعادة تعيين عداد الأخطاء عند النجاح
-                consecutive_errors = 0
-                
-                # انتظار 5 ثوان بدلاً من 30 دقيقة للمراقبة السريعة
-                print("⏳ انتظار 5 ثوان قبل الفحص التالي...")
-                for i in range(5):
-                    if not monitoring_active:
-                        break
-                    time.sleep(1)
-                
-            except Exception as e:
-                consecutive_errors += 1
-                print(f"❌ خطأ في المراقبة (المحاولة {consecutive_errors}): {e}")
-                
-                if consecutive_errors >= max_consecutive_errors:
-                    print(f"❌ تم الوصول للحد الأقصى من الأخطاء المتتالية ({max_consecutive_errors})")
-                    bot.send_whatsapp_notification(f"❌ توقفت مراقبة المواعيد بسبب أخطاء متتالية: {str(e)}")
-                    break
-                
-                # انتظار أطول عند حدوث خطأ
-                print("⏳ انتظار 30 ثانية بسبب الخطأ...")
-                for i in range(30):
-                    if not monitoring_active:
-                        break
-                    time.sleep(1)
-                
-                # إعادة إعداد المتصفح عند حدوث أخطاء متكررة
-                if consecutive_errors >= 3:
-                    print("🔄 إعادة إعداد المتصفح...")
-                    try:
-                        if bot.driver:
-                            bot.driver.quit()
-                    except:
-                        pass
-                    bot.setup_driver()
-                    
-    except KeyboardInterrupt:
-        print("⏹️ تم إيقاف المراقبة بواسطة المستخدم")
-    finally:
-        monitoring_active = False
-        if bot.driver:
-            try:
-                bot.driver.quit()
-                print("🔒 تم إغلاق المتصفح")
-            except:
-                pass
+        """
+        bot.send_whatsapp_notification(success_message)
+        
+        # إيقاف المراقبة بعد النجاح
+        session.finish(STATUS_BOOKED)
+    elif standby:
+        # إعادة تجهيز تبويب احتياطي جديد للفرصة التالية
+        standby_manager.arm(session)
+    return JOB_DONE
 
 @app.route('/')
 def index():
@@ -1068,9 +969,7 @@ def index():
 
 @app.route('/start_monitoring', methods=['POST'])
 def start_monitoring():
-    """بدء مراقبة المواعيد"""
-    global monitoring_active, user_data, monitoring_thread
-    
+    """بدء مراقبة المواعيد لجلسة جديدة"""
     # إنشاء معرف جلسة فريد
     session_id = request.form.get('session_id') or secrets.token_hex(8)
     
@@ -1083,7 +982,8 @@ def start_monitoring():
         'email': request.form.get('email'),
         'visa_type': request.form.get('visa_type'),
         'preferred_city': request.form.get('city'),
-        'whatsapp_number': request.form.get('whatsapp_number') or request.form.get('phone')
+        'whatsapp_number': request.form.get('whatsapp_number') or request.form.get('phone'),
+        'telegram_chat_id': request.form.get('telegram_chat_id')
     }
     
     # حفظ البيانات في قاعدة البيانات
@@ -1096,42 +996,120 @@ def start_monitoring():
     with open('user_data.json', 'w', encoding='utf-8') as f:
         json.dump(user_data, f, ensure_ascii=False, indent=2)
     
-    if not monitoring_active:
-        monitoring_active = True
-        monitoring_thread = threading.Thread(target=monitor_appointments)
-        monitoring_thread.daemon = True
-        monitoring_thread.start()
-        
+    try:
+        session, created = session_registry.start(session_id, user_data, start_session_monitoring)
+    except RuntimeError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 503
+    
+    if created:
         # إرسال إشعار بدء المراقبة
         bot = VisaBookingBot(user_data)
-        bot.send_whatsapp_notification("🚀 تم بدء مراقبة مواعيد فيزا إسبانيا. سيتم فحص المواعيد كل 30 دقيقة.")
+        bot.send_whatsapp_notification(f"🚀 تم بدء مراقبة مواعيد فيزا إسبانيا. تردد الفحص: {polling_cadence.describe()}.")
         
-        return jsonify({'status': 'success', 'message': 'تم بدء المراقبة بنجاح!'})
+        return jsonify({'status': 'success', 'message': 'تم بدء المراقبة بنجاح!', 'session_id': session_id})
     else:
-        return jsonify({'status': 'info', 'message': 'المراقبة تعمل بالفعل!'})
+        return jsonify({'status': 'info', 'message': 'المراقبة تعمل بالفعل!', 'session_id': session_id})
 
 @app.route('/stop_monitoring', methods=['POST'])
 def stop_monitoring():
-    """إيقاف مراقبة المواعيد"""
-    global monitoring_active
+    """إيقاف مراقبة المواعيد لجلسة محددة"""
+    session_id = request.form.get('session_id') or request.args.get('session_id')
+    if not session_id:
+        return jsonify({'status': 'error', 'message': 'معرف الجلسة مطلوب'}), 400
     
-    monitoring_active = False
+    session = session_registry.stop(session_id)
+    if not session:
+        return jsonify({'status': 'error', 'message': 'الجلسة غير موجودة'}), 404
     
     # إرسال إشعار إيقاف المراقبة
-    if user_data:
-        bot = VisaBookingBot(user_data)
-        bot.send_whatsapp_notification("⏹️ تم إيقاف مراقبة مواعيد فيزا إسبانيا.")
+    bot = VisaBookingBot(session.user_data)
+    bot.send_whatsapp_notification("⏹️ تم إيقاف مراقبة مواعيد فيزا إسبانيا.")
     
     return jsonify({'status': 'success', 'message': 'تم إيقاف المراقبة!'})
 
 @app.route('/status')
 def get_status():
-    """الحصول على حالة المراقبة"""
+    """الحصول على حالة المراقبة لجلسة محددة أو ملخص جميع الجلسات"""
+    session_id = request.args.get('session_id')
+    if session_id:
+        session = session_registry.get(session_id)
+        if not session:
+            return jsonify({'monitoring_active': False, 'status': 'unknown', 'last_check': '-'}), 404
+        status = session.to_dict()
+        status['last_check'] = status['last_check'] or '-'
+        return jsonify(status)
+    
     return jsonify({
-        'monitoring_active': monitoring_active,
+        'monitoring_active': session_registry.active_count() > 0,
+        'active_sessions': session_registry.active_count(),
         'last_check': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     })
 
+@app.route('/api/startup_timings')
+def get_startup_timings():
+    """أزمنة مراحل تشغيل المتصفح وحالة مجمع المتصفحات"""
+    return jsonify({
+        'startup': startup_timings.summary(),
+        'browser_pool': get_browser_pool().snapshot(),
+        'observers': observation_hub.stats(),
+        'scheduler': job_scheduler.stats(),
+        'cadence': polling_cadence.stats(),
+        'standby': standby_manager.stats(),
+        'database': storage.stats(),
+        'write_behind': notification_system.write_stats() if NOTIFICATIONS_ENABLED else None,
+        'smtp': notification_system.smtp_pool.stats() if NOTIFICATIONS_ENABLED else None,
+        'notification_dispatch': notification_system.dispatcher.stats() if NOTIFICATIONS_ENABLED else None,
+        'notification_outbox': notification_system.outbox_stats() if NOTIFICATIONS_ENABLED else None,
+        'slot_alerts': notification_system.fanout.stats() if NOTIFICATIONS_ENABLED else None
+    })
+
+@app.route('/api/notification_outbox')
+def get_notification_outbox():
+    """حالة صندوق الإشعارات والرسائل الميتة (limit اختياري)"""
+    if not NOTIFICATIONS_ENABLED or notification_system.outbox is None:
+        return jsonify({'enabled': False})
+    return jsonify({
+        'stats': notification_system.outbox_stats(),
+        'dead_letters': storage.outbox.dead_letters(request.args.get('limit', 50, type=int))
+    })
+
+@app.route('/api/notification_outbox/requeue', methods=['POST'])
+def requeue_dead_notifications():
+    """إعادة الرسائل الميتة (أو رسالة واحدة بـ id) إلى صندوق الإشعارات"""
+    if not NOTIFICATIONS_ENABLED or notification_system.outbox is None:
+        return jsonify({'status': 'error', 'message': 'صندوق الإشعارات غير مفعل'})
+    requeued = storage.outbox.requeue_dead((request.get_json(silent=True) or {}).get('id'))
+    notification_system.outbox.wake()
+    return jsonify({'status': 'success', 'requeued': requeued})
+
+@app.route('/api/page_changes')
+def get_page_changes():
+    """سجل تغيرات صفحة المواعيد لكل هدف مع نتيجة الفحص بعد كل تغير (target و limit اختياريان)"""
+    return jsonify({
+        'summary': page_changes.summary(),
+        'events': page_changes.history(request.args.get('target'), request.args.get('limit', 100, type=int))
+    })
+
+@app.route('/api/page_models')
+def get_page_models():
+    """إحصاءات ذاكرة نماذج الصفحات (الإصابة والإخفاق لكل دور)"""
+    return jsonify(page_model_cache.stats())
+
+@app.route('/metrics')
+def get_metrics():
+    """مدرجات زمن مراحل الفحص والحجز بصيغة Prometheus"""
+    return Response(pipeline_metrics.prometheus_text(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/metrics')
+def get_pipeline_metrics():
+    """ملخص زمن كل مرحلة مع القياسات المحفوظة لآخر دقائق (phase و minutes اختياريان)"""
+    phase = request.args.get('phase')
+    minutes = request.args.get('minutes', 60, type=int)
+    return jsonify({
+        'phases': pipeline_metrics.histograms(),
+        'series': pipeline_metrics.store.query(phase, minutes) if pipeline_metrics.store else []
+    })
+
 @app.route('/api/dashboard_data')
 def get_dashboard_data():
     """Get dashboard data from notification system database"""
@@ -0,0 +1,486 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+قياس أداء البوت على خادم الإعادة المحلي وحفظ النتائج كخط أساس للمقارنة بين الإصدارات
+Benchmark suite: runs check_appointments, fill_appointment_form, _submit_form and the
+popup handlers against local replay fixtures and reports p50/p95 wall time, WebDriver
+command counts, Python allocations and Chrome RSS per cycle as JSON baselines
+
+الاستخدام:
+    python benchmark.py run --iterations 20 --out benchmarks/baseline.json
+    python benchmark.py compare benchmarks/baseline.json benchmarks/current.json --threshold 10
+    python benchmark.py smtp --messages 50 --latency-ms 20 --connect-ms 150
+    python benchmark.py fanout --subscribers 200 --email-rate 50 --telegram-rate 25
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import smtplib
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from email.mime.text import MIMEText
+
+from browser_pool import BrowserPool, launch_chrome
+from pipeline_metrics import pipeline_metrics, count_commands
+from replay_server import ReplayServer, ReplayScenario, ReplaySMTPServer
+from smtp_pool import SMTPPool
+from fanout import FanOutChannel, FanOutEngine
+
+# بيانات مستخدم ثابتة لملء النموذج
+BENCHMARK_USER = {
+    'full_name': 'Benchmark User',
+    'email': 'benchmark@example.com',
+    'phone_number': '+212600000000',
+    'passport_number': 'BK1234567',
+    'birth_date': '1990-01-01',
+    'visa_type': 'tourism',
+    'preferred_city': 'tangier'
+}
+
+# عدد زيارات صفحة المواعيد في السيناريو قبل أن تصبح المواعيد متاحة
+AVAILABLE_VISITS = 3
+
+# المقاييس المقارنة بين خطوط الأساس (الأقل أفضل في جميعها)
+COMPARED_METRICS = ('wall_p50_ms', 'wall_p95_ms', 'commands_mean', 'alloc_peak_kb_mean', 'chrome_rss_mb_max')
+
+
+def _descendants(pid):
+    """معرفات العمليات الفرعية لعملية (من /proc - لينكس فقط)"""
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat', 'r') as f:
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    result, stack = [], [pid]
+    while stack:
+        current = stack.pop()
+        for child in children.get(current, []):
+            result.append(child)
+            stack.append(child)
+    return result
+
+
+def chrome_rss_mb(driver):
+    """مجموع الذاكرة المقيمة لعمليات Chrome التابعة لـ chromedriver أو None إن تعذر القياس"""
+    try:
+        root = driver.service.process.pid
+    except AttributeError:
+        return None
+    if not os.path.isdir('/proc'):
+        return None
+    total_kb = 0
+    for pid in _descendants(root):
+        try:
+            with open(f'/proc/{pid}/status', 'r') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total_kb += int(line.split()[1])
+                        break
+        except OSError:
+            continue
+    return round(total_kb / 1024, 1)
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class BenchmarkRunner:
+    """تشغيل كل حالة قياس عدة دورات على متصفح واحد وجمع مقاييس كل دورة"""
+
+    def __init__(self, server, bot, verbose=False):
+        self.server = server
+        self.bot = bot
+        self.verbose = verbose
+        self.counter = count_commands(bot.driver)
+
+    def url(self, path):
+        return self.server.base_url.rstrip('/') + path
+
+    def _quiet(self):
+        return contextlib.nullcontext() if self.verbose else contextlib.redirect_stdout(io.StringIO())
+
+    # تجهيز كل حالة (خارج القياس) ثم الدالة المقاسة
+    def setup_check_available(self):
+        self.server.scenario.reset('/appointment', AVAILABLE_VISITS)
+
+    def setup_check_empty(self):
+        self.server.scenario.reset('/appointment', 0)
+
+    def setup_form(self):
+        self.bot.driver.get(self.url('/booking/form?slot=benchmark'))
+        self.bot.waits.page_ready('form_ready')
+
+    def setup_filled_form(self):
+        self.setup_form()
+        for name, value in (('full_name', BENCHMARK_USER['full_name']), ('email', BENCHMARK_USER['email'])):
+            self.bot.driver.execute_script(
+                "var el = document.getElementsByName(arguments[0])[0]; if (el) { el.value = arguments[1]; }",
+                name, value
+            )
+
+    def setup_home(self):
+        self.bot.driver.get(self.url('/'))
+        self.bot.waits.page_ready('navigate')
+
+    def popup_handlers(self):
+        self.bot.close_warning_popup()
+        return self.bot.check_and_close_warning_window()
+
+    def submit_only(self):
+        # يستدعي fill_appointment_form داخلياً _submit_form، لذا يُقاس الإرسال وحده هنا
+        return self.bot._submit_form()
+
+    def fill_only(self):
+        # fill_appointment_form يرسل النموذج في نهايته - نقيس ملء الحقول فقط
+        self.bot._submit_form = lambda: True
+        try:
+            return self.bot.fill_appointment_form()
+        finally:
+            del self.bot._submit_form
+
+    def cases(self):
+        return {
+            'check_appointments_book': (self.setup_check_available, self.bot.check_appointments),
+            'check_appointments_empty': (self.setup_check_empty, self.bot.check_appointments),
+            'fill_appointment_form': (self.setup_form, self.fill_only),
+            'submit_form': (self.setup_filled_form, self.submit_only),
+            'popup_handlers': (self.setup_home, self.popup_handlers)
+        }
+
+    def run_case(self, name, setup, target, iterations, warmup):
+        cycles = []
+        pipeline_metrics.reset()
+        for i in range(warmup + iterations):
+            with self._quiet():
+                setup()
+            tracemalloc.reset_peak()
+            alloc_before, _ = tracemalloc.get_traced_memory()
+            commands_before = self.counter.count
+            started = time.perf_counter()
+            with self._quiet():
+                result = target()
+            wall = time.perf_counter() - started
+            alloc_after, alloc_peak = tracemalloc.get_traced_memory()
+            if i < warmup:
+                continue
+            cycles.append({
+                'wall_ms': round(wall * 1000, 1),
+                'commands': self.counter.count - commands_before,
+                'alloc_net_kb': round((alloc_after - alloc_before) / 1024, 1),
+                'alloc_peak_kb': round((alloc_peak - alloc_before) / 1024, 1),
+                'chrome_rss_mb': chrome_rss_mb(self.bot.driver),
+                'result': bool(result)
+            })
+        return summarize(name, cycles)
+
+
+def summarize(name, cycles):
+    walls = [c['wall_ms'] for c in cycles]
+    rss = [c['chrome_rss_mb'] for c in cycles if c['chrome_rss_mb'] is not None]
+    summary = {
+        'case': name,
+        'iterations': len(cycles),
+        'wall_p50_ms': _percentile(walls, 0.5),
+        'wall_p95_ms': _percentile(walls, 0.95),
+        'wall_mean_ms': round(sum(walls) / len(walls), 1) if walls else None,
+        'commands_mean': round(sum(c['commands'] for c in cycles) / len(cycles), 1) if cycles else None,
+        'alloc_peak_kb_mean': round(sum(c['alloc_peak_kb'] for c in cycles) / len(cycles), 1) if cycles else None,
+        'alloc_net_kb_mean': round(sum(c['alloc_net_kb'] for c in cycles) / len(cycles), 1) if cycles else None,
+        'chrome_rss_mb_max': max(rss) if rss else None,
+        'success_rate': round(sum(c['result'] for c in cycles) / len(cycles), 2) if cycles else None,
+        'phases': pipeline_metrics.histograms(),
+        'cycles': cycles
+    }
+    return summary
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=10
+        ).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def run_benchmarks(iterations=10, warmup=1, latency_ms=0, cases=None, headless=True, verbose=False):
+    """تشغيل حالات القياس وإرجاع قاموس النتائج
+
+    tracemalloc يعمل طوال القياس فيضيف زمناً ثابتاً لكل دورة - المقارنة صحيحة بين نتائج هذا السكربت فقط
+    """
+    # القياس لا يكتب في مخزن السلاسل الزمنية الخاص بالتشغيل الفعلي
+    pipeline_metrics.store = None
+    tracemalloc.start()
+
+    from app import VisaBookingBot
+
+    server = ReplayServer(ReplayScenario(latency_ms=latency_ms))
+    server.scenario.jitter_ms = 0
+    server.start()
+    pool = BrowserPool(
+        size=1, warm_url=server.base_url, health_check_interval=3600,
+        driver_factory=lambda timing=None: launch_chrome(headless=headless, timing=timing)
+    ).start()
+    bot = VisaBookingBot(BENCHMARK_USER, base_url=server.base_url)
+    bot.lease = pool.acquire()
+    bot._attach_driver()
+
+    try:
+        runner = BenchmarkRunner(server, bot, verbose)
+        results = []
+        for name, (setup, target) in runner.cases().items():
+            if cases and name not in cases:
+                continue
+            print(f"⏱️ قياس {name} ({iterations} دورة)...")
+            summary = runner.run_case(name, setup, target, iterations, warmup)
+            print(f"   p50={summary['wall_p50_ms']}ms p95={summary['wall_p95_ms']}ms "
+                  f"أوامر={summary['commands_mean']} ذاكرة Chrome={summary['chrome_rss_mb_max']}MB")
+            results.append(summary)
+        browser_version = bot.driver.capabilities.get('browserVersion')
+    finally:
+        bot.release_driver()
+        pool.shutdown()
+        server.shutdown()
+        tracemalloc.stop()
+
+    return {
+        'commit': _git_commit(),
+        'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'browser_version': browser_version,
+        'latency_ms': latency_ms,
+        'iterations': iterations,
+        'warmup': warmup,
+        'cases': {summary['case']: summary for summary in results}
+    }
+
+
+def _benchmark_email(i):
+    msg = MIMEText(f"Benchmark message {i}", 'plain', 'utf-8')
+    msg['From'] = 'benchmark@example.com'
+    msg['To'] = BENCHMARK_USER['email']
+    msg['Subject'] = f"Benchmark {i}"
+    return msg
+
+
+def run_smtp_benchmark(messages=50, latency_ms=20, connect_ms=150, pool_size=2):
+    """مقارنة اتصال SMTP جديد لكل رسالة بمجمع الاتصالات على خادم SMTP المحلي
+
+    connect_ms يحاكي زمن الاتصال ومصافحة TLS، و latency_ms زمن كل أمر SMTP
+    """
+    emails = [_benchmark_email(i) for i in range(messages)]
+    cases = {}
+
+    def measure(name, send):
+        connections = server.connections
+        started = time.perf_counter()
+        failed = send()
+        wall = time.perf_counter() - started
+        cases[name] = {
+            'case': name,
+            'messages': messages,
+            'failed': failed,
+            'wall_ms': round(wall * 1000, 1),
+            'messages_per_second': round(messages / wall, 1) if wall else None,
+            'connections': server.connections - connections
+        }
+        print(f"   {name}: {cases[name]['wall_ms']}ms ({cases[name]['messages_per_second']} رسالة/ث، "
+              f"{cases[name]['connections']} اتصال)")
+
+    def connect_per_message():
+        for msg in emails:
+            smtp = smtplib.SMTP(server.host, server.port, timeout=30)
+            smtp.login('benchmark', 'secret')
+            smtp.send_message(msg)
+            smtp.quit()
+        return 0
+
+    def pooled(size, batch):
+        pool = SMTPPool(server.host, server.port, 'benchmark', 'secret', size=size, use_starttls=False)
+        try:
+            if batch:
+                return sum(1 for error in pool.send_many(emails) if error)
+            for msg in emails:
+                pool.send(msg)
+            return 0
+        finally:
+            pool.close()
+
+    print(f"📮 قياس إرسال {messages} رسالة (اتصال {connect_ms}ms، أمر {latency_ms}ms)...")
+    with ReplaySMTPServer(latency_ms=latency_ms, connect_ms=connect_ms) as server:
+        measure('connect_per_message', connect_per_message)
+        measure('pooled_serial', lambda: pooled(1, batch=False))
+        measure(f'pooled_batch_{pool_size}', lambda: pooled(pool_size, batch=True))
+
+    return {
+        'commit': _git_commit(),
+        'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'latency_ms': latency_ms,
+        'connect_ms': connect_ms,
+        'pool_size': pool_size,
+        'cases': cases
+    }
+
+
+def run_fanout_benchmark(subscribers=200, email_rate=50, telegram_rate=25, latency_ms=5, pool_size=2, linger_ms=250):
+    """توزيع تنبيه واحد على subscribers مشترك: الإيميل عبر مجمع SMTP على الخادم المحلي وتيليجرام
+    بإرسال محاكى يستغرق latency_ms - يقارن زمن التفريغ بالحد الأدنى الذي يفرضه معدل كل مزود
+    """
+    users = [{'email': f"user{i}@example.com", 'telegram_chat_id': str(100000 + i)} for i in range(subscribers)]
+    event = {'city': 'tangier', 'visa_type': 'study', 'count': 3}
+
+    def telegram_send(event, subscriber):
+        time.sleep(latency_ms / 1000)
+
+    print(f"📣 قياس توزيع تنبيه على {subscribers} مشترك (إيميل {email_rate}/ث، تيليجرام {telegram_rate}/ث)...")
+    with ReplaySMTPServer(latency_ms=latency_ms) as server:
+        pool = SMTPPool(server.host, server.port, 'benchmark', 'secret', size=pool_size, use_starttls=False)
+        engine = FanOutEngine([
+            FanOutChannel('email', lambda user: user['email'], rate=email_rate, burst=email_rate,
+                          linger=linger_ms / 1000,
+                          send_batch=lambda event, users: pool.send_many([_benchmark_email(i) for i in range(len(users))])),
+            FanOutChannel('telegram', lambda user: user['telegram_chat_id'], send=telegram_send,
+                          rate=telegram_rate, burst=telegram_rate, linger=linger_ms / 1000)
+        ])
+        try:
+            job = engine.fan_out(event, users)
+            job.wait()
+            report = job.report()
+            stats = engine.stats()
+        finally:
+            engine.shutdown()
+            pool.close()
+
+    floor_s = max(0.0, (subscribers - email_rate) / email_rate, (subscribers - telegram_rate) / telegram_rate)
+    print(f"   زمن التفريغ {report['drain_s']}ث (الحد الأدنى حسب المعدل {floor_s:.2f}ث)، "
+          f"{report['throughput_per_s']} رسالة/ث")
+    for name, channel in stats['channels'].items():
+        print(f"   {name}: {channel['sent']} مرسلة، {channel['failed']} فاشلة، {channel['batches']} دفعة، "
+              f"{channel['throughput_per_s']} رسالة/ث")
+
+    return {
+        'commit': _git_commit(),
+        'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'subscribers': subscribers,
+        'email_rate': email_rate,
+        'telegram_rate': telegram_rate,
+        'latency_ms': latency_ms,
+        'linger_ms': linger_ms,
+        'rate_floor_s': round(floor_s, 3),
+        'fanout': report,
+        'channels': stats['channels']
+    }
+
+
+def compare(baseline, current, threshold=10.0):
+    """مقارنة نتيجتين - يعيد قائمة التراجعات التي تتجاوز threshold بالمئة"""
+    regressions = []
+    print(f"{'الحالة':<28}{'المقياس':<22}{'الأساس':>12}{'الحالي':>12}{'التغير':>10}")
+    for name, current_case in current['cases'].items():
+        base_case = baseline['cases'].get(name)
+        if not base_case:
+            print(f"{name:<28}(حالة جديدة)")
+            continue
+        for metric in COMPARED_METRICS:
+            old, new = base_case.get(metric), current_case.get(metric)
+            if old is None or new is None:
+                continue
+            change = ((new - old) / old * 100) if old else 0.0
+            flag = ' ⚠️' if change > threshold else ''
+            print(f"{name:<28}{metric:<22}{old:>12}{new:>12}{change:>9.1f}%{flag}")
+            if change > threshold:
+                regressions.append({'case': name, 'metric': metric, 'baseline': old, 'current': new,
+                                    'change_percent': round(change, 1)})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='قياس أداء بوت حجز فيزا إسبانيا على خادم الإعادة المحلي')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    run = sub.add_parser('run', help='تشغيل القياس وحفظ النتائج')
+    run.add_argument('--iterations', type=int, default=10)
+    run.add_argument('--warmup', type=int, default=1)
+    run.add_argument('--latency-ms', type=float, default=0)
+    run.add_argument('--case', action='append', dest='cases')
+    run.add_argument('--visible', action='store_true', help='تشغيل المتصفح بواجهة')
+    run.add_argument('--verbose', action='store_true', help='عرض رسائل البوت أثناء القياس')
+    run.add_argument('--out', default=None)
+
+    cmp_parser = sub.add_parser('compare', help='مقارنة خط أساس بنتيجة حالية')
+    cmp_parser.add_argument('baseline')
+    cmp_parser.add_argument('current')
+    cmp_parser.add_argument('--threshold', type=float, default=10.0)
+
+    smtp = sub.add_parser('smtp', help='قياس إرسال الإيميلات على خادم SMTP محلي')
+    smtp.add_argument('--messages', type=int, default=50)
+    smtp.add_argument('--latency-ms', type=float, default=20)
+    smtp.add_argument('--connect-ms', type=float, default=150)
+    smtp.add_argument('--pool-size', type=int, default=2)
+    smtp.add_argument('--out', default=None)
+
+    fanout = sub.add_parser('fanout', help='قياس توزيع تنبيه على عدد كبير من المشتركين ضمن حدود المعدل')
+    fanout.add_argument('--subscribers', type=int, default=200)
+    fanout.add_argument('--email-rate', type=float, default=50)
+    fanout.add_argument('--telegram-rate', type=float, default=25)
+    fanout.add_argument('--latency-ms', type=float, default=5)
+    fanout.add_argument('--pool-size', type=int, default=2)
+    fanout.add_argument('--linger-ms', type=float, default=250)
+    fanout.add_argument('--out', default=None)
+    args = parser.parse_args()
+
+    if args.command == 'compare':
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        with open(args.current, 'r', encoding='utf-8') as f:
+            current = json.load(f)
+        regressions = compare(baseline, current, args.threshold)
+        if regressions:
+            print(f"❌ {len(regressions)} تراجع في الأداء يتجاوز {args.threshold}%")
+            sys.exit(1)
+        print("✅ لا يوجد تراجع في الأداء")
+        return
+
+    if args.command in ('smtp', 'fanout'):
+        if args.command == 'smtp':
+            report = run_smtp_benchmark(args.messages, args.latency_ms, args.connect_ms, args.pool_size)
+        else:
+            report = run_fanout_benchmark(args.subscribers, args.email_rate, args.telegram_rate,
+                                          args.latency_ms, args.pool_size, args.linger_ms)
+        if args.out:
+            os.makedirs(os.path.dirname(args.out) or '.', exist_ok=True)
+            with open(args.out, 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            print(f"💾 تم حفظ النتائج في {args.out}")
+        return
+
+    report = run_benchmarks(args.iterations, args.warmup, args.latency_ms, args.cases,
+                            headless=not args.visible, verbose=args.verbose)
+    out = args.out or os.path.join('benchmarks', f"{report['commit'] or 'local'}.json")
+    os.makedirs(os.path.dirname(out) or '.', exist_ok=True)
+    with open(out, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"💾 تم حفظ النتائج في {out}")
+
+
+if __name__ == '__main__':
+    main()
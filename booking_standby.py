@@ -0,0 +1,214 @@
+"""
+حالة حجز مُجهزة مسبقاً: بيانات النموذج المُطبّعة والمُسلسلة وتبويب حجز احتياطي جاهز لكل جلسة
+Pre-armed booking state - normalized, pre-serialized form payload plus a hot-standby
+browser tab parked on the booking flow with the fill function already installed
+"""
+
+import json
+import re
+import threading
+import time
+from datetime import datetime
+from job_scheduler import Job, ExponentialBackoff
+from page_watcher import add_document_script
+from selector_engine import FORM_FIELD_ALIASES, BULK_FILL_INSTALL
+
+# أولوية تحديث التبويبات الاحتياطية أقل من المراقبة والحجز
+STANDBY_PRIORITY = 1
+
+# صيغ تاريخ الميلاد المقبولة - تُحوَّل كلها إلى YYYY-MM-DD
+_DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%Y/%m/%d', '%d.%m.%Y')
+
+
+def _normalize_date(value):
+    for fmt in _DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).strftime('%Y-%m-%d')
+        except ValueError:
+            continue
+    return value
+
+
+def normalize_field(name, value):
+    """تطبيع قيمة حقل واحد بالشكل الذي يقبله نموذج الموقع"""
+    value = re.sub(r'\s+', ' ', str(value or '')).strip()
+    if not value:
+        return ''
+    if name == 'email':
+        return value.lower()
+    if name == 'phone_number':
+        return ('+' if value.startswith('+') else '') + re.sub(r'\D', '', value)
+    if name == 'passport_number':
+        return value.replace(' ', '').upper()
+    if name == 'birth_date':
+        return _normalize_date(value)
+    return value
+
+
+class BookingPayload:
+    """قيم حقول النموذج مُطبّعة ومُسلسلة مرة واحدة عند بدء الجلسة بدلاً من لحظة ظهور الموعد"""
+
+    def __init__(self, user_data):
+        defaults = {'nationality': 'Morocco'}
+        self.values = {
+            name: normalize_field(name, user_data.get(name) or defaults.get(name, ''))
+            for name in FORM_FIELD_ALIASES
+        }
+        self.fields = [
+            {'name': name, 'aliases': aliases, 'value': self.values[name]}
+            for name, aliases in FORM_FIELD_ALIASES.items() if self.values[name]
+        ]
+        # النص الجاهز الذي يُرسل لدالة الملء داخل الصفحة
+        self.serialized = json.dumps(self.fields, ensure_ascii=False)
+
+    def form_fields(self):
+        """الحقول بصيغة fill_appointment_form القديمة (للبحث حقلاً بحقل)"""
+        return {field['name']: {'selectors': field['aliases'], 'value': field['value']} for field in self.fields}
+
+
+def install_fill_function(driver):
+    """تثبيت دالة الملء في التبويب الحالي وفي كل صفحة يفتحها لاحقاً - يعيد True عند النجاح"""
+    try:
+        # Chrome يعيد تشغيلها في كل مستند جديد لهذا التبويب (صفحة النموذج بعد النقر على الموعد)
+        # - تُسجل مرة واحدة لكل تبويب مهما تكرر تجهيز التبويب الاحتياطي
+        add_document_script(driver, 'bulk_fill', BULK_FILL_INSTALL)
+    except Exception as e:
+        print(f"⚠️ تعذر تثبيت دالة الملء للصفحات القادمة: {e}")
+        return False
+    driver.execute_script(BULK_FILL_INSTALL)
+    return True
+
+
+class BookingStandby:
+    """تبويب حجز احتياطي لجلسة واحدة يبقى على صفحة المواعيد ويُحدَّث دورياً
+
+    bot_factory(session) يعيد VisaBookingBot يوفر setup_driver و open_standby_tab و
+    refresh_standby و close_standby_tab و release_driver
+    """
+
+    def __init__(self, session, bot_factory):
+        self.session = session
+        self.bot_factory = bot_factory
+        self.bot = None
+        self.job = None
+        self.armed_at = None
+        self.refreshed_at = None
+        self.refreshes = 0
+        self._lock = threading.Lock()
+
+    def refresh(self, token):
+        """مهمة دورية: تجهيز التبويب عند أول تشغيل ثم إعادته إلى صفحة المواعيد"""
+        with self._lock:
+            if token.cancelled or not self.session.is_active():
+                return
+            try:
+                if self.bot is None:
+                    bot = self.bot_factory(self.session)
+                    bot.setup_driver(timeout=10)
+                    self.bot = bot
+                    bot.open_standby_tab()
+                    self.armed_at = time.time()
+                    print(f"🛡️ تبويب الحجز الاحتياطي جاهز للجلسة {self.session.session_id}")
+                else:
+                    self.bot.refresh_standby()
+            except Exception:
+                self._close_bot()
+                raise
+            self.refreshed_at = time.time()
+            self.refreshes += 1
+
+    def take(self):
+        """تسليم البوت الجاهز لمهمة الحجز (يصبح الحجز مسؤولاً عن إعادة المتصفح) - أو None"""
+        with self._lock:
+            bot, self.bot = self.bot, None
+        if self.job:
+            self.job.cancel()
+        return bot
+
+    def close(self, job=None):
+        with self._lock:
+            self._close_bot()
+
+    def _close_bot(self):
+        bot, self.bot = self.bot, None
+        if bot is None:
+            return
+        try:
+            bot.close_standby_tab()
+        except Exception:
+            pass
+        try:
+            bot.release_driver()
+        except Exception as e:
+            print(f"⚠️ خطأ في إغلاق تبويب الحجز الاحتياطي: {e}")
+
+    def to_dict(self):
+        return {
+            'session_id': self.session.session_id,
+            'ready': self.bot is not None,
+            'armed_at': self.armed_at,
+            'refreshed_at': self.refreshed_at,
+            'refreshes': self.refreshes
+        }
+
+
+class StandbyManager:
+    """تجهيز الجلسات للحجز: بيانات جاهزة لكل جلسة، وتبويب احتياطي لعدد محدود منها
+
+    كل تبويب احتياطي يحجز متصفحاً من المجمع طوال الجلسة، لذلك لا يُجهز إلا إذا كان
+    في المجمع متصفح خامل ولم يتجاوز العدد max_standby
+    """
+
+    def __init__(self, scheduler, bot_factory, max_standby=1, refresh_interval=90, pool_factory=None):
+        self.scheduler = scheduler
+        self.bot_factory = bot_factory
+        self.max_standby = max_standby
+        self.refresh_interval = refresh_interval
+        self.pool_factory = pool_factory
+        self._standbys = {}
+        self._lock = threading.Lock()
+
+    def arm(self, session):
+        """تجهيز بيانات الحجز للجلسة وجدولة تبويبها الاحتياطي إن أمكن"""
+        session.booking_payload = BookingPayload(session.user_data)
+        if self.max_standby <= 0 or not session.is_active():
+            return None
+        with self._lock:
+            if session.session_id in self._standbys or len(self._standbys) >= self.max_standby:
+                return None
+            if self.pool_factory is not None and self.pool_factory().snapshot()['idle'] <= 0:
+                return None
+            standby = BookingStandby(session, self.bot_factory)
+            standby.job = Job(
+                f"standby-{session.session_id}", standby.refresh,
+                interval=self.refresh_interval, priority=STANDBY_PRIORITY, group='standby',
+                backoff=ExponentialBackoff(base=self.refresh_interval / 3, max_delay=self.refresh_interval * 4),
+                max_failures=5, on_finish=lambda job: self._finished(standby)
+            )
+            self._standbys[session.session_id] = standby
+        session.add_stop_callback(lambda: self.disarm(session.session_id))
+        self.scheduler.submit(standby.job)
+        return standby
+
+    def take(self, session_id):
+        """البوت الجاهز على تبويب الحجز للجلسة - أو None إن لم يكن هناك تبويب جاهز"""
+        with self._lock:
+            standby = self._standbys.pop(session_id, None)
+        return standby.take() if standby else None
+
+    def disarm(self, session_id):
+        with self._lock:
+            standby = self._standbys.get(session_id)
+        if standby and standby.job:
+            standby.job.cancel()
+
+    def _finished(self, standby):
+        standby.close()
+        with self._lock:
+            if self._standbys.get(standby.session.session_id) is standby:
+                del self._standbys[standby.session.session_id]
+
+    def stats(self):
+        with self._lock:
+            standbys = [standby.to_dict() for standby in self._standbys.values()]
+        return {'max_standby': self.max_standby, 'refresh_interval': self.refresh_interval, 'standbys': standbys}
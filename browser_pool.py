@@ -0,0 +1,330 @@
+"""
+مجمع متصفحات Chrome الدافئة لبوت حجز فيزا إسبانيا
+Persistent pool of warm, pre-navigated headless Chrome sessions handed out as leases
+"""
+
+import os
+import threading
+import time
+from selenium import webdriver
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.chrome.service import Service
+from selenium.common.exceptions import SessionNotCreatedException
+from driver_resolver import driver_resolver, startup_timings
+
+# عنوان الموقع - يمكن توجيهه إلى خادم الإعادة المحلي (replay_server.py) للاختبار دون اتصال
+BLS_BASE_URL = os.environ.get('BLS_BASE_URL', "https://blsspainmorocco.com/")
+DEFAULT_WARM_URL = BLS_BASE_URL
+
+
+def build_chrome_options(headless=True):
+    """إعداد خيارات Chrome للبيئة السحابية"""
+    chrome_options = Options()
+
+    if headless:
+        chrome_options.add_argument("--headless")  # تشغيل بدون واجهة
+    chrome_options.add_argument("--no-sandbox")
+    chrome_options.add_argument("--disable-dev-shm-usage")
+    chrome_options.add_argument("--disable-gpu")
+    chrome_options.add_argument("--window-size=1920,1080")
+    chrome_options.add_argument("--disable-blink-features=AutomationControlled")
+    chrome_options.add_argument("--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36")
+    chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
+    chrome_options.add_experimental_option('useAutomationExtension', False)
+    return chrome_options
+
+
+def launch_chrome(headless=True, timing=None):
+    """تشغيل متصفح Chrome جديد باستخدام مسار chromedriver المحفوظ"""
+    timing = timing if timing is not None else startup_timings.start()
+    chrome_options = build_chrome_options(headless)
+
+    for attempt in range(2):
+        with startup_timings.phase(timing, 'resolve_driver'):
+            driver_path = driver_resolver.resolve()
+
+        try:
+            with startup_timings.phase(timing, 'start_chrome'):
+                if driver_path:
+                    driver = webdriver.Chrome(service=Service(driver_path), options=chrome_options)
+                else:
+                    # يتولى Selenium Manager إيجاد المشغل
+                    driver = webdriver.Chrome(options=chrome_options)
+            break
+        except SessionNotCreatedException as e:
+            # عدم تطابق إصدار المشغل مع المتصفح هو السبب الوحيد لإعادة التحديد
+            if attempt == 0 and driver_path:
+                print(f"🔄 عدم تطابق إصدار chromedriver - إعادة التحديد: {e.msg}")
+                driver_resolver.invalidate()
+                continue
+            raise
+
+    with startup_timings.phase(timing, 'stealth_script'):
+        driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
+    return driver
+
+
+class PooledSession:
+    """جلسة متصفح واحدة داخل المجمع"""
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.created_at = time.time()
+        self.last_checked = self.created_at
+        self.uses = 0
+
+
+class BrowserLease:
+    """عقد استخدام جلسة متصفح من المجمع - يجب إعادته أو إتلافه بعد الاستخدام"""
+
+    def __init__(self, pool, session):
+        self.pool = pool
+        self.session = session
+        self.active = True
+
+    @property
+    def driver(self):
+        return self.session.driver
+
+    def release(self):
+        """إعادة الجلسة السليمة إلى المجمع"""
+        if self.active:
+            self.active = False
+            self.pool._release(self.session)
+
+    def discard(self):
+        """إتلاف الجلسة المعطوبة وطلب بديل لها في الخلفية"""
+        if self.active:
+            self.active = False
+            self.pool._discard(self.session)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.release()
+        else:
+            self.discard()
+        return False
+
+
+class BrowserPool:
+    """الاحتفاظ بعدد ثابت من جلسات Chrome الدافئة مع فحص صحتها واستبدال المعطوب منها في الخلفية"""
+
+    def __init__(self, size=2, warm_url=DEFAULT_WARM_URL, health_check_interval=30,
+                 max_session_uses=200, driver_factory=None):
+        self.size = max(1, size)
+        self.warm_url = warm_url
+        self.health_check_interval = health_check_interval
+        self.max_session_uses = max_session_uses
+        # driver_factory(timing=...) يعيد متصفحاً جديداً ويسجل مراحل تشغيله في timing
+        self.driver_factory = driver_factory or launch_chrome
+
+        self._idle = []
+        self._leased = set()
+        self._launching = 0
+        self._lock = threading.Condition()
+        self._wakeup = threading.Event()
+        self._maintainer = None
+        self._closed = False
+
+        self.stats = {
+            'launched': 0,
+            'launch_failures': 0,
+            'discarded': 0,
+            'health_check_failures': 0,
+            'leases': 0,
+            'last_launch_seconds': 0.0
+        }
+
+    def start(self):
+        """بدء خيط الصيانة الذي يملأ المجمع ويفحص الجلسات"""
+        with self._lock:
+            if self._maintainer and self._maintainer.is_alive():
+                return self
+            self._closed = False
+            self._maintainer = threading.Thread(target=self._maintain_loop, daemon=True)
+            self._maintainer.start()
+        return self
+
+    def acquire(self, timeout=120):
+        """الحصول على عقد جلسة دافئة - ينتظر حتى تتوفر جلسة أو تنتهي المهلة"""
+        self.start()
+        deadline = time.time() + timeout
+
+        with self._lock:
+            while True:
+                if self._closed:
+                    raise RuntimeError("مجمع المتصفحات مغلق")
+                if self._idle:
+                    session = self._idle.pop()
+                    self._leased.add(session)
+                    session.uses += 1
+                    self.stats['leases'] += 1
+                    self._wakeup.set()  # تعويض الجلسة المؤجرة
+                    return BrowserLease(self, session)
+
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise TimeoutError("انتهت مهلة انتظار جلسة متصفح من المجمع")
+                self._wakeup.set()
+                self._lock.wait(min(remaining, 1.0))
+
+    def swap(self, lease):
+        """استبدال جلسة معطوبة بجلسة دافئة بدلاً من إعادة تشغيل Chrome"""
+        if lease is not None:
+            lease.discard()
+        return self.acquire()
+
+    def snapshot(self):
+        """حالة المجمع الحالية"""
+        with self._lock:
+            return {
+                'size': self.size,
+                'idle': len(self._idle),
+                'leased': len(self._leased),
+                'launching': self._launching,
+                **self.stats
+            }
+
+    def shutdown(self):
+        """إغلاق جميع الجلسات وإيقاف خيط الصيانة"""
+        with self._lock:
+            self._closed = True
+            sessions = self._idle + list(self._leased)
+            self._idle = []
+            self._leased = set()
+            self._lock.notify_all()
+        self._wakeup.set()
+
+        for session in sessions:
+            self._quit(session)
+
+    def _release(self, session):
+        with self._lock:
+            self._leased.discard(session)
+            if self._closed:
+                expired = True
+            else:
+                expired = session.uses >= self.max_session_uses
+                if not expired:
+                    self._idle.append(session)
+                    self._lock.notify()
+        if expired:
+            self._quit(session)
+            self._wakeup.set()
+
+    def _discard(self, session):
+        with self._lock:
+            self._leased.discard(session)
+            self.stats['discarded'] += 1
+        # إغلاق المتصفح في الخلفية حتى لا يتأخر المستدعي
+        threading.Thread(target=self._quit, args=(session,), daemon=True).start()
+        self._wakeup.set()
+
+    def _quit(self, session):
+        try:
+            session.driver.quit()
+        except:
+            pass
+
+    def _launch_session(self):
+        """تشغيل جلسة جديدة وتسخينها بالانتقال إلى الصفحة الرئيسية"""
+        started = time.time()
+        timing = startup_timings.start()
+        try:
+            driver = self.driver_factory(timing=timing)
+            if self.warm_url:
+                try:
+                    with startup_timings.phase(timing, 'warm_navigation'):
+                        driver.get(self.warm_url)
+                except Exception as e:
+                    print(f"⚠️ فشل تسخين الجلسة على {self.warm_url}: {e}")
+            startup_timings.finish(timing)
+            session = PooledSession(driver)
+        except Exception as e:
+            print(f"❌ فشل تشغيل جلسة متصفح جديدة: {e}")
+            with self._lock:
+                self._launching -= 1
+                self.stats['launch_failures'] += 1
+            return False
+
+        with self._lock:
+            self._launching -= 1
+            self.stats['launched'] += 1
+            self.stats['last_launch_seconds'] = round(time.time() - started, 3)
+            if self._closed:
+                closed = True
+            else:
+                closed = False
+                self._idle.append(session)
+                self._lock.notify()
+        if closed:
+            self._quit(session)
+        return True
+
+    def _is_healthy(self, session):
+        try:
+            return session.driver.execute_script("return document.readyState") is not None
+        except Exception:
+            return False
+
+    def _health_check(self):
+        """فحص الجلسات الخاملة وإتلاف المعطوب منها"""
+        with self._lock:
+            due = [s for s in self._idle if time.time() - s.last_checked >= self.health_check_interval]
+            for session in due:
+                self._idle.remove(session)
+
+        for session in due:
+            if self._is_healthy(session):
+                session.last_checked = time.time()
+                with self._lock:
+                    if self._closed:
+                        self._quit(session)
+                    else:
+                        self._idle.append(session)
+                        self._lock.notify()
+            else:
+                print("⚠️ جلسة متصفح غير سليمة - سيتم استبدالها")
+                with self._lock:
+                    self.stats['health_check_failures'] += 1
+                self._quit(session)
+
+    def _maintain_loop(self):
+        while True:
+            with self._lock:
+                if self._closed:
+                    return
+                missing = self.size - (len(self._idle) + len(self._leased) + self._launching)
+                if missing > 0:
+                    self._launching += 1
+
+            if missing > 0:
+                if not self._launch_session():
+                    # تجنب إعادة المحاولة الفورية عند فشل التشغيل
+                    self._wakeup.wait(5)
+                    self._wakeup.clear()
+                continue
+
+            self._health_check()
+            self._wakeup.wait(self.health_check_interval)
+            self._wakeup.clear()
+
+
+_browser_pool = None
+_browser_pool_lock = threading.Lock()
+
+
+def get_browser_pool():
+    """إرجاع مجمع المتصفحات المشترك للعملية (يُنشأ عند أول استخدام)"""
+    global _browser_pool
+    with _browser_pool_lock:
+        if _browser_pool is None:
+            _browser_pool = BrowserPool(
+                size=int(os.environ.get('BROWSER_POOL_SIZE', '2')),
+                warm_url=os.environ.get('BROWSER_WARM_URL', DEFAULT_WARM_URL),
+                health_check_interval=int(os.environ.get('BROWSER_HEALTH_CHECK_INTERVAL', '30'))
+            )
+        return _browser_pool
@@ -16,13 +16,13 @@ import sys
 import time
 import json
 from datetime import datetime, timedelta
-import sqlite3
+from storage import get_storage
 
 # إضافة المجلد الحالي للمسار
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 try:
-    from notification_system import NotificationSystem
+    from notification_system import notification_system
     NOTIFICATIONS_AVAILABLE = True
     print("✅ تم تحميل نظام الإشعارات بنجاح")
 except ImportError as e:
@@ -110,9 +110,6 @@ def send_client_notifications(client_data, booking_details):
     print(f"\n📢 إرسال الإشعارات للعميل...")
     
     try:
-        # إنشاء نظام الإشعارات
-        notification_system = NotificationSystem()
-        
         # إرسال الإشعار الشامل
         success = notification_system.send_comprehensive_notification(
             user_data=client_data,
@@ -139,42 +136,28 @@ def verify_booking_in_database(booking_id):
     print(f"\n🔍 التحقق من حفظ الحجز في قاعدة البيانات...")
     
     try:
-        conn = sqlite3.connect('notifications.db')
-        cursor = conn.cursor()
+        notifications = get_storage().notifications
         
         # البحث عن الحجز
-        cursor.execute("""
-            SELECT * FROM booking_logs 
-            WHERE booking_id = ? AND visa_type = 'فيزا دراسة'
-        """, (booking_id,))
-        
-        booking = cursor.fetchone()
+        booking = notifications.find_booking(booking_id, 'فيزا دراسة')
         
         if booking:
             print("✅ تم العثور على الحجز في قاعدة البيانات!")
-            print(f"   معرف الحجز: {booking[8]}")  # booking_id
-            print(f"   الاسم: {booking[2]}")        # full_name
-            print(f"   نوع الفيزا: {booking[6]}")   # visa_type
-            print(f"   تاريخ الحجز: {booking[1]}")  # booking_date
+            print(f"   معرف الحجز: {booking['booking_id']}")
+            print(f"   الاسم: {booking['full_name']}")
+            print(f"   نوع الفيزا: {booking['visa_type']}")
+            print(f"   تاريخ الحجز: {booking['booking_date']}")
             
             # التحقق من حالة الإشعارات
-            cursor.execute("""
-                SELECT email_sent, telegram_sent, whatsapp_sent 
-                FROM notification_status 
-                WHERE booking_id = ?
-            """, (booking_id,))
-            
-            notification_status = cursor.fetchone()
+            notification_status = notifications.notification_status(booking_id)
             if notification_status:
-                print(f"   حالة الإيميل: {'✅ تم الإرسال' if notification_status[0] else '❌ لم يتم'}")
-                print(f"   حالة تيليجرام: {'✅ تم الإرسال' if notification_status[1] else '❌ لم يتم'}")
-                print(f"   حالة واتساب: {'✅ تم الإرسال' if notification_status[2] else '❌ لم يتم'}")
+                print(f"   حالة الإيميل: {'✅ تم الإرسال' if notification_status['email_sent'] else '❌ لم يتم'}")
+                print(f"   حالة تيليجرام: {'✅ تم الإرسال' if notification_status['telegram_sent'] else '❌ لم يتم'}")
+                print(f"   حالة واتساب: {'✅ تم الإرسال' if notification_status['whatsapp_sent'] else '❌ لم يتم'}")
             
-            conn.close()
             return True
         else:
             print("❌ لم يتم العثور على الحجز في قاعدة البيانات")
-            conn.close()
             return False
             
     except Exception as e:
@@ -187,26 +170,16 @@ def generate_client_report():
     print(f"\n📊 إنشاء تقرير شامل للعميل...")
     
     try:
-        conn = sqlite3.connect('notifications.db')
-        cursor = conn.cursor()
+        notifications = get_storage().notifications
         
         # إحصائيات عامة
-        cursor.execute("SELECT COUNT(*) FROM booking_logs")
-        total_bookings = cursor.fetchone()[0]
+        total_bookings = notifications.count_bookings()
         
         # حجوزات فيزا الدراسة
-        cursor.execute("SELECT COUNT(*) FROM booking_logs WHERE visa_type = 'فيزا دراسة'")
-        study_visa_bookings = cursor.fetchone()[0]
+        study_visa_bookings = notifications.count_bookings('فيزا دراسة')
         
         # آخر حجز
-        cursor.execute("""
-            SELECT booking_date, full_name, booking_id 
-            FROM booking_logs 
-            WHERE visa_type = 'فيزا دراسة' 
-            ORDER BY booking_date DESC 
-            LIMIT 1
-        """)
-        last_booking = cursor.fetchone()
+        last_booking = notifications.last_booking('فيزا دراسة')
         
         print(f"\n📈 تقرير الإحصائيات:")
         print(f"   إجمالي الحجوزات: {total_bookings}")
@@ -214,11 +187,10 @@ def generate_client_report():
         
         if last_booking:
             print(f"   آخر حجز فيزا دراسة:")
-            print(f"     التاريخ: {last_booking[0]}")
-            print(f"     الاسم: {last_booking[1]}")
-            print(f"     معرف الحجز: {last_booking[2]}")
+            print(f"     التاريخ: {last_booking['booking_date']}")
+            print(f"     الاسم: {last_booking['full_name']}")
+            print(f"     معرف الحجز: {last_booking['booking_id']}")
         
-        conn.close()
         return True
         
     except Exception as e:
@@ -241,7 +213,9 @@ def main():
     # 2. إرسال الإشعارات
     notifications_sent = send_client_notifications(client_data, booking_details)
     
-    # 3. التحقق من قاعدة البيانات
+    # 3. التحقق من قاعدة البيانات (بعد كتابة السجلات المؤجلة في الخلفية)
+    if NOTIFICATIONS_AVAILABLE:
+        notification_system.flush_writes()
     booking_verified = verify_booking_in_database(booking_details['booking_id'])
     
     # 4. إنشاء تقرير شامل
@@ -4,98 +4,21 @@ Web Dashboard for Successful Booking Statistics
 """
 
 from flask import Flask, render_template_string, jsonify
-import sqlite3
-from datetime import datetime, timedelta
+from datetime import datetime
 import json
 import os
+from storage import get_storage
 
 # إنشاء تطبيق Flask منفصل للوحة التحكم
 dashboard_app = Flask(__name__)
 
-def get_db_connection():
-    """الحصول على اتصال بقاعدة البيانات"""
-    try:
-        conn = sqlite3.connect('notifications.db')
-        conn.row_factory = sqlite3.Row
-        return conn
-    except Exception as e:
-        print(f"خطأ في الاتصال بقاعدة البيانات: {e}")
-        return None
-
 def get_booking_statistics():
-    """الحصول على إحصائيات الحجوزات"""
-    conn = get_db_connection()
-    if not conn:
-        return {}
-    
+    """الحصول على إحصائيات الحجوزات (من قاعدة البيانات المشتركة مع تطبيق الحجز)"""
     try:
-        cursor = conn.cursor()
-        
-        # إجمالي الحجوزات
-        cursor.execute("SELECT COUNT(*) as total FROM booking_logs")
-        total_bookings = cursor.fetchone()['total']
-        
-        # الحجوزات اليوم
-        today = datetime.now().strftime('%Y-%m-%d')
-        cursor.execute("SELECT COUNT(*) as today FROM booking_logs WHERE DATE(booking_date) = ?", (today,))
-        today_bookings = cursor.fetchone()['today']
-        
-        # الحجوزات هذا الأسبوع
-        week_ago = (datetime.now() - timedelta(days=7)).strftime('%Y-%m-%d')
-        cursor.execute("SELECT COUNT(*) as week FROM booking_logs WHERE DATE(booking_date) >= ?", (week_ago,))
-        week_bookings = cursor.fetchone()['week']
-        
-        # المستخدمون الفريدون
-        cursor.execute("SELECT COUNT(DISTINCT full_name) as unique_users FROM booking_logs")
-        unique_users = cursor.fetchone()['unique_users']
-        
-        # آخر حجز
-        cursor.execute("SELECT * FROM booking_logs ORDER BY booking_date DESC LIMIT 1")
-        last_booking = cursor.fetchone()
-        
-        # الحجوزات حسب نوع الفيزا
-        cursor.execute("""
-            SELECT visa_type, COUNT(*) as count 
-            FROM booking_logs 
-            GROUP BY visa_type 
-            ORDER BY count DESC
-        """)
-        visa_types = cursor.fetchall()
-        
-        # الحجوزات الأخيرة (آخر 10)
-        cursor.execute("""
-            SELECT * FROM booking_logs 
-            ORDER BY booking_date DESC 
-            LIMIT 10
-        """)
-        recent_bookings = cursor.fetchall()
-        
-        # إحصائيات يومية للأسبوع الماضي
-        cursor.execute("""
-            SELECT DATE(booking_date) as date, COUNT(*) as count
-            FROM booking_logs 
-            WHERE DATE(booking_date) >= ?
-            GROUP BY DATE(booking_date)
-            ORDER BY date
-        """, (week_ago,))
-        daily_stats = cursor.fetchall()
-        
-        return {
-            'total_bookings': total_bookings,
-            'today_bookings': today_bookings,
-            'week_bookings': week_bookings,
-            'unique_users': unique_users,
-            'last_booking': dict(last_booking) if last_booking else None,
-            'visa_types': [dict(row) for row in visa_types],
-            'recent_bookings': [dict(row) for row in recent_bookings],
-            'daily_stats': [dict(row) for row in daily_stats]
-        }
-        
+        return get_storage().notifications.dashboard_statistics()
     except Exception as e:
         print(f"خطأ في الحصول على الإحصائيات: {e}")
         return {}
-    finally:
-        conn.close()
 
 # قالب HTML للوحة التحكم
 DASHBOARD_TEMPLATE = """
@@ -389,19 +312,10 @@ def api_stats():
 @dashboard_app.route('/api/bookings')
 def api_bookings():
     """API للحصول على قائمة الحجوزات"""
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({'error': 'Database connection failed'})
-    
     try:
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM booking_logs ORDER BY booking_date DESC")
-        bookings = [dict(row) for row in cursor.fetchall()]
-        return jsonify(bookings)
+        return jsonify(get_storage().notifications.all_bookings())
     except Exception as e:
         return jsonify({'error': str(e)})
-    finally:
-        conn.close()
 
 def run_dashboard(host='127.0.0.1', port=5001, debug=False):
     """تشغيل لوحة التحكم"""
@@ -412,12 +326,13 @@ if __name__ == "__main__":
     print("🎛️ بدء تشغيل لوحة تحكم حجوزات فيزا إسبانيا")
     print("=" * 50)
     
-    # التحقق من وجود قاعدة البيانات
-    if not os.path.exists('notifications.db'):
-        print("⚠️ لم يتم العثور على قاعدة بيانات الإشعارات")
-        print("💡 قم بتشغيل السكريبت الرئيسي أولاً لإنشاء قاعدة البيانات")
-    else:
-        print("✅ تم العثور على قاعدة البيانات")
+    # التحقق من قاعدة البيانات (تُنشأ جداولها عند أول اتصال)
+    try:
+        storage = get_storage()
+        print(f"✅ قاعدة البيانات جاهزة ({storage.backend}، المخطط v{storage.schema_version()})")
+    except Exception as e:
+        print(f"⚠️ تعذر الاتصال بقاعدة البيانات: {e}")
+        print("💡 تحقق من DATABASE_URL في متغيرات البيئة")
     
     # تشغيل لوحة التحكم
     run_dashboard(debug=True)
\ No newline at end of file
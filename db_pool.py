@@ -0,0 +1,337 @@
+"""
+طبقة الوصول لقاعدة البيانات مع تجميع الاتصالات
+Pooled database access layer - a thread-safe connection pool for PostgreSQL and a
+reused per-thread connection for SQLite in WAL mode, with a named prepared-statement
+cache and pool metrics
+"""
+
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+DEFAULT_SQLITE_PATH = 'visa_bookings.db'
+
+
+def parse_database_url(database_url):
+    """تحويل DATABASE_URL إلى معاملات psycopg2.connect"""
+    parsed = urlparse(database_url)
+    return {
+        'host': parsed.hostname,
+        'database': parsed.path[1:],
+        'user': parsed.username,
+        'password': parsed.password,
+        'port': parsed.port
+    }
+
+
+def _numbered_placeholders(sql):
+    """تحويل %s إلى $1, $2 ... لأوامر PREPARE في PostgreSQL"""
+    counter = iter(range(1, 1000))
+    return re.sub(r'%s', lambda _: f"${next(counter)}", sql)
+
+
+class PoolMetrics:
+    """عدادات المجمع: عدد الاتصالات المفتوحة والمستخدمة وزمن الانتظار"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.values = {
+            'connections_opened': 0,
+            'connections_closed': 0,
+            'acquisitions': 0,
+            'in_use': 0,
+            'peak_in_use': 0,
+            'wait_seconds_total': 0.0,
+            'wait_seconds_max': 0.0,
+            'timeouts': 0,
+            'errors': 0,
+            'statements_prepared': 0,
+            'statement_cache_hits': 0
+        }
+
+    def add(self, name, amount=1):
+        with self._lock:
+            self.values[name] += amount
+
+    def acquired(self, waited):
+        with self._lock:
+            v = self.values
+            v['acquisitions'] += 1
+            v['in_use'] += 1
+            v['peak_in_use'] = max(v['peak_in_use'], v['in_use'])
+            v['wait_seconds_total'] += waited
+            v['wait_seconds_max'] = max(v['wait_seconds_max'], waited)
+
+    def released(self):
+        with self._lock:
+            self.values['in_use'] -= 1
+
+    def snapshot(self):
+        with self._lock:
+            values = dict(self.values)
+        values['wait_seconds_total'] = round(values['wait_seconds_total'], 4)
+        values['wait_seconds_max'] = round(values['wait_seconds_max'], 4)
+        values['avg_wait_ms'] = (
+            round(values['wait_seconds_total'] * 1000 / values['acquisitions'], 3) if values['acquisitions'] else None
+        )
+        return values
+
+
+class SQLitePool:
+    """اتصال SQLite واحد لكل خيط يُعاد استخدامه، بوضع WAL حتى لا تحجب القراءة الكتابة"""
+
+    backend = 'sqlite'
+    placeholder = '?'
+
+    def __init__(self, path=DEFAULT_SQLITE_PATH, busy_timeout=5, statement_cache=256):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self.statement_cache = statement_cache
+        self.metrics = PoolMetrics()
+        self._local = threading.local()
+
+    def _open(self):
+        # sqlite3 يحتفظ بالأوامر المُجهزة لكل اتصال (cached_statements)
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout, cached_statements=self.statement_cache)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        self.metrics.add('connections_opened')
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """اتصال الخيط الحالي - commit عند النجاح و rollback عند الخطأ"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._open()
+        self.metrics.acquired(0.0)
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            self.metrics.add('errors')
+            conn.rollback()
+            raise
+        finally:
+            self.metrics.released()
+
+    def execute(self, conn, name, sql, params):
+        cursor = conn.cursor()
+        cursor.execute(sql, params)
+        return cursor
+
+    def execute_many(self, conn, name, sql, rows):
+        cursor = conn.cursor()
+        cursor.executemany(sql, rows)
+        return cursor
+
+    def close(self):
+        """إغلاق اتصال الخيط الحالي (اتصالات الخيوط الأخرى تُغلق بانتهائها)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            self._local.conn = None
+            conn.close()
+            self.metrics.add('connections_closed')
+
+
+class PostgresPool:
+    """مجمع اتصالات PostgreSQL آمن للخيوط - ينتظر حتى timeout ثانية عند انشغال كل الاتصالات
+
+    الأوامر المسماة تُجهز بـ PREPARE مرة واحدة لكل اتصال ثم تُنفذ بـ EXECUTE.
+    psycopg2 يغلق الاتصالات الزائدة عن minconn عند إعادتها، لذلك يُفضل minconn قريباً من maxconn
+    """
+
+    backend = 'postgres'
+    placeholder = '%s'
+
+    def __init__(self, database_url, minconn=5, maxconn=10, timeout=30):
+        from psycopg2.pool import ThreadedConnectionPool
+
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.metrics = PoolMetrics()
+        self._pool = ThreadedConnectionPool(minconn, maxconn, **parse_database_url(database_url))
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._prepared = {}      # key -> أسماء الأوامر المُجهزة على الاتصال
+        self._connections = {}   # key -> الاتصال نفسه (لمعرفة ما أغلقه المجمع)
+        self._prepared_lock = threading.Lock()
+
+    @contextmanager
+    def connection(self):
+        started = time.perf_counter()
+        if not self._slots.acquire(timeout=self.timeout):
+            self.metrics.add('timeouts')
+            raise TimeoutError("انتهت مهلة انتظار اتصال من مجمع قاعدة البيانات")
+        broken = False
+        try:
+            conn = self._pool.getconn()
+        except Exception:
+            self._slots.release()
+            raise
+        self.metrics.acquired(time.perf_counter() - started)
+        key = self._key(conn)
+        with self._prepared_lock:
+            if key not in self._prepared:
+                # اتصال جديد فتحه المجمع - تُنسى فقط أوامر الاتصالات التي أغلقها المجمع فعلاً،
+                # فالاتصالات الحية تحتفظ بأوامرها المُجهزة و PREPARE مكرر عليها يفشل
+                closed = [k for k, c in self._connections.items() if c.closed]
+                for closed_key in closed:
+                    self._connections.pop(closed_key)
+                    self._prepared.pop(closed_key, None)
+                if closed:
+                    self.metrics.add('connections_closed', len(closed))
+                self._prepared[key] = set()
+                self._connections[key] = conn
+                self.metrics.add('connections_opened')
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            self.metrics.add('errors')
+            broken = bool(conn.closed)
+            if not broken:
+                try:
+                    conn.rollback()
+                except Exception:
+                    broken = True
+            raise
+        finally:
+            if broken:
+                with self._prepared_lock:
+                    self._prepared.pop(key, None)
+                    self._connections.pop(key, None)
+                self.metrics.add('connections_closed')
+            self._pool.putconn(conn, close=broken)
+            self.metrics.released()
+            self._slots.release()
+
+    @staticmethod
+    def _key(conn):
+        # رقم عملية الخادم يميز الاتصال حتى لو أُعيد استخدام عنوان الكائن في الذاكرة
+        return id(conn), conn.get_backend_pid()
+
+    def _prepare(self, conn, cursor, name, sql):
+        with self._prepared_lock:
+            prepared = self._prepared.setdefault(self._key(conn), set())
+            ready = name in prepared
+        if ready:
+            self.metrics.add('statement_cache_hits')
+        else:
+            cursor.execute(f"PREPARE {name} AS {_numbered_placeholders(sql)}")
+            with self._prepared_lock:
+                prepared.add(name)
+            self.metrics.add('statements_prepared')
+
+    def execute(self, conn, name, sql, params):
+        cursor = conn.cursor()
+        if name is None:
+            cursor.execute(sql, params)
+            return cursor
+        self._prepare(conn, cursor, name, sql)
+        if params:
+            cursor.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
+        else:
+            cursor.execute(f"EXECUTE {name}")
+        return cursor
+
+    def execute_many(self, conn, name, sql, rows):
+        """تنفيذ الأمر المُجهز لعدة صفوف مع تجميع أوامر EXECUTE في رسائل قليلة للخادم"""
+        from psycopg2.extras import execute_batch
+
+        cursor = conn.cursor()
+        self._prepare(conn, cursor, name, sql)
+        if rows:
+            execute_batch(cursor, f"EXECUTE {name} ({', '.join(['%s'] * len(rows[0]))})", rows, page_size=100)
+        return cursor
+
+    def close(self):
+        self._pool.closeall()
+        with self._prepared_lock:
+            self._prepared.clear()
+            self._connections.clear()
+
+
+class Database:
+    """واجهة موحدة فوق المجمع: أوامر مسماة لكل نوع قاعدة بيانات وتنفيذها عبر اتصال مُجمّع"""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self._statements = {}
+
+    @classmethod
+    def from_env(cls, sqlite_path=DEFAULT_SQLITE_PATH):
+        """PostgreSQL إذا كان DATABASE_URL يبدأ بـ postgres، وإلا SQLite محلية (sqlite:///path أو sqlite_path)"""
+        database_url = os.environ.get('DATABASE_URL', '')
+        if database_url.startswith('sqlite:///') and len(database_url) > len('sqlite:///'):
+            sqlite_path = database_url[len('sqlite:///'):]
+        if database_url.startswith('postgres'):
+            return cls(PostgresPool(
+                database_url,
+                minconn=int(os.environ.get('DB_POOL_MIN', '5')),
+                maxconn=int(os.environ.get('DB_POOL_MAX', '10')),
+                timeout=float(os.environ.get('DB_POOL_TIMEOUT', '30'))
+            ))
+        return cls(SQLitePool(sqlite_path))
+
+    @property
+    def backend(self):
+        return self.pool.backend
+
+    def connection(self):
+        return self.pool.connection()
+
+    def register(self, name, sqlite=None, postgres=None, sql=None):
+        """تسجيل أمر مسمى - sql مشترك بعلامة ? (تُحوّل لـ PostgreSQL) أو نص لكل نوع"""
+        if sql is not None:
+            sqlite = sqlite or sql
+            postgres = postgres or sql.replace('?', '%s')
+        self._statements[name] = {'sqlite': sqlite, 'postgres': postgres}
+
+    def execute(self, name, params=(), fetch=None):
+        """تنفيذ أمر مسمى في معاملة مستقلة - fetch: None أو 'one' أو 'all' أو 'one_dict' أو 'all_dicts'"""
+        with self.connection() as conn:
+            return self.run(conn, name, params, fetch)
+
+    def run(self, conn, name, params=(), fetch=None):
+        """تنفيذ أمر مسمى على اتصال مفتوح (لعدة أوامر في معاملة واحدة)"""
+        sql = self._statements[name][self.backend]
+        cursor = self.pool.execute(conn, name, sql, tuple(params))
+        if fetch is None:
+            return cursor.rowcount
+        rows = cursor.fetchall() if fetch in ('all', 'all_dicts') else [cursor.fetchone()]
+        if fetch.endswith('dict') or fetch.endswith('dicts'):
+            columns = [desc[0] for desc in cursor.description]
+            rows = [dict(zip(columns, row)) if row is not None else None for row in rows]
+        return rows if fetch in ('all', 'all_dicts') else rows[0]
+
+    def execute_many(self, name, rows, conn=None):
+        """تنفيذ أمر مسمى لعدة صفوف دفعة واحدة (executemany في SQLite و execute_batch في PostgreSQL)"""
+        rows = [tuple(row) for row in rows]
+        if not rows:
+            return 0
+        sql = self._statements[name][self.backend]
+        if conn is not None:
+            self.pool.execute_many(conn, name, sql, rows)
+            return len(rows)
+        with self.connection() as conn:
+            self.pool.execute_many(conn, name, sql, rows)
+        return len(rows)
+
+    def executescript(self, sqlite=None, postgres=None):
+        """تنفيذ عدة أوامر DDL (إنشاء الجداول والفهارس) دون تجهيز"""
+        script = sqlite if self.backend == 'sqlite' else postgres
+        with self.connection() as conn:
+            if self.backend == 'sqlite':
+                conn.executescript(script)
+            else:
+                conn.cursor().execute(script)
+
+    def stats(self):
+        return dict(self.pool.metrics.snapshot(), backend=self.backend, statements=len(self._statements))
+
+    def close(self):
+        self.pool.close()
@@ -6,7 +6,7 @@ Demo Mode for Testing Notification System
 import os
 import json
 from datetime import datetime
-from notification_system import NotificationSystem
+from notification_system import notification_system
 
 def test_notification_system():
     """اختبار نظام الإشعارات مع بيانات وهمية"""
@@ -23,9 +23,6 @@ def test_notification_system():
         'nationality': 'السعودية'
     }
     
-    # إنشاء نظام الإشعارات
-    notification_system = NotificationSystem()
-    
     try:
         # اختبار الإشعار الشامل
         print("📧 اختبار إرسال الإشعار الشامل...")
@@ -96,7 +93,6 @@ def simulate_booking_process():
         }
     ]
     
-    notification_system = NotificationSystem()
     successful_bookings = 0
     
     for i, user_data in enumerate(test_users, 1):
@@ -0,0 +1,219 @@
+"""
+كشف تغير الصفحة عبر بصمة المناطق المهمة (التقويم، قائمة المواعيد، النوافذ المنبثقة)
+DOM fingerprint diffing for the calendar, slot list and modal regions - keeps a
+timestamped history of which regions changed between scans and what the scan found.
+The fingerprint does not cover everything the slot scan matches, so it never replaces the scan
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from collections import deque
+from page_watcher import MODAL_CONTAINER_SELECTORS
+from pipeline_metrics import DEFAULT_METRICS_DB
+
+# المناطق التي تُحسب بصمتها (محددات CSS)
+FINGERPRINT_REGIONS = {
+    'calendar': ['.calendar', '[class*="calendar"]', '[class*="datepicker"]', 'table[class*="date"]'],
+    'slots': ['#slots', '[class*="slot"]', '[class*="available"]', '[data-available]'],
+    'modal': MODAL_CONTAINER_SELECTORS + ['.modal', '[class*="disclaimer"]']
+}
+
+# سكريبت البصمة: عرض مُطبّع لكل منطقة (الوسم، الأصناف مرتبة، الظهور، التعطيل، النص المباشر)
+# ثم FNV-1a لكل منطقة - يعيد {region: {hash, nodes}}
+REGION_FINGERPRINT_SCRIPT = """
+var regions = arguments[0];
+var maxNodes = arguments[1];
+
+function hash(text) {
+    var h = 0x811c9dc5;
+    for (var i = 0; i < text.length; i++) {
+        h ^= text.charCodeAt(i);
+        h = Math.imul(h, 0x01000193) >>> 0;
+    }
+    return ('0000000' + h.toString(16)).slice(-8);
+}
+
+function visible(el) {
+    if (!el.getClientRects || !el.getClientRects().length) { return false; }
+    var style = window.getComputedStyle(el);
+    return style.visibility !== 'hidden' && style.display !== 'none';
+}
+
+function describe(el) {
+    var cls = (typeof el.className === 'string' ? el.className : el.getAttribute('class')) || '';
+    var text = '';
+    for (var c = el.firstChild; c; c = c.nextSibling) {
+        if (c.nodeType === 3) { text += c.nodeValue; }
+    }
+    return el.tagName + '.' + cls.split(/\\s+/).sort().join('.')
+        + (visible(el) ? '' : '~hidden') + (el.disabled ? '~disabled' : '')
+        + (el.getAttribute('data-available') || '') + ':' + text.replace(/\\s+/g, ' ').trim();
+}
+
+var result = {};
+for (var name in regions) {
+    var seen = [];
+    var parts = [];
+    var roots = [];
+    for (var s = 0; s < regions[name].length; s++) {
+        try {
+            roots = roots.concat(Array.prototype.slice.call(document.querySelectorAll(regions[name][s])));
+        } catch (e) {}
+    }
+    for (var r = 0; r < roots.length && parts.length < maxNodes; r++) {
+        var nodes = [roots[r]].concat(Array.prototype.slice.call(roots[r].querySelectorAll('*')));
+        for (var n = 0; n < nodes.length && parts.length < maxNodes; n++) {
+            if (seen.indexOf(nodes[n]) !== -1) { continue; }
+            seen.push(nodes[n]);
+            parts.push(describe(nodes[n]));
+        }
+    }
+    result[name] = {hash: hash(parts.join('\\n')), nodes: parts.length};
+}
+return result;
+"""
+
+
+class ChangeLog:
+    """سجل أحداث التغير في SQLite - كل حدث يحمل نتيجة فحص المواعيد بعده فيصبح سجلاً لتغير التوفر"""
+
+    def __init__(self, db_path=DEFAULT_METRICS_DB):
+        self.db_path = db_path
+        self._ready = False
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path)
+        if not self._ready:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS page_changes (
+                    ts REAL,
+                    target TEXT,
+                    regions TEXT,
+                    available INTEGER,
+                    slot_count INTEGER
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_page_changes_target_ts ON page_changes (target, ts)')
+            self._ready = True
+        return conn
+
+    def add(self, event):
+        try:
+            conn = self._connect()
+            try:
+                conn.execute(
+                    'INSERT INTO page_changes (ts, target, regions, available, slot_count) VALUES (?, ?, ?, ?, ?)',
+                    (event['ts'], event['target'], json.dumps(event['regions']),
+                     None if event['available'] is None else int(event['available']), event['count'])
+                )
+                conn.commit()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"⚠️ تعذر حفظ حدث تغير الصفحة: {e}")
+
+    def query(self, target=None, limit=100):
+        sql = 'SELECT ts, target, regions, available, slot_count FROM page_changes'
+        params = []
+        if target:
+            sql += ' WHERE target = ?'
+            params.append(target)
+        sql += ' ORDER BY ts DESC LIMIT ?'
+        params.append(limit)
+        try:
+            conn = self._connect()
+            try:
+                rows = conn.execute(sql, params).fetchall()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"⚠️ تعذر قراءة سجل تغير الصفحات: {e}")
+            return []
+        return [
+            {'ts': ts, 'target': t, 'regions': json.loads(regions),
+             'available': None if available is None else bool(available), 'count': count}
+            for ts, t, regions, available, count in rows
+        ]
+
+
+class FingerprintTracker:
+    """آخر بصمة لكل هدف - يحدد هل تغيرت الصفحة ويسجل حدثاً عند كل تغير"""
+
+    def __init__(self, change_log=None, max_nodes=400, recent_size=200):
+        self.change_log = change_log
+        self.max_nodes = max_nodes
+        self._targets = {}
+        self._recent = deque(maxlen=recent_size)
+        self._lock = threading.Lock()
+        self.stats = {'checks': 0, 'unchanged': 0, 'changes': 0}
+
+    @staticmethod
+    def _target(key):
+        return '|'.join(key)
+
+    def fingerprint(self, driver):
+        """بصمة المناطق في الصفحة الحالية (استدعاء واحد للمتصفح)"""
+        regions = driver.execute_script(REGION_FINGERPRINT_SCRIPT, FINGERPRINT_REGIONS, self.max_nodes) or {}
+        return {name: region.get('hash') for name, region in regions.items()}
+
+    def observe(self, key, driver):
+        """مقارنة بصمة الصفحة الحالية بالسابقة للهدف - يعيد {'changed', 'regions' (المناطق المتغيرة)}
+
+        البصمة لا تغطي كل ما يطابقه فحص المواعيد (نص "متاح" في أي مكان، روابط وأزرار الحجز)،
+        لذلك يجب الفحص بعدها دائماً. البصمة الجديدة لا تُعتمد إلا في record_scan
+        """
+        fingerprint = self.fingerprint(driver)
+        target = self._target(key)
+        with self._lock:
+            self.stats['checks'] += 1
+            state = self._targets.setdefault(target, {'fingerprint': None, 'count': None, 'pending': None})
+            previous = state['fingerprint']
+            state['scanning'] = fingerprint
+            regions = sorted(name for name in fingerprint if previous is None or previous.get(name) != fingerprint[name])
+            if previous is not None and not regions:
+                self.stats['unchanged'] += 1
+                return {'changed': False, 'regions': []}
+            if previous is not None:
+                self.stats['changes'] += 1
+                state['pending'] = {'ts': time.time(), 'target': target, 'regions': regions}
+            return {'changed': True, 'regions': regions}
+
+    def record_scan(self, key, count):
+        """تسجيل نتيجة الفحص - تُكمل حدث التغير المعلق وتُحفظ
+
+        تغير عدد المواعيد دون تغير البصمة (موعد خارج المناطق المراقبة) يُسجل حدثاً بلا مناطق
+        """
+        target = self._target(key)
+        with self._lock:
+            state = self._targets.setdefault(target, {'fingerprint': None, 'count': None, 'pending': None})
+            previous_count, state['count'] = state['count'], count
+            state['fingerprint'] = state.pop('scanning', None) or state['fingerprint']
+            event, state['pending'] = state['pending'], None
+            if event is None and previous_count is not None and previous_count != count:
+                event = {'ts': time.time(), 'target': target, 'regions': []}
+        if event is None:
+            return None
+        event['available'] = bool(count)
+        event['count'] = count
+        with self._lock:
+            self._recent.append(event)
+        if self.change_log is not None:
+            self.change_log.add(event)
+        return event
+
+    def history(self, target=None, limit=100):
+        """أحداث التغير المحفوظة (الأحدث أولاً)، أو الأحداث الحديثة في الذاكرة عند عدم وجود سجل"""
+        if self.change_log is not None:
+            return self.change_log.query(target, limit)
+        with self._lock:
+            events = [event for event in self._recent if target is None or event['target'] == target]
+        return list(reversed(events))[:limit]
+
+    def summary(self):
+        with self._lock:
+            return dict(self.stats, targets=len(self._targets))
+
+
+page_changes = FingerprintTracker(ChangeLog())
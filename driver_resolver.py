@@ -0,0 +1,193 @@
+"""
+طبقة تحديد مسار chromedriver مع ذاكرة دائمة بين مرات التشغيل
+Chromedriver resolution cached in a local manifest, plus per-phase browser startup timings
+"""
+
+import json
+import os
+import re
+import shutil
+import subprocess
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+DEFAULT_MANIFEST_PATH = os.environ.get('CHROMEDRIVER_MANIFEST', '.chromedriver_manifest.json')
+
+CHROME_BINARY_CANDIDATES = ['google-chrome', 'google-chrome-stable', 'chromium', 'chromium-browser', 'chrome']
+
+_VERSION_PATTERN = re.compile(r'(\d+)\.(\d+)\.(\d+)\.(\d+)')
+
+
+def _read_version(binary):
+    """قراءة رقم الإصدار من مخرجات --version"""
+    try:
+        output = subprocess.run(
+            [binary, '--version'], capture_output=True, text=True, timeout=10
+        ).stdout
+    except Exception:
+        return None
+    match = _VERSION_PATTERN.search(output or '')
+    return match.group(0) if match else None
+
+
+def _major(version):
+    return version.split('.')[0] if version else None
+
+
+class StartupTimings:
+    """تسجيل الزمن المستغرق في كل مرحلة من مراحل تشغيل المتصفح"""
+
+    def __init__(self, history_size=50):
+        self.history = deque(maxlen=history_size)
+        self._lock = threading.Lock()
+
+    def start(self):
+        """بدء تسجيل تشغيل جديد وإرجاع قاموس مراحله"""
+        return {'started_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'), 'phases': {}}
+
+    def phase(self, record, name):
+        """مدير سياق لقياس مرحلة واحدة"""
+        return _PhaseTimer(record, name)
+
+    def finish(self, record):
+        record['total'] = round(sum(record['phases'].values()), 3)
+        with self._lock:
+            self.history.append(record)
+        return record
+
+    def summary(self):
+        """متوسط وآخر زمن لكل مرحلة"""
+        with self._lock:
+            records = list(self.history)
+        phases = {}
+        for record in records:
+            for name, seconds in record['phases'].items():
+                phases.setdefault(name, []).append(seconds)
+        return {
+            'startups': len(records),
+            'last': records[-1] if records else None,
+            'average': {name: round(sum(v) / len(v), 3) for name, v in phases.items()}
+        }
+
+
+class _PhaseTimer:
+    def __init__(self, record, name):
+        self.record = record
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.started
+        self.record['phases'][self.name] = round(self.record['phases'].get(self.name, 0) + elapsed, 3)
+        return False
+
+
+class DriverResolver:
+    """تحديد مسار chromedriver مرة واحدة وحفظه مع الإصدار في ملف محلي"""
+
+    def __init__(self, manifest_path=DEFAULT_MANIFEST_PATH):
+        self.manifest_path = manifest_path
+        self._lock = threading.Lock()
+        self._resolved = None
+        self._browser_version = None
+
+    def browser_version(self):
+        """إصدار Chrome المثبت (يُحسب مرة واحدة لكل عملية)"""
+        if self._browser_version is None:
+            candidates = [os.environ.get('CHROME_BIN')] + CHROME_BINARY_CANDIDATES
+            for candidate in candidates:
+                binary = candidate and (shutil.which(candidate) or (os.path.exists(candidate) and candidate))
+                if binary:
+                    self._browser_version = _read_version(binary) or ''
+                    break
+            else:
+                self._browser_version = ''
+        return self._browser_version or None
+
+    def load_manifest(self):
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save_manifest(self, manifest):
+        try:
+            with open(self.manifest_path, 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, ensure_ascii=False, indent=2)
+        except OSError as e:
+            print(f"⚠️ تعذر حفظ ملف chromedriver: {e}")
+
+    def invalidate(self):
+        """إلغاء المسار المحفوظ لإجبار إعادة التحديد في المرة القادمة"""
+        with self._lock:
+            self._resolved = None
+            try:
+                os.remove(self.manifest_path)
+            except OSError:
+                pass
+
+    def resolve(self):
+        """إرجاع مسار chromedriver أو None لترك الاختيار لـ Selenium Manager"""
+        with self._lock:
+            if self._resolved is not None:
+                return self._resolved.get('driver_path')
+
+            browser_version = self.browser_version()
+
+            # المسار المحدد صراحة في متغيرات البيئة له الأولوية
+            explicit_path = os.environ.get('CHROMEDRIVER_PATH')
+            if explicit_path and os.path.exists(explicit_path):
+                self._resolved = {'driver_path': explicit_path, 'source': 'env'}
+                return explicit_path
+
+            manifest = self.load_manifest()
+            if manifest and self._manifest_is_valid(manifest, browser_version):
+                self._resolved = manifest
+                return manifest.get('driver_path')
+
+            manifest = self._resolve_fresh(browser_version)
+            self._resolved = manifest
+            # لا يُحفظ إلا التحديد الناجح حتى لا يُثبَّت فشل مؤقت بين مرات التشغيل
+            if manifest.get('driver_path'):
+                self.save_manifest(manifest)
+            return manifest.get('driver_path')
+
+    def _manifest_is_valid(self, manifest, browser_version):
+        driver_path = manifest.get('driver_path')
+        if driver_path and not os.path.exists(driver_path):
+            return False
+        # لا تتم إعادة التحديد إلا عند اختلاف الإصدار الرئيسي للمتصفح
+        if browser_version and _major(manifest.get('browser_version')) != _major(browser_version):
+            print(f"🔄 تغير إصدار Chrome ({manifest.get('browser_version')} → {browser_version}) - إعادة تحديد chromedriver")
+            return False
+        return True
+
+    def _resolve_fresh(self, browser_version):
+        manifest = {
+            'driver_path': None,
+            'driver_version': None,
+            'browser_version': browser_version,
+            'source': 'selenium-manager',
+            'resolved_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        }
+        try:
+            from webdriver_manager.chrome import ChromeDriverManager
+            driver_path = ChromeDriverManager().install()
+            manifest['driver_path'] = driver_path
+            manifest['driver_version'] = _read_version(driver_path)
+            manifest['source'] = 'webdriver-manager'
+            print(f"✅ تم تحديد chromedriver: {driver_path}")
+        except Exception as e:
+            # Fallback للبيئة المحلية: يتولى Selenium Manager إيجاد المشغل
+            print(f"⚠️ فشل ChromeDriverManager، سيتم استخدام Selenium Manager: {e}")
+        return manifest
+
+
+driver_resolver = DriverResolver()
+startup_timings = StartupTimings()
@@ -0,0 +1,316 @@
+"""
+توزيع تنبيه موعد واحد على عدد كبير من المشتركين ضمن حدود معدل الإرسال
+Rate-limited bulk fan-out - one event is expanded into one delivery per (subscriber,
+channel); every channel drains its own queue in batches under a token bucket for the
+provider and one per chat/recipient, and each fan-out reports throughput and drain time
+"""
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+MAX_TRACKED_CHATS = 10000
+
+
+class TokenBucket:
+    """دلو رموز بمعدل rate رمز/ثانية وسعة capacity (رسائل متتالية مسموحة دفعة واحدة)
+
+    مُنفَّذ بطريقة الجدولة الافتراضية: وقت الوصول النظري (tat) يغني عن تحديث عدد الرموز دورياً
+    """
+
+    def __init__(self, rate, capacity=1):
+        self.interval = 1.0 / rate
+        self.tolerance = (max(1, capacity) - 1) * self.interval
+        self.tat = 0.0
+
+    def available_at(self, now):
+        """أقرب وقت يتوفر فيه رمز"""
+        return max(now, self.tat - self.tolerance)
+
+    def consume(self, now):
+        self.tat = max(self.tat, now) + self.interval
+
+    def penalize(self, until):
+        """لا رموز قبل until (مثلاً retry_after من المزود)"""
+        self.tat = max(self.tat, until + self.tolerance)
+
+
+class RetryAfter(Exception):
+    """يرفعها مرسل القناة عند رفض المزود بسبب المعدل - تُعاد الرسالة بعد seconds ثانية"""
+
+    def __init__(self, seconds, message=''):
+        super().__init__(message or f"rate limited, retry after {seconds}s")
+        self.seconds = seconds
+
+
+class FanOutChannel:
+    """إعداد قناة توزيع
+
+    address(subscriber) يعيد عنوان المشترك في القناة (إيميل أو chat_id) أو None لتخطيه.
+    send_batch(event, [subscriber]) يعيد قائمة بنفس الترتيب: None للمرسلة أو نص الخطأ أو RetryAfter،
+    أو send(event, subscriber) لرسالة واحدة (تُرسل رسائل الدفعة بالتوازي على concurrency خيط).
+    linger: الدفعة تحجز رموز الثواني القادمة وتنتظر حتى آخرها، فتمتلئ الدفعات بعد انتهاء رصيد burst
+    """
+
+    def __init__(self, name, address, send=None, send_batch=None, rate=10, burst=10,
+                 per_chat_rate=1, per_chat_burst=1, batch_size=20, concurrency=4, max_retries=3, linger=0.0):
+        self.name = name
+        self.address = address
+        self.send = send
+        self.send_batch = send_batch
+        self.rate = rate
+        self.burst = burst
+        self.per_chat_rate = per_chat_rate
+        self.per_chat_burst = per_chat_burst
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.linger = linger
+
+
+class FanOutJob:
+    """تقدم توزيع حدث واحد - wait() ينتظر انتهاء كل رسائله و report() يعيد الإنتاجية وزمن التفريغ"""
+
+    def __init__(self, event):
+        self.event = event
+        self.created = time.monotonic()
+        self.finished = None
+        self.total = 0
+        self.counts = {}
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+
+    def _expect(self, channel, count):
+        self.total += count
+        self.counts[channel] = {'queued': count, 'sent': 0, 'failed': 0}
+
+    def _settle(self, channel, outcome):
+        with self._lock:
+            self.counts[channel][outcome] += 1
+            if sum(c['sent'] + c['failed'] for c in self.counts.values()) == self.total:
+                self.finished = time.monotonic()
+                self._done.set()
+
+    def _seal(self):
+        if self.total == 0:
+            self.finished = self.created
+            self._done.set()
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def report(self):
+        with self._lock:
+            counts = {name: dict(c) for name, c in self.counts.items()}
+            finished = self.finished
+        elapsed = (finished or time.monotonic()) - self.created
+        sent = sum(c['sent'] for c in counts.values())
+        return {
+            'recipients': self.total,
+            'channels': counts,
+            'done': finished is not None,
+            'drain_s': round(elapsed, 3) if finished is not None else None,
+            'elapsed_s': round(elapsed, 3),
+            'throughput_per_s': round(sent / elapsed, 2) if elapsed > 0 else None
+        }
+
+
+class _ChannelQueue:
+    """طابور قناة واحدة: ترتيب حسب وقت الجاهزية وخيط يفرغه دفعات ضمن حدود المعدل"""
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.provider = TokenBucket(channel.rate, channel.burst)
+        self.chats = {}
+        self.heap = []
+        self.cond = threading.Condition()
+        self.closed = False
+        self.thread = None
+        self.executor = None
+        if channel.send_batch is None:
+            self.executor = ThreadPoolExecutor(max_workers=channel.concurrency,
+                                               thread_name_prefix=f"fanout-{channel.name}")
+        self.counters = {'queued': 0, 'sent': 0, 'failed': 0, 'retried': 0, 'batches': 0,
+                         'throttled_waits': 0, 'peak_queue_depth': 0}
+        self._first_sent = None
+        self._last_sent = None
+
+    def chat_bucket(self, address):
+        bucket = self.chats.get(address)
+        if bucket is None:
+            if len(self.chats) >= MAX_TRACKED_CHATS:
+                # دلاء المحادثات الممتلئة لا تحمل أي قيد - حذفها لا يغير المعدل
+                now = time.monotonic()
+                self.chats = {key: b for key, b in self.chats.items() if b.tat > now}
+            bucket = self.chats[address] = TokenBucket(self.channel.per_chat_rate, self.channel.per_chat_burst)
+        return bucket
+
+    def take_batch(self):
+        """حجز دفعة رسائل تتوفر رموزها خلال linger ثانية
+
+        يعيد (الدفعة، الوقت الذي تُرسل فيه، مدة الانتظار قبل المحاولة التالية إن كانت الدفعة فارغة)
+        """
+        now = time.monotonic()
+        horizon = now + self.channel.linger
+        batch, send_at = [], now
+        while self.heap and len(batch) < self.channel.batch_size:
+            ready, seq, item = self.heap[0]
+            if ready > horizon:
+                break
+            chat = self.chat_bucket(item['address'])
+            chat_at = chat.available_at(max(now, ready))
+            if chat_at > horizon:
+                # هذه المحادثة تجاوزت حدها - بقية المحادثات لا تنتظرها
+                heapq.heapreplace(self.heap, (chat_at, seq, item))
+                continue
+            at = max(chat_at, self.provider.available_at(now))
+            if at > horizon:
+                break
+            heapq.heappop(self.heap)
+            self.provider.consume(at)
+            chat.consume(at)
+            send_at = max(send_at, at)
+            batch.append(item)
+        if batch or not self.heap:
+            return batch, send_at, None
+        self.counters['throttled_waits'] += 1
+        return batch, send_at, max(self.heap[0][0], self.provider.available_at(now)) - horizon
+
+
+class FanOutEngine:
+    """توزيع أحداث على مشتركين عبر عدة قنوات - لكل قناة طابور وخيط ومعدل مستقل"""
+
+    def __init__(self, channels):
+        self._queues = {channel.name: _ChannelQueue(channel) for channel in channels}
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._jobs = []
+        self.counters = {'events': 0, 'deliveries': 0, 'skipped': 0}
+
+    def fan_out(self, event, subscribers):
+        """جدولة رسالة لكل (مشترك، قناة) - العنوان المكرر في القناة نفسها يُرسل له مرة واحدة"""
+        job = FanOutJob(event)
+        subscribers = list(subscribers)
+        pending = []
+        for name, queue in self._queues.items():
+            items, seen = [], set()
+            for subscriber in subscribers:
+                address = queue.channel.address(subscriber)
+                if not address or address in seen:
+                    continue
+                seen.add(address)
+                items.append({'job': job, 'subscriber': subscriber, 'address': address, 'attempts': 0})
+            job._expect(name, len(items))
+            pending.append((queue, items))
+        with self._lock:
+            self.counters['events'] += 1
+            self.counters['deliveries'] += job.total
+            self.counters['skipped'] += len(subscribers) * len(self._queues) - job.total
+            self._jobs.append(job)
+            del self._jobs[:-20]
+        for queue, items in pending:
+            if items:
+                self._push(queue, items, time.monotonic())
+        job._seal()
+        logging.info(f"📣 توزيع تنبيه على {job.total} رسالة ({len(subscribers)} مشترك)")
+        return job
+
+    def _push(self, queue, items, ready):
+        with queue.cond:
+            for item in items:
+                heapq.heappush(queue.heap, (ready, next(self._seq), item))
+            queue.counters['queued'] += len(items)
+            queue.counters['peak_queue_depth'] = max(queue.counters['peak_queue_depth'], len(queue.heap))
+            if queue.thread is None:
+                queue.thread = threading.Thread(target=self._drain, args=(queue,),
+                                                name=f"fanout-{queue.channel.name}", daemon=True)
+                queue.thread.start()
+            queue.cond.notify_all()
+
+    def _drain(self, queue):
+        while True:
+            with queue.cond:
+                batch, send_at, wait = queue.take_batch()
+                while not batch:
+                    if queue.closed and not queue.heap:
+                        return
+                    queue.cond.wait(wait)
+                    batch, send_at, wait = queue.take_batch()
+            delay = send_at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self._send(queue, batch)
+
+    def _send(self, queue, batch):
+        channel = queue.channel
+        try:
+            if channel.send_batch is not None:
+                results = list(channel.send_batch(batch[0]['job'].event, [item['subscriber'] for item in batch]))
+            else:
+                results = list(queue.executor.map(lambda item: self._send_one(channel, item), batch))
+        except Exception as e:
+            results = [str(e) or type(e).__name__] * len(batch)
+        now = time.monotonic()
+        retry = []
+        with queue.cond:
+            queue.counters['batches'] += 1
+            for item, result in zip(batch, results):
+                if result is None:
+                    queue.counters['sent'] += 1
+                    queue._first_sent = queue._first_sent or now
+                    queue._last_sent = now
+                    item['job']._settle(channel.name, 'sent')
+                elif isinstance(result, RetryAfter) and item['attempts'] < channel.max_retries:
+                    item['attempts'] += 1
+                    queue.counters['retried'] += 1
+                    queue.provider.penalize(now + result.seconds)
+                    retry.append((now + result.seconds, item))
+                else:
+                    queue.counters['failed'] += 1
+                    item['job']._settle(channel.name, 'failed')
+                    logging.error(f"❌ فشل تنبيه {channel.name} إلى {item['address']}: {result}")
+            for ready, item in retry:
+                heapq.heappush(queue.heap, (ready, next(self._seq), item))
+
+    @staticmethod
+    def _send_one(channel, item):
+        try:
+            channel.send(item['job'].event, item['subscriber'])
+            return None
+        except RetryAfter as e:
+            return e
+        except Exception as e:
+            return str(e) or type(e).__name__
+
+    def shutdown(self, timeout=5):
+        """إيقاف خيوط القنوات بعد تفريغ ما في طوابيرها (حتى المهلة)"""
+        deadline = time.monotonic() + timeout
+        for queue in self._queues.values():
+            with queue.cond:
+                queue.closed = True
+                queue.cond.notify_all()
+        for queue in self._queues.values():
+            if queue.thread is not None:
+                queue.thread.join(max(0.0, deadline - time.monotonic()))
+            if queue.executor is not None:
+                queue.executor.shutdown(wait=False)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            jobs = list(self._jobs)
+        channels = {}
+        for name, queue in self._queues.items():
+            with queue.cond:
+                channel = dict(queue.counters, queue_depth=len(queue.heap), chats=len(queue.chats),
+                               rate=queue.channel.rate, per_chat_rate=queue.channel.per_chat_rate)
+                span = (queue._last_sent - queue._first_sent) if queue._first_sent else 0
+            channel['avg_batch_size'] = round(channel['sent'] / channel['batches'], 2) if channel['batches'] else None
+            channel['throughput_per_s'] = round(channel['sent'] / span, 2) if span > 0 else None
+            channels[name] = channel
+        stats['channels'] = channels
+        stats['recent'] = [job.report() for job in jobs[-5:]]
+        return stats
@@ -0,0 +1,221 @@
+"""
+فحص خفيف عبر HTTP قبل تشغيل المتصفح: طلبات شرطية وبصمة للمحتوى والتصعيد إلى Selenium عند التغير فقط
+Lightweight HTTP probe tier - pooled requests session, conditional GETs and content
+hashing; escalates to the Selenium probe only when the page changed or shows availability
+"""
+
+import hashlib
+import re
+import threading
+import time
+from urllib.parse import urljoin
+
+import requests
+from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+
+USER_AGENT = (
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+    '(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+)
+
+# مؤشرات توفر المواعيد بصيغة CSS (نظير SLOT_WATCH_SELECTORS دون العناصر المعطلة)
+AVAILABILITY_CSS = (
+    '[class~="available"]', '[class*="appointment-slot"]', '[class*="time-slot"]',
+    '[class*="booking-slot"]', '[data-available="true"]'
+)
+AVAILABILITY_TEXT = ('Available', 'متاح')
+
+# روابط صفحة المواعيد (نظير APPOINTMENT_BUTTON_SELECTORS)
+APPOINTMENT_HREF_KEYWORDS = ('appointment', 'booking')
+APPOINTMENT_TEXT_KEYWORDS = ('Appointment', 'موعد', 'Book', 'Schedule')
+
+# رموز متغيرة في كل تحميل (CSRF، معرفات الجلسة) تُحذف قبل حساب البصمة
+_VOLATILE_TOKEN = re.compile(r'[A-Za-z0-9_\-+/=]{24,}')
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_http_session(pool_size=10):
+    """جلسة requests مشتركة بمجمع اتصالات keep-alive لكل المراقبين"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            _session.mount('https://', adapter)
+            _session.mount('http://', adapter)
+            _session.headers.update({
+                'User-Agent': USER_AGENT,
+                'Accept': 'text/html,application/xhtml+xml',
+                'Accept-Language': 'en-US,en;q=0.9,ar;q=0.8'
+            })
+        return _session
+
+
+def content_fingerprint(soup):
+    """بصمة بنية الصفحة ونصوصها دون الحقول المخفية والرموز المتغيرة"""
+    for hidden in soup.select('input[type="hidden"], meta[name*="csrf"]'):
+        hidden.decompose()
+    parts = []
+    for element in soup.find_all(True):
+        classes = ' '.join(sorted(element.get('class') or []))
+        text = element.string.strip() if element.string else ''
+        parts.append(f"{element.name}.{classes}#{element.get('id', '')}:{text}")
+    normalized = _VOLATILE_TOKEN.sub('', '\n'.join(parts))
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+def availability_signals(soup):
+    """عدد العناصر أو النصوص التي تدل على وجود مواعيد متاحة"""
+    signals = 0
+    for css in AVAILABILITY_CSS:
+        for element in soup.select(css):
+            classes = element.get('class') or []
+            if 'disabled' not in classes and 'unavailable' not in classes:
+                signals += 1
+    for text in AVAILABILITY_TEXT:
+        signals += len(soup.find_all(string=lambda s, text=text: s and text in s and s.parent.name != 'script'))
+    return signals
+
+
+def find_appointment_link(soup, base_url):
+    for link in soup.find_all('a', href=True):
+        href = link['href']
+        if href.startswith('#') or href.startswith('javascript:'):
+            continue
+        label = link.get_text(' ', strip=True)
+        if (any(keyword in href.lower() for keyword in APPOINTMENT_HREF_KEYWORDS)
+                or any(keyword in label for keyword in APPOINTMENT_TEXT_KEYWORDS)):
+            return urljoin(base_url, href)
+    return None
+
+
+class HttpProbe:
+    """فحص صفحة المواعيد عبر HTTP وتحديد ما إذا كان يلزم فتح المتصفح
+
+    يصعّد عند: أول فحص، تغير البصمة، ظهور مؤشرات توفر، خطأ HTTP، أو مرور max_quiet
+    ثانية دون تصعيد (للمواعيد التي تظهر عبر JavaScript دون تغير HTML)
+    """
+
+    def __init__(self, base_url, session=None, timeout=15, max_quiet=300):
+        self.base_url = base_url
+        self.session = session or get_http_session()
+        self.timeout = timeout
+        self.max_quiet = max_quiet
+        self.appointment_url = None
+        self._validators = {}
+        self._fingerprint = None
+        self._signals = 0
+        self.last_escalation = 0
+        self.stats = {
+            'checks': 0,
+            'requests': 0,
+            'not_modified': 0,
+            'unchanged': 0,
+            'escalations': 0,
+            'bytes': 0,
+            'errors': 0
+        }
+
+    def _get(self, url):
+        """طلب شرطي - يعيد None عند 304 (لم يتغير)"""
+        headers = {}
+        etag, last_modified = self._validators.get(url, (None, None))
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        response = self.session.get(url, headers=headers, timeout=self.timeout)
+        self.stats['requests'] += 1
+        if response.status_code == 304:
+            self.stats['not_modified'] += 1
+            return None
+        response.raise_for_status()
+        self.stats['bytes'] += len(response.content)
+        self._validators[url] = (response.headers.get('ETag'), response.headers.get('Last-Modified'))
+        return response
+
+    def invalidate(self):
+        """نسيان البصمة السابقة حتى يُصعَّد الفحص التالي (مثلاً بعد فشل فحص المتصفح)"""
+        self._fingerprint = None
+        self._validators.clear()
+
+    def _escalate(self, reason, **details):
+        self.stats['escalations'] += 1
+        self.last_escalation = time.time()
+        return {'escalate': True, 'reason': reason, **details}
+
+    def check(self):
+        """فحص واحد - يعيد {'escalate': bool, 'reason': ..., 'signals': n}"""
+        self.stats['checks'] += 1
+        try:
+            if self.appointment_url is None:
+                home = self._get(self.base_url)
+                if home is not None:
+                    self.appointment_url = find_appointment_link(BeautifulSoup(home.text, 'html.parser'), home.url)
+                if self.appointment_url is None:
+                    return self._escalate('no_appointment_link')
+
+            response = self._get(self.appointment_url)
+        except requests.RequestException as e:
+            self.stats['errors'] += 1
+            return self._escalate('http_error', error=str(e))
+
+        if response is None:
+            # 304: نفس المحتوى السابق بمؤشراته
+            changed, signals = False, self._signals
+        else:
+            soup = BeautifulSoup(response.text, 'html.parser')
+            signals = availability_signals(soup)
+            fingerprint = content_fingerprint(soup)
+            changed = fingerprint != self._fingerprint
+            self._fingerprint, self._signals = fingerprint, signals
+
+        if signals:
+            return self._escalate('availability_signals', signals=signals)
+        if changed:
+            return self._escalate('content_changed', signals=0)
+        if time.time() - self.last_escalation >= self.max_quiet:
+            return self._escalate('max_quiet', signals=0)
+        self.stats['unchanged'] += 1
+        return {'escalate': False, 'reason': 'unchanged', 'signals': 0}
+
+
+class TieredProbe:
+    """مراقب بطبقتين للـ ObservationHub: HTTP أولاً، والمتصفح فقط عند التصعيد
+
+    browser_factory() يعيد بوت Selenium (VisaBookingBot) جاهزاً - يُعاد متصفحه إلى المجمع
+    بعد كل فحص مُصعَّد حتى لا يبقى محجوزاً بين الفحوص الهادئة
+    """
+
+    def __init__(self, http_probe, browser_factory):
+        self.http_probe = http_probe
+        self.browser_factory = browser_factory
+
+    def observe_availability(self, duration, should_continue=lambda: True):
+        result = self.http_probe.check()
+        if not result['escalate']:
+            return {'available': False, 'count': 0, 'page_found': True, 'tier': 'http',
+                    'url': self.http_probe.appointment_url}
+
+        print(f"🌐 تصعيد الفحص إلى المتصفح ({result['reason']})")
+        try:
+            browser = self.browser_factory()
+            try:
+                snapshot = browser.observe_availability(duration, should_continue)
+            finally:
+                browser.release_driver()
+        except Exception:
+            self.http_probe.invalidate()
+            raise
+        snapshot['tier'] = 'browser'
+        snapshot['escalation_reason'] = result['reason']
+        return snapshot
+
+    def release_driver(self):
+        """لا يحتفظ بمتصفح بين الفحوص"""
+
+    def stats(self):
+        return dict(self.http_probe.stats, appointment_url=self.http_probe.appointment_url)
@@ -0,0 +1,277 @@
+"""
+مجدول المهام لمراقبة المواعيد: فترات لكل مهمة، تذبذب، أولويات، إلغاء فوري، حدود تزامن وسياسات تراجع
+Job scheduler that drives all monitoring jobs from one dispatcher thread and a bounded worker pool
+"""
+
+import heapq
+import itertools
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# تعيده دالة المهمة لإنهائها دون إعادة جدولة
+JOB_DONE = object()
+
+
+class CancellationToken:
+    """رمز إلغاء تتحقق منه المهمة أثناء تنفيذها"""
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self):
+        self._event.set()
+
+    def wait(self, timeout):
+        """انتظار حتى timeout ثانية - يعيد True فور الإلغاء"""
+        return self._event.wait(timeout)
+
+
+class ExponentialBackoff:
+    """تأخير متزايد بعد كل فشل متتالٍ"""
+
+    def __init__(self, base=5, factor=2, max_delay=300):
+        self.base = base
+        self.factor = factor
+        self.max_delay = max_delay
+
+    def delay(self, failures):
+        return min(self.max_delay, self.base * (self.factor ** max(0, failures - 1)))
+
+
+class Job:
+    """مهمة مجدولة - func(token) تُستدعى كل interval ثانية (أو مرة واحدة إذا كان interval None)
+
+    interval قد يكون دالة بدون معاملات تعيد الفاصل التالي (لفواصل متغيرة)
+    """
+
+    def __init__(self, name, func, interval=None, jitter=0, priority=0, group=None,
+                 backoff=None, max_failures=None, delay=0, on_finish=None):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.jitter = jitter
+        self.priority = priority
+        self.group = group
+        self.backoff = backoff
+        self.max_failures = max_failures
+        self.initial_delay = delay
+        self.on_finish = on_finish
+
+        self.token = CancellationToken()
+        self.scheduler = None
+        self.next_run = None
+        self.running = False
+        self.done = False
+        self.runs = 0
+        self.failures = 0
+        self.last_error = None
+        self.last_duration = None
+
+    @property
+    def cancelled(self):
+        return self.token.cancelled
+
+    def next_interval(self):
+        return self.interval() if callable(self.interval) else self.interval
+
+    def cancel(self):
+        """إلغاء المهمة فوراً - المهمة الجارية تلاحظ الإلغاء عبر الرمز"""
+        self.token.cancel()
+        if self.scheduler:
+            self.scheduler._wake()
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'group': self.group,
+            'priority': self.priority,
+            'interval': self.next_interval(),
+            'running': self.running,
+            'done': self.done,
+            'cancelled': self.cancelled,
+            'runs': self.runs,
+            'failures': self.failures,
+            'last_error': self.last_error,
+            'last_duration': self.last_duration,
+            'next_run_in': round(self.next_run - time.time(), 2) if self.next_run and not self.done else None
+        }
+
+
+class JobScheduler:
+    """توزيع المهام المستحقة على عدد محدود من العمال حسب الأولوية وحدود كل مجموعة"""
+
+    def __init__(self, max_workers=8, group_limits=None):
+        self.max_workers = max_workers
+        self.group_limits = dict(group_limits or {})
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='monitor-worker')
+        self._condition = threading.Condition()
+        self._timeline = []      # (next_run, seq, job)
+        self._parked = {}        # group -> [(next_run, seq, job)] مستحقة تنتظر مكاناً في مجموعتها
+        self._jobs = set()
+        self._running = 0
+        self._group_running = {}
+        self._seq = itertools.count()
+        self._dispatcher = None
+        self._closed = False
+
+    def start(self):
+        with self._condition:
+            if self._dispatcher and self._dispatcher.is_alive():
+                return self
+            self._closed = False
+            self._dispatcher = threading.Thread(target=self._dispatch_loop, name='job-dispatcher', daemon=True)
+            self._dispatcher.start()
+        return self
+
+    def submit(self, job):
+        """إضافة مهمة - تبدأ فوراً ما لم يُحدد تأخير"""
+        self.start()
+        with self._condition:
+            job.scheduler = self
+            self._jobs.add(job)
+            self._push(job, time.time() + job.initial_delay)
+            self._condition.notify()
+        return job
+
+    def shutdown(self, wait=True):
+        """إلغاء جميع المهام وإيقاف العمال"""
+        with self._condition:
+            self._closed = True
+            jobs = list(self._jobs)
+            self._condition.notify_all()
+        for job in jobs:
+            job.token.cancel()
+        self._executor.shutdown(wait=wait)
+
+    def stats(self):
+        with self._condition:
+            jobs = list(self._jobs)
+            return {
+                'workers': self.max_workers,
+                'running': self._running,
+                'group_running': dict(self._group_running),
+                'group_limits': dict(self.group_limits),
+                'parked': {group: len(entries) for group, entries in self._parked.items() if entries},
+                'jobs': [job.to_dict() for job in jobs]
+            }
+
+    def _wake(self):
+        with self._condition:
+            self._condition.notify()
+
+    def _push(self, job, next_run):
+        job.next_run = next_run
+        heapq.heappush(self._timeline, (next_run, next(self._seq), job))
+
+    def _group_has_capacity(self, job):
+        limit = self.group_limits.get(job.group)
+        return limit is None or self._group_running.get(job.group, 0) < limit
+
+    def _finish(self, job):
+        """إنهاء المهمة نهائياً (يُستدعى والقفل محجوز)"""
+        if job.done:
+            return
+        job.done = True
+        self._jobs.discard(job)
+        if job.on_finish:
+            threading.Thread(target=self._run_on_finish, args=(job,), daemon=True).start()
+
+    def _run_on_finish(self, job):
+        try:
+            job.on_finish(job)
+        except Exception as e:
+            print(f"⚠️ خطأ في إنهاء المهمة {job.name}: {e}")
+
+    def _dispatch_loop(self):
+        with self._condition:
+            while not self._closed:
+                now = time.time()
+
+                # إعادة المهام المركونة إلى الجدول عند تحرر مكان في مجموعتها
+                for group in [group for group, entries in self._parked.items() if entries]:
+                    limit = self.group_limits.get(group)
+                    if limit is None or self._group_running.get(group, 0) < limit:
+                        for entry in self._parked.pop(group):
+                            heapq.heappush(self._timeline, entry)
+
+                # المهام المستحقة الآن مرتبة حسب الأولوية ثم الموعد
+                due = []
+                while self._timeline and self._timeline[0][0] <= now:
+                    next_run, seq, job = heapq.heappop(self._timeline)
+                    if job.cancelled:
+                        self._finish(job)
+                        continue
+                    due.append((-job.priority, next_run, seq, job))
+                due.sort(key=lambda item: item[:3])
+
+                for _, next_run, seq, job in due:
+                    if self._running < self.max_workers and self._group_has_capacity(job):
+                        self._running += 1
+                        self._group_running[job.group] = self._group_running.get(job.group, 0) + 1
+                        job.running = True
+                        self._executor.submit(self._execute, job)
+                    elif not self._group_has_capacity(job):
+                        # تُركن خارج الجدول حتى لا تحجب مهام المجموعات الأخرى التي يحين موعدها
+                        self._parked.setdefault(job.group, []).append((next_run, seq, job))
+                    else:
+                        # تبقى في الانتظار حتى يتحرر عامل
+                        heapq.heappush(self._timeline, (next_run, seq, job))
+
+                # إزالة المهام الملغاة المنتظرة فوراً
+                cancelled = [entry for entry in self._timeline if entry[2].cancelled]
+                if cancelled:
+                    for _, _, job in cancelled:
+                        self._finish(job)
+                    self._timeline = [entry for entry in self._timeline if not entry[2].cancelled]
+                    heapq.heapify(self._timeline)
+                for group, entries in self._parked.items():
+                    for _, _, job in entries:
+                        if job.cancelled:
+                            self._finish(job)
+                    entries[:] = [entry for entry in entries if not entry[2].cancelled]
+
+                # بدون مهلة: لا توجد مهام أو المستحقة بانتظار تحرر عامل (يوقظنا _execute)
+                timeout = None
+                if self._timeline and self._timeline[0][0] > now:
+                    timeout = self._timeline[0][0] - now
+                self._condition.wait(timeout)
+
+    def _execute(self, job):
+        started = time.time()
+        result = None
+        failed = False
+        try:
+            result = job.func(job.token)
+            job.failures = 0
+            job.last_error = None
+        except Exception as e:
+            failed = True
+            job.failures += 1
+            job.last_error = str(e)
+            print(f"❌ فشل المهمة {job.name} (المرة {job.failures}): {e}")
+
+        with self._condition:
+            job.runs += 1
+            job.running = False
+            job.last_duration = round(time.time() - started, 3)
+            self._running -= 1
+            self._group_running[job.group] -= 1
+
+            if self._closed or job.cancelled or result is JOB_DONE:
+                self._finish(job)
+            elif failed and job.max_failures is not None and job.failures >= job.max_failures:
+                self._finish(job)
+            elif failed and (job.backoff or job.interval is not None):
+                delay = job.backoff.delay(job.failures) if job.backoff else job.next_interval()
+                self._push(job, time.time() + delay + random.uniform(0, job.jitter))
+            elif job.interval is not None:
+                self._push(job, time.time() + job.next_interval() + random.uniform(0, job.jitter))
+            else:
+                self._finish(job)
+            self._condition.notify()
@@ -0,0 +1,115 @@
+"""
+إرسال الإشعارات عبر كل القنوات في الوقت نفسه
+Concurrent multi-channel notification dispatch - every channel runs on a shared worker
+pool with its own deadline, so total latency is the slowest channel instead of the sum;
+HTTP channels share one keep-alive session
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+import requests
+from requests.adapters import HTTPAdapter
+
+_api_session = None
+_api_session_lock = threading.Lock()
+
+
+def get_api_session(pool_size=10):
+    """جلسة requests مشتركة بمجمع اتصالات keep-alive لواجهات الإشعارات (تيليجرام وغيرها)"""
+    global _api_session
+    with _api_session_lock:
+        if _api_session is None:
+            _api_session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            _api_session.mount('https://', adapter)
+            _api_session.mount('http://', adapter)
+        return _api_session
+
+
+class ChannelDispatcher:
+    """تشغيل دوال القنوات بالتوازي وانتظار كل قناة حتى مهلتها فقط
+
+    القناة التي تتجاوز مهلتها تُحسب فاشلة ويستمر خيطها في الخلفية حتى تنتهي مهلة اتصالها،
+    ومن يحتاج نتيجتها الفعلية (مثل عامل الصندوق قبل إعادة المحاولة) يمرر on_timeout
+    """
+
+    def __init__(self, max_workers=8):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='notify-channel')
+        self._lock = threading.Lock()
+        self._channels = {}
+        self.counters = {'dispatches': 0, 'wall_ms_total': 0.0, 'sequential_ms_total': 0.0}
+
+    @staticmethod
+    def _timed(send):
+        started = time.perf_counter()
+        ok = send()
+        return ok, (time.perf_counter() - started) * 1000
+
+    def dispatch(self, channels, on_timeout=None):
+        """channels: {name: (send, timeout)} حيث send() يعيد True عند النجاح - يعيد {name: bool}
+
+        on_timeout(name, future) يُستدعى لكل قناة تجاوزت مهلتها وما زال إرسالها جارياً،
+        و future.result() يعيد (نتيجة send، الزمن بالملي ثانية) عند انتهائه
+        """
+        started = time.perf_counter()
+        futures = {name: (self._executor.submit(self._timed, send), timeout)
+                   for name, (send, timeout) in channels.items()}
+        results = {}
+        elapsed = {}
+        for name, (future, timeout) in futures.items():
+            remaining = max(0.0, started + timeout - time.perf_counter())
+            try:
+                ok, elapsed[name] = future.result(timeout=remaining)
+                results[name] = bool(ok)
+                self._record(name, 'sent' if ok else 'failed', elapsed[name])
+            except FutureTimeout:
+                results[name] = False
+                elapsed[name] = timeout * 1000
+                self._record(name, 'timeouts', elapsed[name])
+                logging.warning(f"⏱️ تجاوزت قناة {name} مهلتها ({timeout} ثانية)")
+                if on_timeout is not None:
+                    on_timeout(name, future)
+            except Exception as e:
+                results[name] = False
+                elapsed[name] = (time.perf_counter() - started) * 1000
+                self._record(name, 'failed', elapsed[name])
+                logging.error(f"❌ خطأ في قناة {name}: {e}")
+        wall_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self.counters['dispatches'] += 1
+            self.counters['wall_ms_total'] += wall_ms
+            self.counters['sequential_ms_total'] += sum(elapsed.values())
+        logging.info(f"📨 انتهت كل القنوات خلال {wall_ms:.0f}ms (مجموع أزمنتها {sum(elapsed.values()):.0f}ms)")
+        return results
+
+    def _record(self, name, outcome, elapsed_ms):
+        with self._lock:
+            channel = self._channels.setdefault(
+                name, {'sent': 0, 'failed': 0, 'timeouts': 0, 'total_ms': 0.0, 'max_ms': 0.0}
+            )
+            channel[outcome] += 1
+            channel['total_ms'] += elapsed_ms
+            channel['max_ms'] = max(channel['max_ms'], elapsed_ms)
+
+    def stats(self):
+        with self._lock:
+            dispatches = self.counters['dispatches']
+            channels = {}
+            for name, channel in self._channels.items():
+                count = channel['sent'] + channel['failed'] + channel['timeouts']
+                channels[name] = dict(
+                    channel, total_ms=round(channel['total_ms'], 1), max_ms=round(channel['max_ms'], 1),
+                    avg_ms=round(channel['total_ms'] / count, 1) if count else None
+                )
+            return {
+                'dispatches': dispatches,
+                'avg_wall_ms': round(self.counters['wall_ms_total'] / dispatches, 1) if dispatches else None,
+                'avg_sequential_ms': round(self.counters['sequential_ms_total'] / dispatches, 1) if dispatches else None,
+                'channels': channels
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
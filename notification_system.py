@@ -3,15 +3,18 @@
 يدعم الإشعارات عبر الإيميل وتيليجرام مع تسجيل مفصل
 """
 
-import smtplib
-import requests
+import atexit
 import json
 import os
 from datetime import datetime
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-import sqlite3
 import logging
+from storage import booking_id_for, get_storage
+from write_behind import WriteBehindBuffer
+from smtp_pool import SMTPPool
+from notification_dispatch import ChannelDispatcher, get_api_session
+from outbox import OutboxWorker
+from fanout import FanOutChannel, FanOutEngine, RetryAfter
+from notification_templates import NotificationTemplates, now_text
 
 # إعداد نظام التسجيل
 logging.basicConfig(
@@ -28,163 +31,154 @@ class NotificationSystem:
         """تهيئة نظام الإشعارات"""
         self.setup_database()
         
+        # قوالب الإيميل وتيليجرام تُجهز مرة واحدة
+        self.templates = NotificationTemplates()
+        
         # إعدادات الإيميل
         self.smtp_server = os.environ.get('SMTP_SERVER', 'smtp.gmail.com')
         self.smtp_port = int(os.environ.get('SMTP_PORT', '587'))
         self.email_user = os.environ.get('EMAIL_USER', '')
         self.email_password = os.environ.get('EMAIL_PASSWORD', '')
+        self.email_timeout = float(os.environ.get('NOTIFY_EMAIL_TIMEOUT', '20'))
+        
+        # اتصالات SMTP مصادق عليها تبقى مفتوحة بين الرسائل بدلاً من اتصال جديد لكل إيميل
+        self.smtp_pool = SMTPPool(
+            self.smtp_server, self.smtp_port, self.email_user, self.email_password,
+            size=int(os.environ.get('SMTP_POOL_SIZE', '2')),
+            idle_timeout=int(os.environ.get('SMTP_IDLE_TIMEOUT', '60')),
+            timeout=self.email_timeout,
+            use_starttls=os.environ.get('SMTP_STARTTLS', '1') != '0'
+        )
+        atexit.register(self.smtp_pool.close)
         
         # إعدادات تيليجرام
         self.telegram_bot_token = os.environ.get('TELEGRAM_BOT_TOKEN', '')
         self.telegram_chat_id = os.environ.get('TELEGRAM_CHAT_ID', '')
         
+        self.telegram_timeout = float(os.environ.get('NOTIFY_TELEGRAM_TIMEOUT', '10'))
+        self.http = get_api_session()
+        
+        # القنوات تُرسل بالتوازي، ولكل قناة مهلة مستقلة
+        self.dispatcher = ChannelDispatcher()
+        
+        # صندوق الإشعارات: الرسائل تُحفظ مع سجل الحجز وتُرسل من عامل في الخلفية مع إعادة المحاولة (0 لإيقافه)
+        self.outbox = None
+        if self.storage is not None and os.environ.get('OUTBOX', '1') != '0':
+            self.outbox = OutboxWorker(
+                self.storage.outbox,
+                {
+                    'email': (lambda payload, key: self.send_email_notification(
+                        payload['user_data'], payload['booking_details'], message_id=key
+                    ) and self.email_message_id(key), self.email_timeout),
+                    'telegram': (lambda payload, key: self.post_telegram(self.templates.booking_telegram.render(
+                        self.templates.booking_values(payload['user_data'], payload['booking_details'])
+                    )), self.telegram_timeout)
+                },
+                self.dispatcher,
+                on_delivered=self.record_delivery,
+                poll_interval=float(os.environ.get('OUTBOX_POLL_INTERVAL', '5')),
+                max_attempts=int(os.environ.get('OUTBOX_MAX_ATTEMPTS', '6'))
+            ).start()
+            if self.writer is not None:
+                self.writer.on_commit = self.outbox.wake
+            atexit.register(self.outbox.stop)
+        
+        # توزيع تنبيهات المواعيد على كل المشتركين ضمن حدود معدل كل مزود وكل محادثة
+        batch_size = int(os.environ.get('FANOUT_BATCH_SIZE', '20'))
+        per_chat_rate = float(os.environ.get('FANOUT_PER_CHAT_RATE', '1'))
+        linger = int(os.environ.get('FANOUT_LINGER_MS', '250')) / 1000
+        self.fanout = FanOutEngine([
+            FanOutChannel(
+                'email', lambda subscriber: subscriber.get('email') if self.email_user and self.email_password else None,
+                send_batch=self.send_slot_alert_emails,
+                rate=float(os.environ.get('FANOUT_EMAIL_RATE', '5')),
+                burst=int(os.environ.get('FANOUT_EMAIL_BURST', '10')),
+                per_chat_rate=per_chat_rate, batch_size=batch_size, linger=linger
+            ),
+            FanOutChannel(
+                'telegram', lambda subscriber: subscriber.get('telegram_chat_id') if self.telegram_bot_token else None,
+                send=self.send_slot_alert_telegram,
+                rate=float(os.environ.get('FANOUT_TELEGRAM_RATE', '25')),
+                burst=int(os.environ.get('FANOUT_TELEGRAM_BURST', '25')),
+                per_chat_rate=per_chat_rate, batch_size=batch_size, linger=linger,
+                concurrency=int(os.environ.get('FANOUT_TELEGRAM_CONCURRENCY', '4'))
+            )
+        ])
+        atexit.register(self.fanout.shutdown)
+        
         logging.info("🔧 تم تهيئة نظام الإشعارات")
     
     def setup_database(self):
-        """إعداد قاعدة بيانات الإشعارات"""
+        """إعداد قاعدة بيانات الإشعارات (طبقة التخزين المشتركة مع تطبيق الحجز)"""
+        self.writer = None
         try:
-            conn = sqlite3.connect('notifications.db')
-            cursor = conn.cursor()
-            
-            # إنشاء جدول booking_logs للتوافق مع باقي النظام
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS booking_logs (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    booking_date TEXT NOT NULL,
-                    full_name TEXT NOT NULL,
-                    passport_number TEXT,
-                    email TEXT,
-                    phone TEXT,
-                    visa_type TEXT,
-                    nationality TEXT,
-                    booking_id TEXT,
-                    status TEXT DEFAULT 'SUCCESS'
+            self.storage = get_storage()
+            
+            # كتابة السجل في الخلفية بدفعات بدلاً من الكتابة المتزامنة بعد تأكيد الحجز (0 لإيقافها)
+            if os.environ.get('WRITE_BEHIND', '1') != '0':
+                self.writer = WriteBehindBuffer(
+                    self.storage.notifications,
+                    max_batch=int(os.environ.get('WRITE_BEHIND_MAX_BATCH', '200')),
+                    linger=int(os.environ.get('WRITE_BEHIND_LINGER_MS', '50')) / 1000
                 )
-            ''')
-            
-            # إنشاء جدول notification_status لتتبع حالة الإشعارات
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS notification_status (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    booking_id TEXT NOT NULL,
-                    email_sent BOOLEAN DEFAULT 0,
-                    telegram_sent BOOLEAN DEFAULT 0,
-                    whatsapp_sent BOOLEAN DEFAULT 0,
-                    created_at TEXT NOT NULL
-                )
-            ''')
-            
-            # إنشاء جدول booking_notifications للتوافق مع الكود الموجود
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS booking_notifications (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    booking_id TEXT,
-                    user_name TEXT,
-                    user_email TEXT,
-                    visa_type TEXT,
-                    appointment_date TEXT,
-                    booking_status TEXT,
-                    notification_sent BOOLEAN DEFAULT FALSE,
-                    email_sent BOOLEAN DEFAULT FALSE,
-                    telegram_sent BOOLEAN DEFAULT FALSE,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    notification_details TEXT
-                )
-            ''')
-            
-            conn.commit()
-            conn.close()
+                atexit.register(self.writer.close)
             logging.info("✅ تم إعداد قاعدة بيانات الإشعارات")
             
         except Exception as e:
+            self.storage = None
             logging.error(f"❌ خطأ في إعداد قاعدة البيانات: {e}")
     
-    def send_email_notification(self, user_data, booking_details):
+    def flush_writes(self, timeout=5):
+        """انتظار كتابة السجلات المؤجلة قبل القراءة من قاعدة البيانات"""
+        if self.writer is not None:
+            self.writer.flush(timeout)
+    
+    def write_stats(self):
+        """عمق طابور الكتابة المؤجلة وزمن كتابة الدفعات"""
+        return self.writer.stats() if self.writer is not None else {'enabled': False}
+    
+    def outbox_stats(self):
+        """عدد رسائل صندوق الإشعارات حسب حالتها وعدادات العامل"""
+        return self.outbox.stats() if self.outbox is not None else {'enabled': False}
+    
+    def configured_channels(self):
+        """القنوات المضبوطة بياناتها - لا تُضاف رسائل لقناة غير مضبوطة إلى الصندوق"""
+        channels = []
+        if self.email_user and self.email_password:
+            channels.append('email')
+        if self.telegram_bot_token and self.telegram_chat_id:
+            channels.append('telegram')
+        return channels
+    
+    def record_delivery(self, booking_id, notification_key):
+        """تحديث حالة إشعارات الحجز من حالة رسائله في الصندوق (يستدعيه العامل)"""
+        state = self.storage.outbox.delivery_state(notification_key)
+        self.storage.notifications.update_notification_status(
+            booking_id, state.get('email') == 'sent', state.get('telegram') == 'sent', False, notification_key
+        )
+    
+    def build_email_message(self, user_data, booking_details, message_id=None):
+        """إنشاء رسالة إيميل تأكيد الحجز - message_id (مفتاح الصندوق) يجعل Message-ID ثابتاً بين المحاولات"""
+        return self.templates.booking_email.message(
+            self.templates.booking_values(user_data, booking_details),
+            self.email_user, user_data.get('email', ''),
+            self.email_message_id(message_id) if message_id else None
+        )
+    
+    @staticmethod
+    def email_message_id(key):
+        """ترويسة Message-ID الثابتة لمفتاح رسالة الصندوق"""
+        return f"<{key.replace(':', '.')}@spain-visa-booking>"
+    
+    def send_email_notification(self, user_data, booking_details, message_id=None):
         """إرسال إشعار عبر الإيميل"""
         try:
             if not self.email_user or not self.email_password:
                 logging.warning("⚠️ بيانات الإيميل غير مكتملة")
                 return False
             
-            # إنشاء الرسالة
-            msg = MIMEMultipart('alternative')
-            msg['From'] = self.email_user
-            msg['To'] = user_data.get('email', '')
-            msg['Subject'] = "🎉 تأكيد حجز موعد فيزا إسبانيا - Spain Visa Appointment Confirmed"
-            
-            # محتوى الرسالة بالعربية والإنجليزية
-            html_content = f"""
-            <!DOCTYPE html>
-            <html dir="rtl" lang="ar">
-            <head>
-                <meta charset="UTF-8">
-                <style>
-                    body {{ font-family: Arial, sans-serif; margin: 20px; background-color: #f5f5f5; }}
-                    .container {{ background-color: white; padding: 30px; border-radius: 10px; box-shadow: 0 2px 10px rgba(0,0,0,0.1); }}
-                    .header {{ background-color: #28a745; color: white; padding: 20px; text-align: center; border-radius: 5px; margin-bottom: 20px; }}
-                    .success-icon {{ font-size: 48px; margin-bottom: 10px; }}
-                    .details {{ background-color: #f8f9fa; padding: 15px; border-radius: 5px; margin: 15px 0; }}
-                    .footer {{ text-align: center; margin-top: 30px; color: #666; }}
-                    .english {{ direction: ltr; text-align: left; margin-top: 30px; border-top: 2px solid #eee; padding-top: 20px; }}
-                </style>
-            </head>
-            <body>
-                <div class="container">
-                    <div class="header">
-                        <div class="success-icon">🎉</div>
-                        <h1>تم حجز موعدك بنجاح!</h1>
-                        <p>Your Spain Visa Appointment Has Been Successfully Booked!</p>
-                    </div>
-                    
-                    <div class="details">
-                        <h3>📋 تفاصيل الحجز - Booking Details:</h3>
-                        <p><strong>الاسم الكامل - Full Name:</strong> {user_data.get('full_name', 'غير محدد')}</p>
-                        <p><strong>رقم الجواز - Passport Number:</strong> {user_data.get('passport_number', 'غير محدد')}</p>
-                        <p><strong>نوع الفيزا - Visa Type:</strong> {user_data.get('visa_type', 'فيزا دراسة')}</p>
-                        <p><strong>المدينة - City:</strong> {user_data.get('preferred_city', 'غير محدد')}</p>
-                        <p><strong>تاريخ الحجز - Booking Date:</strong> {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</p>
-                        <p><strong>معرف الحجز - Booking ID:</strong> {booking_details.get('booking_id', 'AUTO-' + str(int(datetime.now().timestamp())))}</p>
-                    </div>
-                    
-                    <div class="details">
-                        <h3>📧 معلومات الاتصال - Contact Information:</h3>
-                        <p><strong>البريد الإلكتروني - Email:</strong> {user_data.get('email', 'غير محدد')}</p>
-                        <p><strong>رقم الهاتف - Phone:</strong> {user_data.get('phone_number', 'غير محدد')}</p>
-                        <p><strong>واتساب - WhatsApp:</strong> {user_data.get('whatsapp_number', 'غير محدد')}</p>
-                    </div>
-                    
-                    <div class="details">
-                        <h3>⚠️ ملاحظات مهمة - Important Notes:</h3>
-                        <ul>
-                            <li>يرجى التحقق من بريدك الإلكتروني للحصول على تأكيد رسمي من BLS Spain</li>
-                            <li>Please check your email for official confirmation from BLS Spain</li>
-                            <li>احتفظ بهذا الإيميل كدليل على الحجز</li>
-                            <li>Keep this email as proof of booking</li>
-                            <li>في حالة عدم وصول التأكيد الرسمي خلال 24 ساعة، يرجى التواصل معنا</li>
-                            <li>If you don't receive official confirmation within 24 hours, please contact us</li>
-                        </ul>
-                    </div>
-                    
-                    <div class="footer">
-                        <p>🤖 تم إرسال هذا الإشعار تلقائياً بواسطة نظام حجز فيزا إسبانيا</p>
-                        <p>This notification was sent automatically by Spain Visa Booking System</p>
-                        <p>⏰ وقت الإرسال: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</p>
-                    </div>
-                </div>
-            </body>
-            </html>
-            """
-            
-            # إرفاق المحتوى
-            html_part = MIMEText(html_content, 'html', 'utf-8')
-            msg.attach(html_part)
-            
-            # إرسال الإيميل
-            server = smtplib.SMTP(self.smtp_server, self.smtp_port)
-            server.starttls()
-            server.login(self.email_user, self.email_password)
-            server.send_message(msg)
-            server.quit()
+            # إرسال الإيميل عبر اتصال من المجمع
+            self.smtp_pool.send(self.build_email_message(user_data, booking_details, message_id))
             
             logging.info(f"✅ تم إرسال إشعار الإيميل إلى: {user_data.get('email')}")
             return True
@@ -193,6 +187,28 @@ class NotificationSystem:
             logging.error(f"❌ خطأ في إرسال الإيميل: {e}")
             return False
     
+    def send_email_notifications(self, entries):
+        """إرسال عدة إيميلات تأكيد دفعة واحدة - entries: [(user_data, booking_details)]
+
+        الرسائل توزع على اتصالات المجمع وتُرسل عدة رسائل على كل اتصال
+        """
+        entries = list(entries)
+        if not self.email_user or not self.email_password:
+            logging.warning("⚠️ بيانات الإيميل غير مكتملة")
+            return [False] * len(entries)
+        
+        # القوالب تُملأ دفعة واحدة بوقت إرسال واحد
+        now = now_text()
+        errors = self.smtp_pool.send_many(self.templates.booking_email.messages(
+            [self.templates.booking_values(user_data, booking_details, now) for user_data, booking_details in entries],
+            self.email_user, [user_data.get('email', '') for user_data, _ in entries]
+        ))
+        for (user_data, _), error in zip(entries, errors):
+            if error:
+                logging.error(f"❌ خطأ في إرسال الإيميل إلى {user_data.get('email')}: {error}")
+        logging.info(f"📧 تم إرسال {sum(1 for error in errors if error is None)}/{len(entries)} إيميل")
+        return [error is None for error in errors]
+    
     def send_telegram_notification(self, user_data, booking_details):
         """إرسال إشعار عبر تيليجرام"""
         try:
@@ -200,95 +216,82 @@ class NotificationSystem:
                 logging.warning("⚠️ بيانات تيليجرام غير مكتملة")
                 return False
             
-            # إنشاء الرسالة
-            message = f"""
-🎉 *تأكيد حجز موعد فيزا إسبانيا*
-✅ *Spain Visa Appointment Confirmed*
-
-📋 *تفاصيل الحجز:*
-👤 الاسم: `{user_data.get('full_name', 'غير محدد')}`
-🛂 رقم الجواز: `{user_data.get('passport_number', 'غير محدد')}`
-📄 نوع الفيزا: `{user_data.get('visa_type', 'فيزا دراسة')}`
-🏙️ المدينة: `{user_data.get('preferred_city', 'غير محدد')}`
-📅 تاريخ الحجز: `{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}`
-🆔 معرف الحجز: `{booking_details.get('booking_id', 'AUTO-' + str(int(datetime.now().timestamp())))}`
-
-📧 *معلومات الاتصال:*
-✉️ الإيميل: `{user_data.get('email', 'غير محدد')}`
-📱 الهاتف: `{user_data.get('phone_number', 'غير محدد')}`
-💬 واتساب: `{user_data.get('whatsapp_number', 'غير محدد')}`
-
-⚠️ *ملاحظة مهمة:*
-يرجى التحقق من بريدك الإلكتروني للحصول على التأكيد الرسمي من BLS Spain
-
-🤖 تم الإرسال تلقائياً بواسطة نظام حجز فيزا إسبانيا
-            """
-            
-            # إرسال الرسالة
-            url = f"https://api.telegram.org/bot{self.telegram_bot_token}/sendMessage"
-            data = {
-                'chat_id': self.telegram_chat_id,
-                'text': message,
-                'parse_mode': 'Markdown'
-            }
-            
-            response = requests.post(url, data=data)
-            
-            if response.status_code == 200:
-                logging.info("✅ تم إرسال إشعار تيليجرام بنجاح")
-                return True
-            else:
-                logging.error(f"❌ فشل إرسال تيليجرام: {response.text}")
-                return False
+            # إنشاء الرسالة وإرسالها
+            message = self.templates.booking_telegram.render(self.templates.booking_values(user_data, booking_details))
+            return bool(self.post_telegram(message))
                 
         except Exception as e:
             logging.error(f"❌ خطأ في إرسال تيليجرام: {e}")
             return False
     
-    def log_booking_success(self, user_data, booking_details):
-        """تسجيل نجاح الحجز في قاعدة البيانات"""
+    def post_telegram(self, message):
+        """إرسال رسالة تيليجرام إلى المحادثة المضبوطة - يعيد message_id عند النجاح أو None"""
+        if not self.telegram_bot_token or not self.telegram_chat_id:
+            logging.warning("⚠️ بيانات تيليجرام غير مكتملة")
+            return None
+        url = f"https://api.telegram.org/bot{self.telegram_bot_token}/sendMessage"
+        data = {
+            'chat_id': self.telegram_chat_id,
+            'text': message,
+            'parse_mode': 'Markdown'
+        }
+        
+        response = self.http.post(url, data=data, timeout=self.telegram_timeout)
+        
+        if response.status_code == 200:
+            logging.info("✅ تم إرسال إشعار تيليجرام بنجاح")
+            try:
+                return response.json().get('result', {}).get('message_id') or True
+            except ValueError:
+                return True
+        logging.error(f"❌ فشل إرسال تيليجرام: {response.text}")
+        return None
+    
+    def build_slot_alert_email(self, event, subscriber):
+        """إيميل تنبيه بتوفر مواعيد لمشترك واحد"""
+        return self.templates.slot_alert_email.message(
+            self.templates.slot_alert_values(event), self.email_user, subscriber.get('email', '')
+        )
+    
+    def send_slot_alert_emails(self, event, subscribers):
+        """دفعة إيميلات تنبيه عبر مجمع SMTP - يعيد None للمرسلة أو نص الخطأ
+
+        جسم التنبيه واحد لكل المشتركين، فيُرمَّز جزء MIME مرة واحدة للدفعة
+        """
+        values = self.templates.slot_alert_values(event)
+        return self.smtp_pool.send_many(self.templates.slot_alert_email.messages(
+            [values] * len(subscribers), self.email_user, [subscriber.get('email', '') for subscriber in subscribers]
+        ))
+    
+    def send_slot_alert_telegram(self, event, subscriber):
+        """تنبيه تيليجرام لمحادثة المشترك - يرفع RetryAfter عند تجاوز حد المعدل (429)"""
+        response = self.http.post(
+            f"https://api.telegram.org/bot{self.telegram_bot_token}/sendMessage",
+            data={'chat_id': subscriber['telegram_chat_id'], 'text': self.templates.slot_alert_telegram.render(self.templates.slot_alert_values(event))},
+            timeout=self.telegram_timeout
+        )
+        if response.status_code == 429:
+            try:
+                retry_after = response.json().get('parameters', {}).get('retry_after', 1)
+            except ValueError:
+                retry_after = 1
+            raise RetryAfter(retry_after)
+        if response.status_code != 200:
+            raise RuntimeError(f"Telegram {response.status_code}: {response.text[:200]}")
+    
+    def send_slot_alert(self, event, subscribers):
+        """توزيع تنبيه توفر مواعيد على المشتركين - يعيد FanOutJob (wait() و report())"""
+        return self.fanout.fan_out(event, subscribers)
+    
+    def log_booking_success(self, user_data, booking_details, channels=()):
+        """تسجيل نجاح الحجز في قاعدة البيانات - مع رسائل channels في صندوق الإشعارات في المعاملة نفسها"""
         try:
-            conn = sqlite3.connect('notifications.db')
-            cursor = conn.cursor()
-            
-            booking_id = booking_details.get('booking_id', 'AUTO-' + str(int(datetime.now().timestamp())))
-            
-            # إدراج في جدول booking_logs
-            cursor.execute('''
-                INSERT INTO booking_logs 
-                (booking_date, full_name, passport_number, email, phone, 
-                 visa_type, nationality, booking_id, status)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                user_data.get('full_name', ''),
-                user_data.get('passport_number', ''),
-                user_data.get('email', ''),
-                user_data.get('phone_number', ''),
-                user_data.get('visa_type', 'فيزا دراسة'),
-                user_data.get('nationality', ''),
-                booking_id,
-                'SUCCESS'
-            ))
-            
-            # إدراج في جدول booking_notifications للتوافق
-            cursor.execute('''
-                INSERT INTO booking_notifications 
-                (booking_id, user_name, user_email, visa_type, appointment_date, 
-                 booking_status, notification_details)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                booking_id,
-                user_data.get('full_name', ''),
-                user_data.get('email', ''),
-                user_data.get('visa_type', 'فيزا دراسة'),
-                datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                'SUCCESS',
-                json.dumps(booking_details, ensure_ascii=False)
-            ))
-            
-            conn.commit()
-            conn.close()
+            if self.writer is not None:
+                booking_id = self.writer.log_booking(user_data, booking_details, channels)
+            else:
+                booking_id = self.storage.notifications.log_booking(user_data, booking_details, channels)
+                if channels and self.outbox is not None:
+                    self.outbox.wake()
             
             logging.info(f"✅ تم تسجيل نجاح الحجز: {booking_id}")
             return True
@@ -312,47 +315,35 @@ class NotificationSystem:
             'logged': False
         }
         
-        # إرسال الإيميل
-        results['email_sent'] = self.send_email_notification(user_data, booking_details)
+        if self.outbox is not None:
+            # الرسائل تُحفظ مع سجل الحجز ويرسلها عامل الصندوق - لا تضيع إذا فشلت قناة أو توقفت العملية
+            channels = self.configured_channels()
+            booking_details = dict(booking_details, booking_id=booking_id_for(booking_details))
+            results['logged'] = self.log_booking_success(user_data, booking_details, channels)
+            results['email_queued'] = results['logged'] and 'email' in channels
+            results['telegram_queued'] = results['logged'] and 'telegram' in channels
+            logging.info(f"📥 أُضيفت {len(channels)} رسالة إلى صندوق الإشعارات للحجز {booking_details['booking_id']}")
+            return results
         
-        # إرسال تيليجرام
-        results['telegram_sent'] = self.send_telegram_notification(user_data, booking_details)
-        
-        # تسجيل في قاعدة البيانات
+        # تسجيل في قاعدة البيانات أولاً (طابور في الذاكرة) حتى لا يتأخر بسبب قناة بطيئة
         results['logged'] = self.log_booking_success(user_data, booking_details)
         
+        # إرسال الإيميل وتيليجرام في الوقت نفسه - الزمن الكلي هو زمن أبطأ قناة
+        sent = self.dispatcher.dispatch({
+            'email': (lambda: self.send_email_notification(user_data, booking_details), self.email_timeout),
+            'telegram': (lambda: self.send_telegram_notification(user_data, booking_details), self.telegram_timeout)
+        })
+        results['email_sent'] = sent['email']
+        results['telegram_sent'] = sent['telegram']
+        
         # تحديث حالة الإشعارات في قاعدة البيانات
         try:
-            conn = sqlite3.connect('notifications.db')
-            cursor = conn.cursor()
-            
-            # تحديث جدول notification_status
-            cursor.execute('''
-                INSERT OR REPLACE INTO notification_status 
-                (booking_id, email_sent, telegram_sent, whatsapp_sent, created_at)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (
+            (self.writer or self.storage.notifications).update_notification_status(
                 booking_details['booking_id'],
                 results['email_sent'],
                 results['telegram_sent'],
-                False,  # whatsapp_sent - سيتم تحديثه لاحقاً
-                datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            ))
-            
-            # تحديث جدول booking_notifications للتوافق
-            cursor.execute('''
-                UPDATE booking_notifications 
-                SET email_sent = ?, telegram_sent = ?, notification_sent = ?
-                WHERE booking_id = ?
-            ''', (
-                results['email_sent'],
-                results['telegram_sent'],
-                results['email_sent'] or results['telegram_sent'],
-                booking_details['booking_id']
-            ))
-            
-            conn.commit()
-            conn.close()
+                False  # whatsapp_sent - سيتم تحديثه لاحقاً
+            )
             
         except Exception as e:
             logging.error(f"❌ خطأ في تحديث حالة الإشعارات: {e}")
@@ -373,29 +364,8 @@ class NotificationSystem:
     def get_booking_stats(self):
         """الحصول على إحصائيات الحجوزات"""
         try:
-            conn = sqlite3.connect('notifications.db')
-            cursor = conn.cursor()
-            
-            # إجمالي الحجوزات
-            cursor.execute("SELECT COUNT(*) FROM booking_logs")
-            total_bookings = cursor.fetchone()[0]
-            
-            # آخر حجز
-            cursor.execute("SELECT booking_date FROM booking_logs ORDER BY booking_date DESC LIMIT 1")
-            last_booking = cursor.fetchone()
-            last_booking_date = last_booking[0] if last_booking else 'لا يوجد'
-            
-            # المستخدمون الفريدون
-            cursor.execute("SELECT COUNT(DISTINCT full_name) FROM booking_logs")
-            unique_users = cursor.fetchone()[0]
-            
-            conn.close()
-            
-            return {
-                'total_bookings': total_bookings,
-                'last_booking_date': last_booking_date,
-                'unique_users': unique_users
-            }
+            self.flush_writes()
+            return self.storage.notifications.booking_stats()
             
         except Exception as e:
             logging.error(f"خطأ في الحصول على الإحصائيات: {e}")
@@ -408,20 +378,8 @@ class NotificationSystem:
     def get_recent_bookings(self, limit=5):
         """الحصول على آخر الحجوزات"""
         try:
-            conn = sqlite3.connect('notifications.db')
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                SELECT booking_date, full_name, passport_number, visa_type, 'نجح' as status
-                FROM booking_logs 
-                ORDER BY booking_date DESC 
-                LIMIT ?
-            """, (limit,))
-            
-            bookings = cursor.fetchall()
-            conn.close()
-            
-            return bookings
+            self.flush_writes()
+            return self.storage.notifications.recent_bookings(limit)
             
         except Exception as e:
             logging.error(f"خطأ في الحصول على الحجوزات الأخيرة: {e}")
@@ -430,35 +388,8 @@ class NotificationSystem:
     def get_booking_statistics(self):
         """الحصول على إحصائيات الحجوزات"""
         try:
-            conn = sqlite3.connect('notifications.db')
-            cursor = conn.cursor()
-            
-            # إجمالي الحجوزات
-            cursor.execute("SELECT COUNT(*) FROM booking_notifications")
-            total_bookings = cursor.fetchone()[0]
-            
-            # الحجوزات الناجحة
-            cursor.execute("SELECT COUNT(*) FROM booking_notifications WHERE booking_status = 'SUCCESS'")
-            successful_bookings = cursor.fetchone()[0]
-            
-            # الحجوزات اليوم
-            today = datetime.now().strftime('%Y-%m-%d')
-            cursor.execute("SELECT COUNT(*) FROM booking_notifications WHERE DATE(created_at) = ?", (today,))
-            today_bookings = cursor.fetchone()[0]
-            
-            # الإشعارات المرسلة
-            cursor.execute("SELECT COUNT(*) FROM booking_notifications WHERE notification_sent = 1")
-            notifications_sent = cursor.fetchone()[0]
-            
-            conn.close()
-            
-            return {
-                'total_bookings': total_bookings,
-                'successful_bookings': successful_bookings,
-                'today_bookings': today_bookings,
-                'notifications_sent': notifications_sent,
-                'success_rate': (successful_bookings / total_bookings * 100) if total_bookings > 0 else 0
-            }
+            self.flush_writes()
+            return self.storage.notifications.notification_statistics()
             
         except Exception as e:
             logging.error(f"❌ خطأ في الحصول على الإحصائيات: {e}")
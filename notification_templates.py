@@ -0,0 +1,248 @@
+"""
+قوالب رسائل الإشعارات (إيميل HTML ونص بديل وتيليجرام) مُجهزة مرة واحدة عند التشغيل
+Precompiled notification templates - ${field} placeholders are turned into a single
+%-format string at startup so each render is one substitution; encoded subjects and
+identical MIME parts are cached and reused across a batch
+"""
+
+import html
+import re
+from datetime import datetime
+from email import base64mime
+from email.header import Header
+from email.message import Message
+from email.mime.multipart import MIMEMultipart
+
+_PLACEHOLDER = re.compile(r'\$\{(\w+)\}')
+
+# الأجزاء مُرمَّزة base64 فلا يمكن أن يظهر فيها هذا الفاصل (النقطة والشرطة خارج أبجدية base64)،
+# وتثبيته يغني مولد الإيميل عن بناء تعبير منتظم لكل رسالة للبحث عن فاصل غير مستخدم
+MIME_BOUNDARY = '==notification-part.alternative=='
+
+
+class CompiledTemplate:
+    """قالب نصي بحقول ${name} - يُحوَّل عند الإنشاء إلى نص تنسيق % واحد
+
+    escape (اختياري) تُطبق على كل قيمة قبل التعويض (html.escape لقوالب HTML)
+    """
+
+    def __init__(self, source, escape=None):
+        self.fields = tuple(dict.fromkeys(_PLACEHOLDER.findall(source)))
+        self.escape = escape
+        self._format = _PLACEHOLDER.sub(r'%(\1)s', source.replace('%', '%%'))
+
+    def render(self, values):
+        escape = self.escape
+        if escape is None:
+            return self._format % {field: values.get(field, '') for field in self.fields}
+        return self._format % {field: escape(str(values.get(field, ''))) for field in self.fields}
+
+
+class EmailTemplate:
+    """إيميل بجزأين: نص عادي و HTML (multipart/alternative) مع عنوان مُرمَّز مسبقاً"""
+
+    def __init__(self, subject, html_source, text_source):
+        self.subject = Header(subject, 'utf-8').encode()
+        self.html = CompiledTemplate(html_source, escape=html.escape)
+        self.text = CompiledTemplate(text_source)
+
+    @staticmethod
+    def _build_part(body, subtype):
+        # رؤوس ثابتة مكتوبة مسبقاً بدلاً من اشتقاقها من كائن Charset لكل جزء (كما يفعل MIMEText)
+        part = Message()
+        part['Content-Type'] = f'text/{subtype}; charset="utf-8"'
+        part['MIME-Version'] = '1.0'
+        part['Content-Transfer-Encoding'] = 'base64'
+        part.set_payload(base64mime.body_encode(body.encode('utf-8')))
+        return part
+
+    def _part(self, body, subtype, parts):
+        if parts is None:
+            return self._build_part(body, subtype)
+        part = parts.get((subtype, body))
+        if part is None:
+            # جزء MIME لا يتغير بعد إنشائه، فيمكن إرفاقه بعدة رسائل
+            part = parts[(subtype, body)] = self._build_part(body, subtype)
+        return part
+
+    def message(self, values, sender, recipient, message_id=None, parts=None):
+        """رسالة واحدة - parts قاموس أجزاء MIME مشترك بين رسائل الدفعة الواحدة"""
+        msg = MIMEMultipart('alternative', boundary=MIME_BOUNDARY)
+        msg['From'] = sender
+        msg['To'] = recipient
+        msg['Subject'] = self.subject
+        if message_id:
+            msg['Message-ID'] = message_id
+        msg.attach(self._part(self.text.render(values), 'plain', parts))
+        msg.attach(self._part(self.html.render(values), 'html', parts))
+        return msg
+
+    def messages(self, values_list, sender, recipients):
+        """رسائل دفعة توزيع - الأجسام المتطابقة تُرمَّز مرة واحدة وتشترك في جزء MIME واحد"""
+        parts = {}
+        return [self.message(values, sender, recipient, parts=parts)
+                for values, recipient in zip(values_list, recipients)]
+
+
+def now_text():
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+BOOKING_EMAIL_SUBJECT = "🎉 تأكيد حجز موعد فيزا إسبانيا - Spain Visa Appointment Confirmed"
+
+BOOKING_EMAIL_HTML = """
+<!DOCTYPE html>
+<html dir="rtl" lang="ar">
+<head>
+    <meta charset="UTF-8">
+    <style>
+        body { font-family: Arial, sans-serif; margin: 20px; background-color: #f5f5f5; }
+        .container { background-color: white; padding: 30px; border-radius: 10px; box-shadow: 0 2px 10px rgba(0,0,0,0.1); }
+        .header { background-color: #28a745; color: white; padding: 20px; text-align: center; border-radius: 5px; margin-bottom: 20px; }
+        .success-icon { font-size: 48px; margin-bottom: 10px; }
+        .details { background-color: #f8f9fa; padding: 15px; border-radius: 5px; margin: 15px 0; }
+        .footer { text-align: center; margin-top: 30px; color: #666; }
+        .english { direction: ltr; text-align: left; margin-top: 30px; border-top: 2px solid #eee; padding-top: 20px; }
+    </style>
+</head>
+<body>
+    <div class="container">
+        <div class="header">
+            <div class="success-icon">🎉</div>
+            <h1>تم حجز موعدك بنجاح!</h1>
+            <p>Your Spain Visa Appointment Has Been Successfully Booked!</p>
+        </div>
+
+        <div class="details">
+            <h3>📋 تفاصيل الحجز - Booking Details:</h3>
+            <p><strong>الاسم الكامل - Full Name:</strong> ${full_name}</p>
+            <p><strong>رقم الجواز - Passport Number:</strong> ${passport_number}</p>
+            <p><strong>نوع الفيزا - Visa Type:</strong> ${visa_type}</p>
+            <p><strong>المدينة - City:</strong> ${preferred_city}</p>
+            <p><strong>تاريخ الحجز - Booking Date:</strong> ${now}</p>
+            <p><strong>معرف الحجز - Booking ID:</strong> ${booking_id}</p>
+        </div>
+
+        <div class="details">
+            <h3>📧 معلومات الاتصال - Contact Information:</h3>
+            <p><strong>البريد الإلكتروني - Email:</strong> ${email}</p>
+            <p><strong>رقم الهاتف - Phone:</strong> ${phone_number}</p>
+            <p><strong>واتساب - WhatsApp:</strong> ${whatsapp_number}</p>
+        </div>
+
+        <div class="details">
+            <h3>⚠️ ملاحظات مهمة - Important Notes:</h3>
+            <ul>
+                <li>يرجى التحقق من بريدك الإلكتروني للحصول على تأكيد رسمي من BLS Spain</li>
+                <li>Please check your email for official confirmation from BLS Spain</li>
+                <li>احتفظ بهذا الإيميل كدليل على الحجز</li>
+                <li>Keep this email as proof of booking</li>
+                <li>في حالة عدم وصول التأكيد الرسمي خلال 24 ساعة، يرجى التواصل معنا</li>
+                <li>If you don't receive official confirmation within 24 hours, please contact us</li>
+            </ul>
+        </div>
+
+        <div class="footer">
+            <p>🤖 تم إرسال هذا الإشعار تلقائياً بواسطة نظام حجز فيزا إسبانيا</p>
+            <p>This notification was sent automatically by Spain Visa Booking System</p>
+            <p>⏰ وقت الإرسال: ${now}</p>
+        </div>
+    </div>
+</body>
+</html>
+"""
+
+BOOKING_EMAIL_TEXT = """\
+🎉 تم حجز موعدك بنجاح! - Your Spain Visa Appointment Has Been Successfully Booked!
+
+📋 تفاصيل الحجز - Booking Details:
+الاسم الكامل - Full Name: ${full_name}
+رقم الجواز - Passport Number: ${passport_number}
+نوع الفيزا - Visa Type: ${visa_type}
+المدينة - City: ${preferred_city}
+تاريخ الحجز - Booking Date: ${now}
+معرف الحجز - Booking ID: ${booking_id}
+
+📧 معلومات الاتصال - Contact Information:
+البريد الإلكتروني - Email: ${email}
+رقم الهاتف - Phone: ${phone_number}
+واتساب - WhatsApp: ${whatsapp_number}
+
+⚠️ يرجى التحقق من بريدك الإلكتروني للحصول على تأكيد رسمي من BLS Spain
+Please check your email for official confirmation from BLS Spain
+
+🤖 تم إرسال هذا الإشعار تلقائياً بواسطة نظام حجز فيزا إسبانيا - ${now}
+"""
+
+BOOKING_TELEGRAM = """
+🎉 *تأكيد حجز موعد فيزا إسبانيا*
+✅ *Spain Visa Appointment Confirmed*
+
+📋 *تفاصيل الحجز:*
+👤 الاسم: `${full_name}`
+🛂 رقم الجواز: `${passport_number}`
+📄 نوع الفيزا: `${visa_type}`
+🏙️ المدينة: `${preferred_city}`
+📅 تاريخ الحجز: `${now}`
+🆔 معرف الحجز: `${booking_id}`
+
+📧 *معلومات الاتصال:*
+✉️ الإيميل: `${email}`
+📱 الهاتف: `${phone_number}`
+💬 واتساب: `${whatsapp_number}`
+
+⚠️ *ملاحظة مهمة:*
+يرجى التحقق من بريدك الإلكتروني للحصول على التأكيد الرسمي من BLS Spain
+
+🤖 تم الإرسال تلقائياً بواسطة نظام حجز فيزا إسبانيا
+"""
+
+SLOT_ALERT_EMAIL_SUBJECT = "🔔 مواعيد متاحة لفيزا إسبانيا - Spain Visa Slots Available"
+
+SLOT_ALERT_TEXT = """🔔 مواعيد متاحة الآن - Slots available now
+🏙️ المدينة: ${city}
+📄 نوع الفيزا: ${visa_type}
+📅 عدد المواعيد: ${count}
+🕐 وقت الرصد: ${observed_at}
+⚡ يحاول النظام الحجز لك تلقائياً"""
+
+SLOT_ALERT_HTML = """<div dir="rtl" style="font-family: Arial, sans-serif;">
+    <h2>🔔 مواعيد متاحة الآن - Slots available now</h2>
+    <p><strong>🏙️ المدينة:</strong> ${city}</p>
+    <p><strong>📄 نوع الفيزا:</strong> ${visa_type}</p>
+    <p><strong>📅 عدد المواعيد:</strong> ${count}</p>
+    <p><strong>🕐 وقت الرصد:</strong> ${observed_at}</p>
+    <p>⚡ يحاول النظام الحجز لك تلقائياً</p>
+</div>"""
+
+
+class NotificationTemplates:
+    """كل قوالب نظام الإشعارات مُجهزة مرة واحدة"""
+
+    def __init__(self):
+        self.booking_email = EmailTemplate(BOOKING_EMAIL_SUBJECT, BOOKING_EMAIL_HTML, BOOKING_EMAIL_TEXT)
+        self.booking_telegram = CompiledTemplate(BOOKING_TELEGRAM)
+        self.slot_alert_email = EmailTemplate(SLOT_ALERT_EMAIL_SUBJECT, SLOT_ALERT_HTML, SLOT_ALERT_TEXT)
+        self.slot_alert_telegram = CompiledTemplate(SLOT_ALERT_TEXT)
+
+    @staticmethod
+    def booking_values(user_data, booking_details, now=None):
+        """قيم قوالب تأكيد الحجز مع القيم الافتراضية لكل حقل"""
+        now = now or now_text()
+        values = {
+            field: user_data.get(field, 'غير محدد')
+            for field in ('full_name', 'passport_number', 'preferred_city', 'email', 'phone_number', 'whatsapp_number')
+        }
+        values['visa_type'] = user_data.get('visa_type', 'فيزا دراسة')
+        values['booking_id'] = booking_details.get('booking_id', 'AUTO-' + str(int(datetime.now().timestamp())))
+        values['now'] = now
+        return values
+
+    @staticmethod
+    def slot_alert_values(event):
+        return {
+            'city': event.get('city', 'غير محدد'),
+            'visa_type': event.get('visa_type', 'غير محدد'),
+            'count': event.get('count', 'غير محدد'),
+            'observed_at': event.get('observed_at') or now_text()
+        }
@@ -0,0 +1,181 @@
+"""
+طبقة المراقبة المشتركة: مراقب واحد لكل (مدينة، نوع فيزا) يخدم جميع الجلسات المشتركة
+Shared-observation fan-out: one observer job per (city, visa_type) key publishes
+availability snapshots to every subscribed session
+"""
+
+import threading
+from datetime import datetime
+from job_scheduler import Job, ExponentialBackoff
+
+# أولوية مهام المراقبة أقل من مهام الحجز
+OBSERVE_PRIORITY = 5
+
+
+class Subscription:
+    """اشتراك جلسة واحدة في لقطات مراقب مشترك - on_snapshot(snapshot) تُستدعى لكل لقطة جديدة"""
+
+    def __init__(self, observer, subscriber_id, on_snapshot):
+        self.observer = observer
+        self.subscriber_id = subscriber_id
+        self.on_snapshot = on_snapshot
+        self.closed = False
+
+    def deliver(self, snapshot):
+        if self.closed:
+            return
+        try:
+            self.on_snapshot(snapshot)
+        except Exception as e:
+            print(f"⚠️ خطأ في تسليم لقطة المراقب للجلسة {self.subscriber_id}: {e}")
+
+    def close(self):
+        """إلغاء الاشتراك"""
+        if not self.closed:
+            self.closed = True
+            self.observer.hub._unsubscribe(self)
+
+
+class TargetObserver:
+    """مراقب واحد لهدف (مدينة، نوع فيزا) - كل دورة فحص مهمة في المجدول تنشر النتيجة لكل المشتركين"""
+
+    def __init__(self, hub, key, interval):
+        self.hub = hub
+        self.key = key
+        self.interval = interval
+        self.subscribers = {}
+        self.latest = None
+        self.version = 0
+        self.errors = 0
+        self.probe = None
+        self.job = None
+
+    def publish(self, snapshot):
+        snapshot['key'] = list(self.key)
+        snapshot['observed_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        with self.hub._lock:
+            was_available = bool(self.latest and self.latest.get('available'))
+            self.version += 1
+            snapshot['version'] = self.version
+            self.latest = snapshot
+            subscribers = list(self.subscribers.values())
+        for subscription in subscribers:
+            subscription.deliver(snapshot)
+        # تنبيه واحد لكل ظهور مواعيد (وليس لكل لقطة متتالية متاحة)
+        if snapshot.get('available') and not was_available and self.hub.on_available is not None:
+            try:
+                self.hub.on_available(self.key, snapshot, [s.subscriber_id for s in subscribers])
+            except Exception as e:
+                print(f"⚠️ خطأ في تنبيه المشتركين بمواعيد {self.key}: {e}")
+
+    def tick(self, token):
+        """دورة فحص واحدة - تُشغَّل كل interval ثانية بواسطة المجدول"""
+        try:
+            if self.probe is None:
+                self.probe = self.hub.probe_factory(self.key)
+            snapshot = self.probe.observe_availability(self.interval, lambda: not token.cancelled)
+        except Exception as e:
+            self.errors += 1
+            print(f"❌ خطأ في المراقب المشترك {self.key} (المحاولة {self.errors}): {e}")
+            self.publish({'available': False, 'count': 0, 'error': str(e)})
+            # استبدال المتصفح بعد أخطاء متكررة
+            if self.errors >= 3:
+                self.close_probe()
+            # سياسة التراجع في المجدول تحدد موعد المحاولة التالية
+            raise
+        self.errors = 0
+        if self.hub.cadence is not None:
+            self.hub.cadence.record(self.key, snapshot.get('available'))
+        if not token.cancelled:
+            self.publish(snapshot)
+
+    def close_probe(self, job=None):
+        probe, self.probe = self.probe, None
+        if probe is None:
+            return
+        try:
+            probe.release_driver()
+        except Exception as e:
+            print(f"⚠️ خطأ في إغلاق متصفح المراقب {self.key}: {e}")
+
+
+class ObservationHub:
+    """إدارة المراقبين المشتركين: تبدأ مهمة المراقب مع أول مشترك وتُلغى مع آخر مشترك
+
+    probe_factory(key) يعيد كائناً يوفر observe_availability(duration, should_continue)
+    التي تعيد لقطة {'available', 'count', ...} و release_driver() لإعادة المتصفح
+
+    cadence (اختياري) نموذج CadenceModel يسجل كل لقطة ويحدد الفاصل بين دورات الفحص،
+    بينما تبقى مدة مراقبة الصفحة داخل كل دورة interval ثانية
+
+    on_available(key, snapshot, subscriber_ids) (اختياري) تُستدعى مرة عند تحول الهدف إلى متاح
+    """
+
+    def __init__(self, probe_factory, scheduler, interval=5, jitter=1, max_backoff=60, cadence=None,
+                 on_available=None):
+        self.probe_factory = probe_factory
+        self.on_available = on_available
+        self.scheduler = scheduler
+        self.interval = interval
+        self.cadence = cadence
+        self.jitter = jitter
+        self.max_backoff = max_backoff
+        self._observers = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(city, visa_type):
+        return ((city or '').strip().lower(), (visa_type or '').strip().lower())
+
+    def subscribe(self, key, subscriber_id, on_snapshot):
+        """اشتراك جلسة في مراقب الهدف (تُجدول مهمة المراقب إن لم تكن موجودة)"""
+        with self._lock:
+            observer = self._observers.get(key)
+            created = observer is None
+            if created:
+                observer = TargetObserver(self, key, self.interval)
+                observer.job = Job(
+                    f"observe-{key[0]}-{key[1]}", observer.tick,
+                    interval=self._interval_for(key), jitter=self.jitter, priority=OBSERVE_PRIORITY, group='observe',
+                    backoff=ExponentialBackoff(base=self.interval, max_delay=self.max_backoff),
+                    on_finish=observer.close_probe
+                )
+                self._observers[key] = observer
+            subscription = Subscription(observer, subscriber_id, on_snapshot)
+            observer.subscribers[subscriber_id] = subscription
+        if created:
+            self.scheduler.submit(observer.job)
+            print(f"👁️ بدء مراقب مشترك جديد للهدف {key}")
+        return subscription
+
+    def _interval_for(self, key):
+        if self.cadence is None:
+            return self.interval
+        return lambda: self.cadence.interval_for(key)
+
+    def _unsubscribe(self, subscription):
+        observer = subscription.observer
+        with self._lock:
+            if observer.subscribers.get(subscription.subscriber_id) is subscription:
+                del observer.subscribers[subscription.subscriber_id]
+            if observer.subscribers or self._observers.get(observer.key) is not observer:
+                return
+            del self._observers[observer.key]
+        # الإلغاء فوري: الدورة الجارية تتوقف عبر الرمز والمتصفح يُعاد عند انتهاء المهمة
+        observer.job.cancel()
+        print(f"👁️ إيقاف المراقب المشترك للهدف {observer.key} - لا يوجد مشتركون")
+
+    def stats(self):
+        """عدد المشتركين وآخر لقطة لكل هدف"""
+        with self._lock:
+            return {
+                f"{key[0]}|{key[1]}": {
+                    'subscribers': len(observer.subscribers),
+                    'errors': observer.errors,
+                    'latest': observer.latest,
+                    'job': observer.job.to_dict(),
+                    'probe': observer.probe.stats() if hasattr(observer.probe, 'stats') else None,
+                    'cadence': self.cadence.stats(key).get('|'.join(key)) if self.cadence else None
+                }
+                for key, observer in self._observers.items()
+            }
@@ -0,0 +1,169 @@
+"""
+عامل صندوق الإشعارات الصادرة
+Durable notification outbox worker - delivery rows are written in the same transaction as
+the booking log, then a background worker claims due rows, sends them with per-channel
+timeouts, retries failures with exponential backoff and dead-letters them after
+max_attempts; pending rows survive restarts and are picked up again
+"""
+
+import logging
+import threading
+import time
+from collections import defaultdict
+from job_scheduler import ExponentialBackoff
+
+
+class OutboxWorker:
+    """خيط يرسل رسائل OutboxRepository المستحقة
+
+    senders: {channel: (send, timeout)} حيث send(payload, idempotency_key) يعيد عند النجاح معرف الرسالة
+    لدى المزود أو True. رسائل الحجز الواحد تُرسل بالتوازي عبر dispatcher (ChannelDispatcher)، وبعد حفظ
+    نتائجها يُستدعى on_delivered(booking_id, notification_key).
+
+    الرسالة تُسجل مرسلة فور نجاح إرسالها (حتى بعد تجاوز مهلة القناة)، والإرسال الذي تجاوز مهلته
+    لا يُعاد قبل انتهائه - تبقى الرسالة محجوزة وتُحفظ نتيجتها عند انتهائه، وإلا وصلت مرتين
+    """
+
+    def __init__(self, repository, senders, dispatcher, on_delivered=None, batch_size=20, poll_interval=5,
+                 lease=120, max_attempts=6, backoff=None):
+        self.repository = repository
+        self.senders = senders
+        self.dispatcher = dispatcher
+        self.on_delivered = on_delivered
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.backoff = backoff or ExponentialBackoff(base=30, factor=2, max_delay=3600)
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.counters = {'sent': 0, 'retried': 0, 'dead': 0, 'late': 0, 'runs': 0, 'errors': 0}
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name='notification-outbox', daemon=True)
+            self._thread.start()
+        return self
+
+    def wake(self):
+        """إيقاظ العامل فور إضافة رسائل جديدة بدل انتظار دورة الفحص التالية"""
+        self._wake.set()
+
+    def _loop(self):
+        while not self._stopped.is_set():
+            try:
+                while self.run_once() and not self._stopped.is_set():
+                    pass
+            except Exception as e:
+                self._count('errors')
+                logging.error(f"❌ خطأ في عامل صندوق الإشعارات: {e}")
+            self._wake.wait(self._idle_wait())
+            self._wake.clear()
+
+    def _idle_wait(self):
+        try:
+            next_due = self.repository.next_due()
+        except Exception:
+            return self.poll_interval
+        if next_due is None:
+            return self.poll_interval
+        return min(self.poll_interval, max(0.0, next_due - time.time()))
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def run_once(self):
+        """إرسال دفعة واحدة من الرسائل المستحقة - يعيد عدد الرسائل المحجوزة"""
+        rows = self.repository.claim(self.batch_size, self.lease)
+        if not rows:
+            return 0
+        self._count('runs')
+        # التجميع بمفتاح إشعارات الحجز لا بمعرفه - معرف الحجز قد يتكرر بين حجزين مختلفين
+        by_booking = defaultdict(list)
+        for row in rows:
+            by_booking[row['notification_key']].append(row)
+        for notification_key, messages in by_booking.items():
+            self._deliver(messages[0]['booking_id'], notification_key, messages)
+        return len(rows)
+
+    def _attempt(self, send, row):
+        """إرسال رسالة واحدة وتسجيلها مرسلة فور النجاح مع معرفها لدى المزود"""
+        receipt = send(row['payload'], row['idempotency_key'])
+        if receipt:
+            self.repository.mark_sent(row['id'], None if receipt is True else str(receipt))
+        return bool(receipt)
+
+    def _deliver(self, booking_id, notification_key, messages):
+        channels, unknown, late = {}, set(), {}
+        for row in messages:
+            if row['channel'] not in self.senders:
+                unknown.add(row['id'])
+                continue
+            send, timeout = self.senders[row['channel']]
+            channels[row['channel']] = (lambda send=send, row=row: self._attempt(send, row), timeout)
+        results = self.dispatcher.dispatch(channels, on_timeout=late.__setitem__) if channels else {}
+
+        failed = []
+        for row in messages:
+            if row['channel'] in late:
+                continue
+            if results.get(row['channel']):
+                self._count('sent')
+            else:
+                failed.append((row, 'channel not configured' if row['id'] in unknown else None))
+        self._settle_failed(failed)
+        if self.on_delivered is not None:
+            self.on_delivered(booking_id, notification_key)
+
+        for channel, future in late.items():
+            row = next(row for row in messages if row['channel'] == channel)
+            self._count('late')
+            future.add_done_callback(
+                lambda future, row=row: self._settle_late(booking_id, notification_key, row, future)
+            )
+
+    def _settle_late(self, booking_id, notification_key, row, future):
+        """حفظ نتيجة إرسال انتهى بعد مهلة قناته (الرسالة بقيت محجوزة حتى الآن)"""
+        try:
+            ok = future.result()[0]
+            if ok:
+                self._count('sent')
+            else:
+                self._settle_failed([(row, None)])
+            if self.on_delivered is not None:
+                self.on_delivered(booking_id, notification_key)
+        except Exception as e:
+            # تبقى الرسالة محجوزة حتى انتهاء مدة الحجز ثم تُعاد
+            self._count('errors')
+            logging.error(f"❌ خطأ في حفظ نتيجة رسالة {row['idempotency_key']}: {e}")
+
+    def _settle_failed(self, failed):
+        retry, dead = [], []
+        for row, error in failed:
+            if row['attempts'] >= self.max_attempts or error:
+                dead.append((error or f"{row['channel']} delivery failed", row['id']))
+                logging.error(
+                    f"❌ نُقلت رسالة {row['idempotency_key']} إلى الرسائل الميتة بعد {row['attempts']} محاولة"
+                )
+            else:
+                retry.append((time.time() + self.backoff.delay(row['attempts']),
+                              f"{row['channel']} delivery failed", row['id']))
+        if failed:
+            self.repository.settle(retry=retry, dead=dead)
+        self._count('retried', len(retry))
+        self._count('dead', len(dead))
+
+    def stop(self, timeout=5):
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+        stats['outbox'] = self.repository.counts()
+        return stats
@@ -0,0 +1,203 @@
+"""
+ذاكرة نماذج الصفحات: حفظ المحدد الفائز لكل دور في كل صفحة وتجربته أولاً
+Learned page-model cache keyed by URL pattern and DOM fingerprint - remembers the
+winning locator per role and tries it before the full selector list
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+from urllib.parse import urlparse
+
+DEFAULT_CACHE_PATH = os.environ.get('PAGE_MODEL_CACHE', '.page_model_cache.json')
+
+# بصمة بنيوية للصفحة: العنوان وحقول النماذج والعناصر ذات المعرفات (دون النصوص المتغيرة)
+FINGERPRINT_SCRIPT = """
+var ids = [];
+var nodes = document.querySelectorAll('[id]');
+for (var i = 0; i < nodes.length && ids.length < 60; i++) {
+    ids.push(nodes[i].tagName.toLowerCase() + '#' + nodes[i].id);
+}
+var fields = [];
+var inputs = document.querySelectorAll('input, select, textarea');
+for (var j = 0; j < inputs.length && fields.length < 60; j++) {
+    var el = inputs[j];
+    fields.push(el.tagName.toLowerCase() + ':' + (el.name || el.id || el.type || ''));
+}
+return [window.location.href, document.title, ids.sort().join(','), fields.sort().join(',')];
+"""
+
+_ID_SEGMENT = re.compile(r'^(\d+|[0-9a-f]{8,}|[0-9a-f-]{32,36})$', re.IGNORECASE)
+
+
+def url_pattern(url):
+    """تحويل الرابط إلى نمط: بدون الاستعلام، والمقاطع الرقمية أو المعرفات تصبح {id}"""
+    parsed = urlparse(url or '')
+    segments = [
+        '{id}' if _ID_SEGMENT.match(segment) else segment.lower()
+        for segment in parsed.path.split('/') if segment
+    ]
+    return f"{parsed.netloc.lower()}/{'/'.join(segments)}"
+
+
+class PageModelCache:
+    """المحدد الفائز لكل (نمط الرابط، بصمة DOM، الدور) مع إحصاءات الإصابة والإخفاق"""
+
+    def __init__(self, cache_path=DEFAULT_CACHE_PATH):
+        self.cache_path = cache_path
+        self._lock = threading.Lock()
+        self._models = self.load_cache() or {}
+        self._stats = {}
+
+    def load_cache(self):
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save_cache(self):
+        with self._lock:
+            snapshot = json.dumps(self._models, ensure_ascii=False, indent=2)
+        try:
+            with open(self.cache_path, 'w', encoding='utf-8') as f:
+                f.write(snapshot)
+        except OSError as e:
+            print(f"⚠️ تعذر حفظ ذاكرة نماذج الصفحات: {e}")
+
+    def key_from_fingerprint(self, fingerprint):
+        """مفتاح الصفحة من نتيجة FINGERPRINT_SCRIPT: نمط الرابط + بصمة DOM"""
+        try:
+            url, title, ids, fields = fingerprint
+        except (TypeError, ValueError):
+            return None
+        digest = hashlib.sha1(f"{title}|{ids}|{fields}".encode('utf-8')).hexdigest()[:12]
+        return f"{url_pattern(url)}#{digest}"
+
+    def lookup(self, page_key, role):
+        if page_key is None:
+            return None
+        with self._lock:
+            return self._models.get(page_key, {}).get(role)
+
+    def candidates(self, role, limit=10):
+        """المحددات المحفوظة لهذا الدور في كل الصفحات (تُقيَّم مع بصمة الصفحة)"""
+        with self._lock:
+            found = []
+            for model in self._models.values():
+                selector = model.get(role)
+                if selector and selector not in found:
+                    found.append(selector)
+                    if len(found) >= limit:
+                        break
+            return found
+
+    def _role_stats(self, role):
+        return self._stats.setdefault(role, {'hits': 0, 'misses': 0, 'failures': 0})
+
+    def record_win(self, page_key, role, selector):
+        """تسجيل المحدد الذي نجح - إصابة إذا كان هو المحفوظ، وإلا إخفاق ويُحفظ الجديد"""
+        if page_key is None:
+            return
+        with self._lock:
+            model = self._models.setdefault(page_key, {})
+            hit = model.get(role) == selector
+            self._role_stats(role)['hits' if hit else 'misses'] += 1
+            model[role] = selector
+        if not hit:
+            self.save_cache()
+
+    def record_failure(self, page_key, role):
+        """لم ينجح أي محدد (مثل عدم ظهور نافذة التحذير) - يبقى المحفوظ حتى يفوز محدد آخر"""
+        with self._lock:
+            self._role_stats(role)['failures'] += 1
+
+    def stats(self):
+        with self._lock:
+            roles = {role: dict(values) for role, values in self._stats.items()}
+            pages = len(self._models)
+            entries = sum(len(model) for model in self._models.values())
+        hits = sum(r['hits'] for r in roles.values())
+        misses = sum(r['misses'] for r in roles.values())
+        return {
+            'pages': pages,
+            'entries': entries,
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / (hits + misses), 3) if hits + misses else None,
+            'roles': roles
+        }
+
+
+class LearnedLookup:
+    """البحث عن عناصر دور في الصفحة الحالية: المحدد المحفوظ أولاً ثم بقية القائمة عند الحاجة فقط
+
+    الاستدعاء الأول يحسب بصمة الصفحة ويقيّم المحددات المحفوظة للدور معاً، فالإصابة
+    تكلف استدعاءً واحداً للمتصفح كما كان التقييم الكامل من قبل.
+    """
+
+    def __init__(self, cache, engine, role, selectors, first_only=False, require_visible=True, require_enabled=True):
+        self.cache = cache
+        self.engine = engine
+        self.role = role
+        self.selectors = list(selectors)
+        self.first_only = first_only
+        self.require_visible = require_visible
+        self.require_enabled = require_enabled
+        self.page_key = None
+        self.preferred = None
+
+    def _qualify(self, entries):
+        return self.engine.qualify(entries, self.require_visible, self.require_enabled)
+
+    def phases(self):
+        """قوائم المطابقات على مراحل: المحدد المحفوظ لهذه الصفحة ثم بقية المحددات"""
+        candidates = [selector for selector in self.cache.candidates(self.role) if selector in self.selectors]
+        try:
+            fingerprint, entries = self.engine.evaluate_with_prelude(
+                FINGERPRINT_SCRIPT, candidates or self.selectors, self.first_only
+            )
+        except Exception:
+            return
+        self.page_key = self.cache.key_from_fingerprint(fingerprint)
+        if not candidates:
+            # لا يوجد محدد محفوظ لهذا الدور - التقييم الكامل تم في نفس الاستدعاء
+            yield self._qualify(entries)
+            return
+
+        self.preferred = self.cache.lookup(self.page_key, self.role)
+        if self.preferred in candidates:
+            yield self._qualify([entry for entry in entries if entry.get('selector') == self.preferred])
+        try:
+            entries = self.engine.evaluate(
+                [selector for selector in self.selectors if selector != self.preferred], self.first_only
+            )
+        except Exception:
+            return
+        yield self._qualify(entries)
+
+    def __iter__(self):
+        for matches in self.phases():
+            for match in matches:
+                yield match
+
+    def first_nonempty(self, transform=None):
+        """أول مرحلة تعطي مطابقات (بعد transform إن وجد) - لجمع كل العناصر مثل المواعيد"""
+        for matches in self.phases():
+            if transform:
+                matches = transform(matches)
+            if matches:
+                return matches
+        return []
+
+    def win(self, match):
+        """تسجيل المحدد الذي نجح للدور في هذه الصفحة"""
+        self.cache.record_win(self.page_key, self.role, match.get('selector'))
+
+    def fail(self):
+        self.cache.record_failure(self.page_key, self.role)
+
+
+page_model_cache = PageModelCache()
@@ -0,0 +1,188 @@
+"""
+طبقة الانتظار المبنية على الأحداث لبوت حجز فيزا إسبانيا
+Condition-based waits (readyState, DOM mutation quiescence, URL change, element presence)
+that return as soon as the page reaches the expected state, with per-step timeouts
+"""
+
+from selenium.common.exceptions import (
+    StaleElementReferenceException, TimeoutException, WebDriverException
+)
+from selenium.webdriver.support.ui import WebDriverWait
+
+# المهلة القصوى (بالثواني) لكل خطوة - الانتظار ينتهي فور تحقق الشرط
+DEFAULT_STEP_TIMEOUTS = {
+    'navigate': 15,
+    'after_click': 8,
+    'popup_close': 3,
+    'settle': 5,
+    'form_ready': 8,
+    'submit': 10,
+    'confirmation': 10
+}
+
+# أقصى انتظار لهدوء DOM في كل خطوة = مدة time.sleep الثابتة التي حل محلها
+# (صفحة فيها ساعة أو شريط متحرك لا تهدأ أبداً - لا ننتظر أكثر مما كنا ننتظر)
+DEFAULT_QUIET_CAPS = {
+    'navigate': 5,
+    'after_click': 3,
+    'popup_close': 2,
+    'settle': 3,
+    'form_ready': 3,
+    'submit': 3,
+    'confirmation': 5
+}
+
+# مدة الهدوء المطلوبة (بالملي ثانية) دون أي تغيير في DOM لاعتبار الصفحة مستقرة
+DEFAULT_QUIET_MS = 300
+
+# مناطق الصفحة التي تهم البوت - تغييرات خارجها (ساعة، إعلانات، عناصر تحديث دوري) لا تؤخر الاستقرار
+QUIET_REGIONS = (
+    'form, [role="dialog"], [class*="modal"], [class*="calendar"], [class*="slot"], '
+    '[class*="available"], [class*="appointment"], [class*="booking"], table'
+)
+
+# ينتهي عند هدوء DOM لمدة quietMs أو تغير الرابط أو انتهاء المهلة
+# يراقب إضافة وحذف العناصر فقط (لا السمات ولا النصوص) وداخل المناطق المهمة إن وُجدت في الصفحة
+DOM_QUIET_SCRIPT = """
+var quietMs = arguments[0];
+var timeoutMs = arguments[1];
+var startUrl = arguments[2];
+var regions = arguments[3];
+var done = arguments[arguments.length - 1];
+var started = Date.now();
+var lastChange = Date.now();
+
+function relevant(mutation) {
+    if (!document.querySelector(regions)) { return true; }
+    var el = mutation.target.nodeType === 1 ? mutation.target : mutation.target.parentElement;
+    if (el && el.closest && el.closest(regions)) { return true; }
+    var nodes = Array.prototype.slice.call(mutation.addedNodes).concat(
+        Array.prototype.slice.call(mutation.removedNodes));
+    for (var i = 0; i < nodes.length; i++) {
+        var node = nodes[i];
+        if (node.nodeType === 1 && (node.matches(regions) || node.querySelector(regions))) { return true; }
+    }
+    return false;
+}
+
+var observer = new MutationObserver(function (mutations) {
+    for (var i = 0; i < mutations.length; i++) {
+        if (relevant(mutations[i])) { lastChange = Date.now(); return; }
+    }
+});
+observer.observe(document.documentElement || document, {childList: true, subtree: true});
+
+function finish(result) { observer.disconnect(); done(result); }
+
+(function check() {
+    var now = Date.now();
+    if (startUrl && window.location.href !== startUrl) { return finish('url_changed'); }
+    if (document.readyState === 'complete' && now - lastChange >= quietMs) { return finish('quiet'); }
+    if (now - started >= timeoutMs) { return finish('timeout'); }
+    setTimeout(check, 50);
+})();
+"""
+
+
+class PageWaiter:
+    """انتظار حالة الصفحة الفعلية بدلاً من time.sleep ثابت"""
+
+    def __init__(self, driver, selectors=None, timeouts=None, poll_frequency=0.1, quiet_ms=DEFAULT_QUIET_MS,
+                 quiet_caps=None):
+        self.driver = driver
+        self.selectors = selectors
+        self.timeouts = dict(DEFAULT_STEP_TIMEOUTS)
+        self.timeouts.update(timeouts or {})
+        self.quiet_caps = dict(DEFAULT_QUIET_CAPS)
+        self.quiet_caps.update(quiet_caps or {})
+        self.poll_frequency = poll_frequency
+        self.quiet_ms = quiet_ms
+
+        # يجب أن تتجاوز مهلة السكريبتات غير المتزامنة أطول خطوة
+        try:
+            self.driver.set_script_timeout(max(self.timeouts.values()) + 5)
+        except WebDriverException:
+            pass
+
+    def timeout(self, step):
+        return self.timeouts.get(step, self.timeouts['settle'])
+
+    def quiet_timeout(self, step):
+        """مهلة انتظار الهدوء: مهلة الخطوة بحد أقصى مدة الانتظار الثابت القديم"""
+        return min(self.timeout(step), self.quiet_caps.get(step, self.quiet_caps['settle']))
+
+    def _until(self, condition, step):
+        """تنفيذ شرط بمهلة الخطوة - يعيد نتيجة الشرط أو None عند انتهاء المهلة"""
+        try:
+            return WebDriverWait(
+                self.driver, self.timeout(step), poll_frequency=self.poll_frequency,
+                ignored_exceptions=(StaleElementReferenceException,)
+            ).until(condition)
+        except TimeoutException:
+            return None
+
+    def ready_state(self, step='navigate'):
+        """انتظار اكتمال تحميل المستند"""
+        return bool(self._until(
+            lambda driver: driver.execute_script("return document.readyState") == "complete", step
+        ))
+
+    def dom_quiet(self, step='settle', start_url=None, quiet_ms=None):
+        """انتظار توقف تغييرات DOM أو تغير الرابط - يعيد 'quiet' أو 'url_changed' أو 'timeout'
+
+        'timeout' يعني أن الصفحة لم تهدأ خلال quiet_timeout(step) - المتابعة آمنة كما مع الانتظار الثابت
+        """
+        try:
+            return self.driver.execute_async_script(
+                DOM_QUIET_SCRIPT, quiet_ms or self.quiet_ms, int(self.quiet_timeout(step) * 1000), start_url,
+                QUIET_REGIONS
+            )
+        except WebDriverException:
+            # تفريغ الصفحة أثناء السكريبت يعني أن تنقلاً قد بدأ
+            self.ready_state(step)
+            return 'url_changed'
+
+    def page_ready(self, step='navigate'):
+        """اكتمال التحميل ثم استقرار العناصر الديناميكية"""
+        if not self.ready_state(step):
+            return False
+        return self.dom_quiet(step) != 'timeout'
+
+    def after_action(self, previous_url, step='after_click'):
+        """الانتظار بعد نقرة: ينتهي عند تغير الرابط أو استقرار الصفحة"""
+        result = self.dom_quiet(step, start_url=previous_url)
+        if result == 'url_changed':
+            self.page_ready(step)
+        return result
+
+    def url_change(self, previous_url, step='after_click'):
+        """انتظار تغير الرابط عن الرابط السابق"""
+        return bool(self._until(lambda driver: driver.current_url != previous_url, step))
+
+    def presence(self, selectors, step='settle', require_enabled=False):
+        """انتظار ظهور أول عنصر مرئي يطابق أحد المحددات (استدعاء واحد لكل دورة)"""
+        return self._until(
+            lambda driver: self.selectors.first_match(
+                selectors, first_only=True, require_enabled=require_enabled
+            ),
+            step
+        )
+
+    def any_of(self, conditions, step='settle'):
+        """انتظار تحقق أي شرط من قائمة شروط - يعيد نتيجة أول شرط تحقق"""
+        def check(driver):
+            for condition in conditions:
+                result = condition(driver)
+                if result:
+                    return result
+            return False
+        return self._until(check, step)
+
+    def gone(self, element, step='popup_close'):
+        """انتظار اختفاء عنصر أو إزالته من الصفحة (مثل نافذة تحذير بعد إغلاقها)"""
+        def hidden(driver):
+            try:
+                return not element.is_displayed()
+            except StaleElementReferenceException:
+                return True
+        return bool(self._until(hidden, step))
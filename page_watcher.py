@@ -0,0 +1,241 @@
+"""
+مراقب داخل الصفحة مبني على MutationObserver لنوافذ التحذير وتوفر المواعيد
+In-page MutationObserver watcher that buffers modal appearances and slot-state changes
+as they happen; Python drains the buffer with one cheap call per tick
+"""
+
+import json
+from selenium.common.exceptions import WebDriverException
+from page_waits import DEFAULT_STEP_TIMEOUTS
+from selector_engine import SLOT_WATCH_SELECTORS
+
+# حاويات النوافذ المنبثقة ونوافذ التحذير (محددات CSS)
+MODAL_CONTAINER_SELECTORS = [
+    '.modal.show',
+    '.modal.in',
+    '.modal[style*="display: block"]',
+    '[role="dialog"]',
+    '[aria-modal="true"]',
+    '.disclaimer',
+    '.popup'
+]
+
+
+def add_document_script(driver, name, source):
+    """تسجيل سكريبت يعمل في كل مستند جديد للتبويب الحالي مرة واحدة فقط (Chrome/CDP)
+
+    المتصفحات المجمعة تبقى بين الاستعارات، وكل Page.addScriptToEvaluateOnNewDocument يضيف نسخة
+    جديدة تعمل في كل تنقل لاحق - لذلك يُحفظ المعرف على المتصفح لكل (تبويب، اسم)
+    ويُستبدل التسجيل فقط إذا تغير نص السكريبت
+    """
+    scripts = getattr(driver, '_document_scripts', None)
+    if scripts is None:
+        scripts = {}
+        driver._document_scripts = scripts
+    key = (driver.current_window_handle, name)
+    registered = scripts.get(key)
+    if registered is not None and registered[1] == source:
+        return registered[0]
+    if registered is not None:
+        driver.execute_cdp_cmd('Page.removeScriptToEvaluateOnNewDocument', {'identifier': registered[0]})
+        del scripts[key]
+    result = driver.execute_cdp_cmd('Page.addScriptToEvaluateOnNewDocument', {'source': source})
+    scripts[key] = ((result or {}).get('identifier'), source)
+    return scripts[key][0]
+
+
+def forget_document_scripts(driver, handle):
+    """نسيان تسجيلات تبويب أُغلق (تسجيلات CDP تُحذف مع التبويب نفسه)"""
+    scripts = getattr(driver, '_document_scripts', None) or {}
+    for key in [key for key in scripts if key[0] == handle]:
+        del scripts[key]
+
+
+WATCHER_TEMPLATE = """
+(function (config) {
+    if (window.__visaWatcher) { return; }
+    var w = {buffer: [], waiters: [], seq: 0, modalVisible: false, slotSignature: null, scheduled: false};
+    window.__visaWatcher = w;
+
+    function visible(el) {
+        if (!el.getClientRects || !el.getClientRects().length) { return false; }
+        var style = window.getComputedStyle(el);
+        return style.visibility !== 'hidden' && style.display !== 'none' && parseFloat(style.opacity || '1') > 0;
+    }
+
+    function className(el) {
+        return (typeof el.className === 'string' ? el.className : el.getAttribute('class')) || '';
+    }
+
+    function push(event) {
+        w.seq += 1;
+        event.seq = w.seq;
+        event.ts = Date.now();
+        event.url = window.location.href;
+        w.buffer.push(event);
+        if (w.buffer.length > config.maxBuffer) { w.buffer.shift(); }
+        var waiters = w.waiters;
+        w.waiters = [];
+        for (var i = 0; i < waiters.length; i++) { waiters[i](); }
+    }
+
+    function findModal() {
+        for (var i = 0; i < config.modalSelectors.length; i++) {
+            var nodes = document.querySelectorAll(config.modalSelectors[i]);
+            for (var j = 0; j < nodes.length; j++) {
+                if (visible(nodes[j])) { return nodes[j]; }
+            }
+        }
+        return null;
+    }
+
+    function scanSlots() {
+        var texts = [];
+        var seen = new Set();
+        for (var i = 0; i < config.slotSelectors.length; i++) {
+            var snapshot;
+            try {
+                snapshot = document.evaluate(config.slotSelectors[i], document, null,
+                    XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+            } catch (e) { continue; }
+            for (var j = 0; j < snapshot.snapshotLength; j++) {
+                var el = snapshot.snapshotItem(j);
+                if (!el || el.nodeType !== 1 || seen.has(el)) { continue; }
+                seen.add(el);
+                if (!visible(el) || el.disabled || className(el).toLowerCase().indexOf('disabled') !== -1) { continue; }
+                texts.push((el.innerText || '').trim().substring(0, 50));
+            }
+        }
+        return texts;
+    }
+
+    function scan() {
+        w.scheduled = false;
+        var modal = findModal();
+        if (modal && !w.modalVisible) {
+            push({type: 'modal', text: (modal.innerText || '').trim().substring(0, 100)});
+        } else if (!modal && w.modalVisible) {
+            push({type: 'modal_closed'});
+        }
+        w.modalVisible = !!modal;
+
+        var texts = scanSlots();
+        var signature = texts.length + '|' + texts.join('|');
+        if (signature !== w.slotSignature) {
+            if (w.slotSignature !== null || texts.length) {
+                push({type: 'slots', count: texts.length, texts: texts.slice(0, 10)});
+            }
+            w.slotSignature = signature;
+        }
+    }
+
+    function schedule() {
+        if (w.scheduled) { return; }
+        w.scheduled = true;
+        setTimeout(scan, config.debounceMs);
+    }
+
+    new MutationObserver(schedule).observe(document, {
+        childList: true, subtree: true, attributes: true,
+        attributeFilter: ['class', 'style', 'disabled', 'aria-hidden', 'data-available']
+    });
+    if (document.readyState === 'loading') {
+        document.addEventListener('DOMContentLoaded', schedule);
+    } else {
+        schedule();
+    }
+})(%s);
+"""
+
+DRAIN_SCRIPT = """
+var w = window.__visaWatcher;
+if (!w) { return null; }
+var events = w.buffer;
+w.buffer = [];
+return events;
+"""
+
+# ينتهي فور وصول حدث جديد أو عند انتهاء المهلة
+WAIT_SCRIPT = """
+var timeoutMs = arguments[0];
+var done = arguments[arguments.length - 1];
+var w = window.__visaWatcher;
+if (!w) { return done(null); }
+var finished = false;
+function flush() {
+    if (finished) { return; }
+    finished = true;
+    var events = w.buffer;
+    w.buffer = [];
+    done(events);
+}
+if (w.buffer.length) { return flush(); }
+setTimeout(flush, timeoutMs);
+w.waiters.push(flush);
+"""
+
+
+def modal_appeared(events):
+    """هل ظهرت نافذة منبثقة ضمن الأحداث"""
+    return any(event.get('type') == 'modal' for event in events or [])
+
+
+def latest_slots(events):
+    """آخر حالة للمواعيد ضمن الأحداث أو None إذا لم تتغير"""
+    slots = [event for event in events or [] if event.get('type') == 'slots']
+    return slots[-1] if slots else None
+
+
+class PageWatcher:
+    """حقن مراقب دائم في الصفحة وتفريغ أحداثه باستدعاء واحد"""
+
+    def __init__(self, driver, slot_selectors=None, modal_selectors=None, debounce_ms=50, max_buffer=200):
+        self.driver = driver
+        config = {
+            'slotSelectors': list(slot_selectors or SLOT_WATCH_SELECTORS),
+            'modalSelectors': list(modal_selectors or MODAL_CONTAINER_SELECTORS),
+            'debounceMs': debounce_ms,
+            'maxBuffer': max_buffer
+        }
+        self.source = WATCHER_TEMPLATE % json.dumps(config, ensure_ascii=False)
+        self.max_wait = max(DEFAULT_STEP_TIMEOUTS.values())
+        self.persistent = False
+        self.installs = 0
+
+    def install(self):
+        """تثبيت المراقب في المستند الحالي وفي كل مستند جديد إن أمكن"""
+        if not self.persistent:
+            try:
+                # Chrome فقط: تشغيل المراقب تلقائياً عند تحميل أي صفحة جديدة (مرة واحدة لكل تبويب)
+                add_document_script(self.driver, 'page_watcher', self.source)
+                self.persistent = True
+            except (AttributeError, WebDriverException):
+                pass
+            try:
+                self.driver.set_script_timeout(self.max_wait + 5)
+            except WebDriverException:
+                pass
+        self.driver.execute_script(self.source)
+        self.installs += 1
+
+    def drain(self):
+        """إرجاع الأحداث المسجلة منذ آخر تفريغ"""
+        events = self.driver.execute_script(DRAIN_SCRIPT)
+        if events is None:
+            # مستند جديد بدون المراقب (عند عدم توفر CDP)
+            self.install()
+            return []
+        return events
+
+    def wait_for_events(self, timeout):
+        """انتظار أول حدث جديد حتى timeout ثانية ثم إرجاع جميع الأحداث المتراكمة"""
+        timeout_ms = int(min(timeout, self.max_wait) * 1000)
+        try:
+            events = self.driver.execute_async_script(WAIT_SCRIPT, timeout_ms)
+        except WebDriverException:
+            # تنقل أثناء الانتظار - المستند الجديد سيحمل مراقبه الخاص
+            return []
+        if events is None:
+            self.install()
+            return []
+        return events
@@ -0,0 +1,278 @@
+"""
+قياس زمن كل مرحلة من مراحل الفحص والحجز مع عدد أوامر WebDriver
+Per-phase latency spans for the check-and-book pipeline with WebDriver round-trip
+counts, in-memory histograms and a local SQLite time-series store
+"""
+
+import functools
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+
+# مراحل خط الفحص والحجز
+PHASES = (
+    'navigate', 'popup', 'button_search', 'slot_scan',
+    'click', 'form_fill', 'submit', 'confirmation'
+)
+
+# حدود فئات المدرج التكراري بالثواني
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+DEFAULT_METRICS_DB = os.environ.get('METRICS_DB', 'pipeline_metrics.db')
+
+
+class CommandCounter:
+    """عدّاد أوامر WebDriver - يلتف حول driver.execute الذي تمر عبره كل الأوامر بما فيها أوامر العناصر"""
+
+    def __init__(self, driver):
+        self.count = 0
+        self.by_command = {}
+        self._execute = driver.execute
+        driver.execute = self._counted_execute
+
+    def _counted_execute(self, driver_command, params=None):
+        self.count += 1
+        self.by_command[driver_command] = self.by_command.get(driver_command, 0) + 1
+        return self._execute(driver_command, params)
+
+
+def count_commands(driver):
+    """تركيب عدّاد الأوامر على المتصفح مرة واحدة (المتصفحات المجمعة يُعاد استخدامها)"""
+    if driver is None:
+        return None
+    counter = getattr(driver, '_command_counter', None)
+    if counter is None:
+        counter = CommandCounter(driver)
+        driver._command_counter = counter
+    return counter
+
+
+class PhaseHistogram:
+    """مدرج تكراري تراكمي لزمن مرحلة واحدة مع نافذة حديثة لحساب المئينات"""
+
+    def __init__(self, recent_size=500):
+        self.count = 0
+        self.total = 0.0
+        self.errors = 0
+        self.round_trips = 0
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.recent = deque(maxlen=recent_size)
+
+    def observe(self, duration, round_trips, ok):
+        self.count += 1
+        self.total += duration
+        self.round_trips += round_trips or 0
+        if not ok:
+            self.errors += 1
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if duration <= bound:
+                self.buckets[i] += 1
+        self.recent.append(duration)
+
+    def percentile(self, q):
+        values = sorted(self.recent)
+        if not values:
+            return None
+        return round(values[min(len(values) - 1, int(q * len(values)))], 4)
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'sum_seconds': round(self.total, 3),
+            'avg_seconds': round(self.total / self.count, 3) if self.count else None,
+            'p50_seconds': self.percentile(0.5),
+            'p95_seconds': self.percentile(0.95),
+            'avg_round_trips': round(self.round_trips / self.count, 1) if self.count else None,
+            'buckets': {str(bound): n for bound, n in zip(LATENCY_BUCKETS, self.buckets)}
+        }
+
+
+class TimeSeriesStore:
+    """تخزين كل قياس في SQLite محلية على دفعات مع حذف القياسات الأقدم من retention_days"""
+
+    def __init__(self, db_path=DEFAULT_METRICS_DB, flush_every=50, flush_interval=10, retention_days=7):
+        self.db_path = db_path
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.retention_days = retention_days
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._last_flush = time.time()
+        self._last_prune = 0
+        self._ready = False
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path)
+        if not self._ready:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS phase_spans (
+                    ts REAL,
+                    phase TEXT,
+                    parent TEXT,
+                    duration_ms REAL,
+                    round_trips INTEGER,
+                    ok INTEGER
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_phase_spans_phase_ts ON phase_spans (phase, ts)')
+            self._ready = True
+        return conn
+
+    def add(self, span):
+        with self._lock:
+            self._buffer.append(span)
+            due = (len(self._buffer) >= self.flush_every
+                   or time.time() - self._last_flush >= self.flush_interval)
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            rows, self._buffer = self._buffer, []
+            self._last_flush = time.time()
+        if not rows:
+            return
+        try:
+            conn = self._connect()
+            try:
+                conn.executemany(
+                    'INSERT INTO phase_spans (ts, phase, parent, duration_ms, round_trips, ok) VALUES (?, ?, ?, ?, ?, ?)',
+                    [(r['ts'], r['phase'], r['parent'], r['duration_ms'], r['round_trips'], int(r['ok'])) for r in rows]
+                )
+                if time.time() - self._last_prune > 3600:
+                    conn.execute('DELETE FROM phase_spans WHERE ts < ?', (time.time() - self.retention_days * 86400,))
+                    self._last_prune = time.time()
+                conn.commit()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"⚠️ تعذر حفظ قياسات المراحل: {e}")
+
+    def query(self, phase=None, minutes=60, limit=1000):
+        """القياسات المحفوظة خلال آخر minutes دقيقة"""
+        self.flush()
+        sql = 'SELECT ts, phase, parent, duration_ms, round_trips, ok FROM phase_spans WHERE ts >= ?'
+        params = [time.time() - minutes * 60]
+        if phase:
+            sql += ' AND phase = ?'
+            params.append(phase)
+        sql += ' ORDER BY ts DESC LIMIT ?'
+        params.append(limit)
+        try:
+            conn = self._connect()
+            try:
+                rows = conn.execute(sql, params).fetchall()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"⚠️ تعذر قراءة قياسات المراحل: {e}")
+            return []
+        return [
+            {'ts': ts, 'phase': p, 'parent': parent, 'duration_ms': d, 'round_trips': rt, 'ok': bool(ok)}
+            for ts, p, parent, d, rt, ok in rows
+        ]
+
+
+class PipelineMetrics:
+    """تجميع قياسات المراحل في مدرجات تكرارية وإرسالها إلى مخزن السلاسل الزمنية"""
+
+    def __init__(self, store=None):
+        self.store = store
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def span(self, phase, driver=None):
+        """مدير سياق لقياس مرحلة واحدة - المراحل المتداخلة تسجل المرحلة الأم"""
+        return _Span(self, phase, count_commands(driver))
+
+    def _stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    def record(self, phase, duration, round_trips=None, ok=True, parent=None):
+        with self._lock:
+            histogram = self._histograms.setdefault(phase, PhaseHistogram())
+            histogram.observe(duration, round_trips, ok)
+        if self.store is not None:
+            self.store.add({
+                'ts': time.time(),
+                'phase': phase,
+                'parent': parent,
+                'duration_ms': round(duration * 1000, 1),
+                'round_trips': round_trips,
+                'ok': ok
+            })
+
+    def reset(self):
+        """مسح المدرجات (يستخدمه قياس الأداء بين الحالات)"""
+        with self._lock:
+            self._histograms = {}
+
+    def histograms(self):
+        with self._lock:
+            return {phase: histogram.to_dict() for phase, histogram in self._histograms.items()}
+
+    def prometheus_text(self):
+        """المدرجات بصيغة Prometheus النصية"""
+        lines = [
+            '# HELP visa_pipeline_phase_seconds Duration of each check-and-book phase',
+            '# TYPE visa_pipeline_phase_seconds histogram'
+        ]
+        with self._lock:
+            items = sorted(self._histograms.items())
+            for phase, h in items:
+                for bound, n in zip(LATENCY_BUCKETS, h.buckets):
+                    lines.append(f'visa_pipeline_phase_seconds_bucket{{phase="{phase}",le="{bound}"}} {n}')
+                lines.append(f'visa_pipeline_phase_seconds_bucket{{phase="{phase}",le="+Inf"}} {h.count}')
+                lines.append(f'visa_pipeline_phase_seconds_sum{{phase="{phase}"}} {h.total:.6f}')
+                lines.append(f'visa_pipeline_phase_seconds_count{{phase="{phase}"}} {h.count}')
+            lines.append('# HELP visa_pipeline_phase_round_trips_total WebDriver commands issued per phase')
+            lines.append('# TYPE visa_pipeline_phase_round_trips_total counter')
+            for phase, h in items:
+                lines.append(f'visa_pipeline_phase_round_trips_total{{phase="{phase}"}} {h.round_trips}')
+            lines.append('# HELP visa_pipeline_phase_errors_total Phases that raised an exception')
+            lines.append('# TYPE visa_pipeline_phase_errors_total counter')
+            for phase, h in items:
+                lines.append(f'visa_pipeline_phase_errors_total{{phase="{phase}"}} {h.errors}')
+        return '\n'.join(lines) + '\n'
+
+
+class _Span:
+    def __init__(self, metrics, phase, counter):
+        self.metrics = metrics
+        self.phase = phase
+        self.counter = counter
+
+    def __enter__(self):
+        stack = self.metrics._stack()
+        self.parent = stack[-1] if stack else None
+        stack.append(self.phase)
+        self.commands_before = self.counter.count if self.counter else None
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.started
+        self.metrics._stack().pop()
+        round_trips = self.counter.count - self.commands_before if self.counter else None
+        self.metrics.record(self.phase, elapsed, round_trips, exc_type is None, self.parent)
+        return False
+
+
+pipeline_metrics = PipelineMetrics(TimeSeriesStore())
+
+
+def traced(phase):
+    """مُزخرف لدوال VisaBookingBot: قياس المرحلة باستخدام self.driver"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            with pipeline_metrics.span(phase, getattr(self, 'driver', None)):
+                return func(self, *args, **kwargs)
+        return wrapper
+    return decorator
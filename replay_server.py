@@ -0,0 +1,321 @@
+"""
+خادم محلي بديل لموقع BLS يعيد تشغيل صفحات مسجلة لاختبار البوت وقياس أدائه دون اتصال
+Offline replay server: serves recorded HTML fixtures (home, city pages, warning modals,
+appointment calendars, form pages) with scripted state transitions and configurable latency
+
+الاستخدام:
+    python replay_server.py [--port 8765] [--scenario replay_fixtures/scenario.json] [--latency-ms 150]
+    BLS_BASE_URL=http://127.0.0.1:8765/ python app.py
+
+    # تسجيل صفحات حقيقية من الموقع في مجلد الصفحات
+    python replay_server.py record --path / --path /tangier --out replay_fixtures/recorded
+
+    # خادم SMTP محلي بديل لاختبار الإيميلات وقياس أدائها
+    python replay_server.py smtp --port 8025 --latency-ms 20 --connect-ms 150
+"""
+
+import argparse
+import html
+import json
+import os
+import random
+import re
+import socketserver
+import threading
+import time
+from string import Template
+from flask import Flask, Response, abort, jsonify, request
+from werkzeug.serving import make_server
+
+DEFAULT_FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'replay_fixtures')
+DEFAULT_SCENARIO = os.path.join(DEFAULT_FIXTURES_DIR, 'scenario.json')
+
+
+class ReplayScenario:
+    """سيناريو الصفحات: لكل مسار صفحة ثابتة أو سلسلة حالات تتقدم بعدد الزيارات
+
+    كل حالة {"fixture": "...", "visits": n} تُعرض n مرة ثم تنتقل للحالة التالية،
+    وآخر حالة تبقى ثابتة. المسار "/<city>" يطابق أي جزء واحد ويمرر قيمته كمتغير city.
+    """
+
+    def __init__(self, path=DEFAULT_SCENARIO, fixtures_dir=None, latency_ms=None):
+        with open(path, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        self.fixtures_dir = fixtures_dir or os.path.dirname(os.path.abspath(path))
+        self.latency_ms = config.get('latency_ms', 0) if latency_ms is None else latency_ms
+        self.jitter_ms = config.get('jitter_ms', 0)
+        self.variables = config.get('variables', {})
+        self.pages = []
+        for pattern, page in config.get('pages', {}).items():
+            regex = '^' + re.sub(r'<(\w+)>', r'(?P<\1>[^/]+)', pattern.rstrip('/')) + '/?$'
+            self.pages.append((re.compile(regex), pattern, page))
+        # المسارات الثابتة قبل المسارات التي تحتوي متغيرات
+        self.pages.sort(key=lambda item: '<' in item[1])
+        self._visits = {}
+        self._fixtures = {}
+        self._lock = threading.Lock()
+
+    def match(self, path, method):
+        for regex, pattern, page in self.pages:
+            found = regex.match(path.rstrip('/') or '')
+            if found and method in page.get('methods', ['GET']):
+                return pattern, page, found.groupdict()
+        return None
+
+    def next_state(self, pattern, page):
+        """اختيار حالة الصفحة حسب عدد زياراتها ثم زيادة العدّاد"""
+        states = page.get('states') or [page]
+        with self._lock:
+            visit = self._visits.get(pattern, 0)
+            self._visits[pattern] = visit + 1
+        for state in states:
+            visits = state.get('visits')
+            if visits is None or visit < visits:
+                return state, visit
+            visit -= visits
+        return states[-1], visit
+
+    def latency(self, page, state):
+        base = state.get('latency_ms', page.get('latency_ms', self.latency_ms))
+        return max(0, base + random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+
+    def fixture(self, name):
+        with self._lock:
+            if name not in self._fixtures:
+                with open(os.path.join(self.fixtures_dir, name), 'r', encoding='utf-8') as f:
+                    self._fixtures[name] = Template(f.read())
+            return self._fixtures[name]
+
+    def reset(self, pattern=None, visits=0):
+        with self._lock:
+            if pattern:
+                self._visits[pattern] = visits
+            else:
+                self._visits.clear()
+
+    def state(self):
+        with self._lock:
+            return {'visits': dict(self._visits), 'latency_ms': self.latency_ms}
+
+
+def create_replay_app(scenario):
+    """تطبيق Flask يعرض صفحات السيناريو"""
+    replay = Flask(__name__)
+
+    @replay.route('/__replay/state')
+    def replay_state():
+        return jsonify(scenario.state())
+
+    @replay.route('/__replay/reset', methods=['POST'])
+    def replay_reset():
+        scenario.reset(request.values.get('page'), request.values.get('visits', 0, type=int))
+        return jsonify(scenario.state())
+
+    @replay.route('/', defaults={'path': ''}, methods=['GET', 'POST'])
+    @replay.route('/<path:path>', methods=['GET', 'POST'])
+    def serve(path):
+        matched = scenario.match('/' + path, request.method)
+        if matched is None:
+            abort(404)
+        pattern, page, params = matched
+        state, visit = scenario.next_state(pattern, page)
+        time.sleep(scenario.latency(page, state))
+
+        variables = dict(scenario.variables)
+        variables.update(state.get('variables', {}))
+        variables.update({key: html.escape(value) for key, value in request.values.items()})
+        variables.update({key: html.escape(value) for key, value in params.items()})
+        variables.update({'base': request.host_url.rstrip('/'), 'visit': visit})
+        body = scenario.fixture(state['fixture']).safe_substitute(variables)
+        return Response(body, status=state.get('status', 200), mimetype='text/html')
+
+    return replay
+
+
+class ReplayServer:
+    """تشغيل خادم الإعادة في خيط خلفي (للاختبارات وقياس الأداء)"""
+
+    def __init__(self, scenario=None, host='127.0.0.1', port=0):
+        self.scenario = scenario or ReplayScenario()
+        self._server = make_server(host, port, create_replay_app(self.scenario), threaded=True)
+        self.base_url = f"http://{host}:{self._server.server_port}/"
+        self._thread = threading.Thread(target=self._server.serve_forever, name='replay-server', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        print(f"🎬 خادم الإعادة يعمل على {self.base_url}")
+        return self
+
+    def shutdown(self):
+        self._server.shutdown()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.shutdown()
+        return False
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    """جلسة SMTP مبسطة: تقبل أي مصادقة ومرسل ومستلم وتعد الرسائل دون إرسالها"""
+
+    def _reply(self, text):
+        self.wfile.write(text.encode('utf-8') + b'\r\n')
+
+    def handle(self):
+        server = self.server
+        # زمن الاتصال ومصافحة TLS في الخادم الحقيقي
+        time.sleep(server.connect_delay)
+        self._reply('220 replay-smtp ESMTP ready')
+        messages = 0
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            time.sleep(server.latency)
+            verb = line.decode('utf-8', 'replace').strip().split(' ', 1)[0].upper()
+            if verb == 'EHLO':
+                self._reply('250-replay-smtp\r\n250-AUTH PLAIN LOGIN\r\n250-8BITMIME\r\n250 SMTPUTF8')
+            elif verb == 'AUTH':
+                self._reply('235 2.7.0 Authentication successful')
+            elif verb in ('HELO', 'MAIL', 'RCPT', 'RSET', 'NOOP'):
+                self._reply('250 OK')
+            elif verb == 'DATA':
+                self._reply('354 End data with <CR><LF>.<CR><LF>')
+                while self.rfile.readline() not in (b'.\r\n', b'.\n', b''):
+                    pass
+                messages += 1
+                server.count_message()
+                self._reply('250 OK queued')
+                if server.max_messages and messages >= server.max_messages:
+                    # بعض الخوادم تغلق الجلسة بعد عدد محدد من الرسائل
+                    return
+            elif verb == 'QUIT':
+                self._reply('221 Bye')
+                return
+            else:
+                self._reply('502 Command not implemented')
+
+
+class ReplaySMTPServer(socketserver.ThreadingTCPServer):
+    """خادم SMTP محلي في خيط خلفي بزمن اتصال وزمن لكل أمر قابلين للضبط
+
+    لا يدعم STARTTLS - يُستخدم مع use_starttls=False ويحاكي connect_ms كلفة المصافحة
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host='127.0.0.1', port=0, latency_ms=0, connect_ms=0, max_messages=0):
+        super().__init__((host, port), _SMTPHandler)
+        self.host, self.port = self.server_address[:2]
+        self.latency = latency_ms / 1000
+        self.connect_delay = connect_ms / 1000
+        self.max_messages = max_messages
+        self.messages = 0
+        self.connections = 0
+        self._count_lock = threading.Lock()
+        self._thread = threading.Thread(target=self.serve_forever, name='replay-smtp', daemon=True)
+
+    def count_message(self):
+        with self._count_lock:
+            self.messages += 1
+
+    def process_request(self, request, client_address):
+        with self._count_lock:
+            self.connections += 1
+        super().process_request(request, client_address)
+
+    def start(self):
+        self._thread.start()
+        print(f"📮 خادم SMTP المحلي يعمل على {self.host}:{self.port}")
+        return self
+
+    def shutdown(self):
+        super().shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.shutdown()
+        return False
+
+
+def record_fixtures(base_url, paths, out_dir):
+    """حفظ صفحات الموقع الحقيقي كملفات HTML لاستخدامها في السيناريوهات"""
+    import requests
+
+    os.makedirs(out_dir, exist_ok=True)
+    session = requests.Session()
+    session.headers['User-Agent'] = (
+        'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+        '(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+    )
+    saved = []
+    for path in paths:
+        url = base_url.rstrip('/') + '/' + path.lstrip('/')
+        try:
+            response = session.get(url, timeout=30)
+        except requests.RequestException as e:
+            print(f"❌ تعذر تسجيل {url}: {e}")
+            continue
+        name = (path.strip('/').replace('/', '_') or 'home') + '.html'
+        # علامة $ لها معنى في القوالب فيجب مضاعفتها
+        with open(os.path.join(out_dir, name), 'w', encoding='utf-8') as f:
+            f.write(response.text.replace('$', '$$'))
+        saved.append(name)
+        print(f"💾 تم تسجيل {url} ({response.status_code}) في {name}")
+    return saved
+
+
+def main():
+    parser = argparse.ArgumentParser(description='خادم محلي بديل لموقع BLS Spain Morocco')
+    sub = parser.add_subparsers(dest='command')
+
+    record = sub.add_parser('record', help='تسجيل صفحات من الموقع الحقيقي')
+    record.add_argument('--base-url', default='https://blsspainmorocco.com/')
+    record.add_argument('--path', action='append', default=[])
+    record.add_argument('--out', default=os.path.join(DEFAULT_FIXTURES_DIR, 'recorded'))
+
+    smtp = sub.add_parser('smtp', help='تشغيل خادم SMTP محلي بديل')
+    smtp.add_argument('--port', type=int, default=8025, dest='smtp_port')
+    smtp.add_argument('--latency-ms', type=float, default=0)
+    smtp.add_argument('--connect-ms', type=float, default=0)
+    smtp.add_argument('--max-messages', type=int, default=0)
+
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=int(os.environ.get('REPLAY_PORT', '8765')))
+    parser.add_argument('--scenario', default=os.environ.get('REPLAY_SCENARIO', DEFAULT_SCENARIO))
+    parser.add_argument('--latency-ms', type=float, default=None)
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        record_fixtures(args.base_url, args.path or ['/'], args.out)
+        return
+
+    if args.command == 'smtp':
+        server = ReplaySMTPServer(args.host, args.smtp_port, args.latency_ms, args.connect_ms, args.max_messages)
+        print(f"💡 شغّل التطبيق مع SMTP_SERVER={server.host} SMTP_PORT={server.port} SMTP_STARTTLS=0")
+        server.start()
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            server.shutdown()
+        return
+
+    server = ReplayServer(ReplayScenario(args.scenario, latency_ms=args.latency_ms), args.host, args.port)
+    print(f"💡 شغّل البوت مع BLS_BASE_URL={server.base_url}")
+    server.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,486 @@
+"""
+محرك المحددات المجمّع لبوت حجز فيزا إسبانيا
+Batched XPath selector engine - evaluates a whole selector list in one execute_script call
+"""
+
+# محددات زر إغلاق نافذة التحذير
+WARNING_CLOSE_SELECTORS = [
+    "//button[@class='btn-close']",
+    "//button[contains(@class, 'close')]",
+    "//span[contains(@class, 'close')]",
+    "//div[contains(@class, 'modal')]//button",
+    "//div[contains(@class, 'modal')]//*[text()='×']",
+    "//div[contains(@class, 'modal')]//*[text()='X']",
+    "//*[text()='×']",
+    "//*[text()='X']",
+    "//button[text()='×']",
+    "//button[text()='X']",
+    "//*[@class='close']",
+    "//*[contains(@onclick, 'close')]",
+    "//div[contains(@class, 'disclaimer')]//*[text()='×']",
+    "//div[contains(@class, 'disclaimer')]//*[text()='X']",
+    "//button[contains(@class, 'btn-close')]",
+    "//*[@id='closeModal']",
+    "//*[@id='close']",
+    "//a[contains(@class, 'close')]",
+    "//i[contains(@class, 'close')]",
+    "//span[text()='×']",
+    "//span[text()='X']",
+    "//*[contains(@aria-label, 'close')]",
+    "//*[contains(@title, 'close')]",
+    "//div[@class='modal-header']//button",
+    "//div[@class='modal-header']//*[text()='×']"
+]
+
+# محددات النافذة المنبثقة البسيطة
+POPUP_CLOSE_SELECTORS = [
+    "//button[contains(@class, 'close')]",
+    "//button[contains(text(), 'Close')]",
+    "//button[contains(text(), 'OK')]",
+    "//button[contains(text(), 'Accept')]",
+    "//span[contains(@class, 'close')]",
+    "//*[@id='closeButton']",
+    "//*[contains(@onclick, 'close')]"
+]
+
+# محددات زر المواعيد
+APPOINTMENT_BUTTON_SELECTORS = [
+    "//a[contains(text(), 'Appointment')]",
+    "//button[contains(text(), 'Appointment')]",
+    "//a[contains(text(), 'موعد')]",
+    "//button[contains(text(), 'موعد')]",
+    "//a[contains(@href, 'appointment')]",
+    "//a[contains(@href, 'booking')]",
+    "//button[contains(@onclick, 'appointment')]",
+    "//*[contains(@class, 'appointment')]",
+    "//*[contains(@id, 'appointment')]",
+    "//a[contains(text(), 'Book')]",
+    "//button[contains(text(), 'Book')]",
+    "//a[contains(text(), 'Schedule')]",
+    "//button[contains(text(), 'Schedule')]",
+    "//*[contains(text(), 'حجز موعد')]",
+    "//*[contains(text(), 'تحديد موعد')]"
+]
+
+# محددات المواعيد المتاحة
+AVAILABLE_SLOT_SELECTORS = [
+    "//button[contains(@class, 'available')]",
+    "//a[contains(@class, 'available')]",
+    "//div[contains(@class, 'available')]",
+    "//td[contains(@class, 'available')]",
+    "//span[contains(@class, 'available')]",
+    "//*[contains(@class, 'appointment-slot')]",
+    "//*[contains(@class, 'time-slot')]",
+    "//*[contains(@class, 'booking-slot')]",
+    "//button[not(contains(@class, 'disabled'))]",
+    "//a[not(contains(@class, 'disabled'))]",
+    "//*[contains(text(), 'متاح')]",
+    "//*[contains(text(), 'Available')]",
+    "//*[contains(@data-available, 'true')]",
+    "//button[contains(@onclick, 'book')]",
+    "//a[contains(@href, 'book')]"
+]
+
+# محددات المواعيد التي يراقبها المراقب داخل الصفحة (بدون المحددات العامة لكل الأزرار والروابط)
+SLOT_WATCH_SELECTORS = [
+    selector for selector in AVAILABLE_SLOT_SELECTORS
+    if selector not in ("//button[not(contains(@class, 'disabled'))]", "//a[not(contains(@class, 'disabled'))]")
+]
+
+# محددات زر إرسال النموذج
+SUBMIT_SELECTORS = [
+    "//button[contains(text(), 'Book')]",
+    "//button[contains(text(), 'Submit')]",
+    "//button[contains(text(), 'Continue')]",
+    "//button[contains(text(), 'Next')]",
+    "//button[contains(text(), 'Proceed')]",
+    "//input[@type='submit']",
+    "//button[@type='submit']",
+    "//*[contains(text(), 'حجز')]",
+    "//*[contains(text(), 'إرسال')]",
+    "//*[contains(text(), 'متابعة')]",
+    "//*[contains(text(), 'التالي')]",
+    "//button[contains(@class, 'submit')]",
+    "//button[contains(@class, 'book')]"
+]
+
+# مؤشرات نجاح الإرسال
+SUCCESS_INDICATOR_SELECTORS = [
+    "//div[contains(text(), 'Success')]",
+    "//div[contains(text(), 'Confirmed')]",
+    "//div[contains(text(), 'Thank you')]",
+    "//div[contains(text(), 'Booked')]",
+    "//div[contains(text(), 'نجح')]",
+    "//div[contains(text(), 'تأكيد')]",
+    "//div[contains(text(), 'شكراً')]",
+    "//div[contains(text(), 'تم الحجز')]",
+    "//*[contains(@class, 'success')]",
+    "//*[contains(@class, 'confirmation')]"
+]
+
+# مؤشرات تأكيد الحجز (نصية فقط)
+BOOKING_CONFIRMATION_SELECTORS = SUCCESS_INDICATOR_SELECTORS[:8]
+
+# محددات زر الانتقال للصفحة التالية
+NEXT_BUTTON_SELECTORS = [
+    "//button[contains(text(), 'Next')]",
+    "//button[contains(text(), 'Continue')]",
+    "//button[contains(text(), 'Submit')]",
+    "//button[contains(text(), 'Proceed')]",
+    "//input[@type='submit']",
+    "//button[@type='submit']",
+    "//*[contains(text(), 'التالي')]",
+    "//*[contains(text(), 'متابعة')]",
+    "//*[contains(text(), 'إرسال')]",
+    "//*[contains(text(), 'المتابعة')]",
+    "//button[contains(@class, 'next')]",
+    "//button[contains(@class, 'continue')]",
+    "//a[contains(text(), 'Next')]",
+    "//a[contains(text(), 'Continue')]"
+]
+
+# مؤشرات أخطاء الصفحة
+ERROR_INDICATOR_SELECTORS = [
+    "//div[contains(text(), 'Error')]",
+    "//div[contains(text(), 'خطأ')]",
+    "//div[contains(text(), 'Something went wrong')]",
+    "//div[contains(text(), 'حدث خطأ')]",
+    "//*[contains(@class, 'error')]",
+    "//*[contains(@class, 'alert-danger')]"
+]
+
+# سكريبت التقييم داخل الصفحة: يقيّم كل المحددات ويعيد العناصر مع حالتها في استجابة واحدة
+BATCH_EVALUATE_SCRIPT = """
+var selectors = arguments[0];
+var firstOnly = arguments[1];
+var maxMatches = arguments[2];
+var textLimit = arguments[3];
+
+function isVisible(el) {
+    if (!el.getClientRects || !el.getClientRects().length) { return false; }
+    var style = window.getComputedStyle(el);
+    if (style.visibility === 'hidden' || style.display === 'none') { return false; }
+    return parseFloat(style.opacity || '1') > 0;
+}
+
+function className(el) {
+    if (typeof el.className === 'string') { return el.className; }
+    return el.getAttribute('class') || '';
+}
+
+var results = [];
+for (var i = 0; i < selectors.length; i++) {
+    var entry = {selector: selectors[i], count: 0, matches: [], error: null};
+    try {
+        var snapshot = document.evaluate(selectors[i], document, null,
+            XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+        entry.count = snapshot.snapshotLength;
+        var limit = firstOnly ? Math.min(1, entry.count)
+            : (maxMatches == null ? entry.count : Math.min(maxMatches, entry.count));
+        for (var j = 0; j < limit; j++) {
+            var el = snapshot.snapshotItem(j);
+            if (!el || el.nodeType !== 1) { continue; }
+            entry.matches.push({
+                element: el,
+                visible: isVisible(el),
+                enabled: !el.disabled,
+                class: className(el),
+                text: (el.innerText || el.value || '').trim().substring(0, textLimit)
+            });
+        }
+    } catch (e) {
+        entry.error = String(e);
+    }
+    results.push(entry);
+}
+return results;
+"""
+
+# تغليف سكريبت التقييم لإرجاع نتيجة سكريبت تمهيدي معه في نفس الاستدعاء
+PRELUDE_TEMPLATE = """
+var prelude = (function () {
+%s
+})();
+var results = (function () {
+%s
+}).apply(null, arguments);
+return [prelude, results];
+"""
+
+
+# دالة ملء النموذج دفعة واحدة: تبحث عن كل حقل بالاسم أو المعرف أو placeholder أو label
+# ثم تضبط القيمة وتطلق أحداث input/change وتعيد تقريراً لكل حقل
+# (fields قائمة أو نص JSON مُعد مسبقاً)
+BULK_FILL_FUNCTION = """function (fields) {
+if (typeof fields === 'string') { fields = JSON.parse(fields); }
+
+function isUsable(el) {
+    if (!el || el.disabled || el.readOnly || el.type === 'hidden') { return false; }
+    if (!el.getClientRects || !el.getClientRects().length) { return false; }
+    var style = window.getComputedStyle(el);
+    return style.visibility !== 'hidden' && style.display !== 'none';
+}
+
+function isField(el) {
+    return el && /^(INPUT|SELECT|TEXTAREA)$/.test(el.tagName);
+}
+
+function byLabel(alias) {
+    var labels = document.getElementsByTagName('label');
+    for (var i = 0; i < labels.length; i++) {
+        if ((labels[i].textContent || '').indexOf(alias) === -1) { continue; }
+        var target = labels[i].control
+            || (labels[i].htmlFor && document.getElementById(labels[i].htmlFor))
+            || labels[i].querySelector('input, select, textarea');
+        if (!target) {
+            var sibling = labels[i].nextElementSibling || labels[i].previousElementSibling;
+            if (isField(sibling)) { target = sibling; }
+        }
+        if (isField(target) && isUsable(target)) { return target; }
+    }
+    return null;
+}
+
+function firstUsable(list) {
+    for (var i = 0; i < list.length; i++) {
+        if (isField(list[i]) && isUsable(list[i])) { return list[i]; }
+    }
+    return null;
+}
+
+function byNearText(alias) {
+    var inputs = document.querySelectorAll('input, select, textarea');
+    for (var i = 0; i < inputs.length; i++) {
+        var parent = inputs[i].parentElement;
+        if (parent && (parent.textContent || '').indexOf(alias) !== -1 && isUsable(inputs[i])) {
+            return inputs[i];
+        }
+    }
+    return null;
+}
+
+var strategies = [
+    ['name', function (a) { return firstUsable(document.getElementsByName(a)); }],
+    ['id', function (a) { var el = document.getElementById(a); return isField(el) && isUsable(el) ? el : null; }],
+    ['placeholder', function (a) {
+        var inputs = document.querySelectorAll('input[placeholder], textarea[placeholder]');
+        for (var i = 0; i < inputs.length; i++) {
+            if (inputs[i].placeholder === a && isUsable(inputs[i])) { return inputs[i]; }
+        }
+        for (var j = 0; j < inputs.length; j++) {
+            if (inputs[j].placeholder.indexOf(a) !== -1 && isUsable(inputs[j])) { return inputs[j]; }
+        }
+        return null;
+    }],
+    ['label', byLabel],
+    ['text', byNearText]
+];
+
+function setValue(el, value) {
+    if (el.tagName === 'SELECT') {
+        var wanted = String(value).toLowerCase();
+        for (var i = 0; i < el.options.length; i++) {
+            var option = el.options[i];
+            if (option.value.toLowerCase() === wanted || option.text.trim().toLowerCase() === wanted) {
+                el.selectedIndex = i;
+                return true;
+            }
+        }
+        return false;
+    }
+    // استخدام الضابط الأصلي حتى تلتقط أطر العمل (React وغيرها) القيمة الجديدة
+    var proto = el.tagName === 'TEXTAREA' ? HTMLTextAreaElement.prototype : HTMLInputElement.prototype;
+    var setter = Object.getOwnPropertyDescriptor(proto, 'value').set;
+    el.focus();
+    setter.call(el, value);
+    return true;
+}
+
+var used = [];
+var report = {};
+for (var f = 0; f < fields.length; f++) {
+    var field = fields[f];
+    var result = {filled: false, alias: null, strategy: null, tag: null, error: null};
+    try {
+        search:
+        for (var a = 0; a < field.aliases.length; a++) {
+            for (var s = 0; s < strategies.length; s++) {
+                var el = strategies[s][1](field.aliases[a]);
+                if (!el || used.indexOf(el) !== -1) { continue; }
+                result.alias = field.aliases[a];
+                result.strategy = strategies[s][0];
+                result.tag = el.tagName.toLowerCase() + (el.name ? '[name=' + el.name + ']' : '');
+                if (!setValue(el, field.value)) {
+                    result.error = 'no matching option';
+                    continue;
+                }
+                el.dispatchEvent(new Event('input', {bubbles: true}));
+                el.dispatchEvent(new Event('change', {bubbles: true}));
+                el.dispatchEvent(new Event('blur'));
+                result.filled = String(el.value) !== '';
+                result.error = result.filled ? null : 'value rejected';
+                if (result.filled) {
+                    used.push(el);
+                    break search;
+                }
+            }
+        }
+    } catch (e) {
+        result.error = String(e);
+    }
+    report[field.name] = result;
+}
+return report;
+}"""
+
+# تشغيل دالة الملء مباشرة بإرسالها كاملة مع الاستدعاء
+BULK_FILL_SCRIPT = "return (" + BULK_FILL_FUNCTION + ")(arguments[0]);"
+
+# تثبيت دالة الملء في الصفحة مسبقاً حتى يكفي استدعاؤها باسمها وقت الحجز
+BULK_FILL_INSTALL = "window.__visaBulkFill = " + BULK_FILL_FUNCTION + ";"
+BULK_FILL_CALL = "return window.__visaBulkFill ? window.__visaBulkFill(arguments[0]) : null;"
+
+
+class SelectorEngine:
+    """تقييم قوائم محددات XPath كاملة داخل الصفحة باستدعاء execute_script واحد
+
+    max_matches=None يعيد كل التطابقات كما كان find_elements (عدّ المواعيد يعتمد عليه)،
+    ومن يكفيه أول تطابق يمرر first_only=True
+    """
+
+    def __init__(self, driver, max_matches=None, text_limit=200):
+        self.driver = driver
+        self.max_matches = max_matches
+        self.text_limit = text_limit
+
+    def evaluate(self, selectors, first_only=False):
+        """تقييم جميع المحددات وإرجاع نتيجة لكل محدد بنفس الترتيب
+
+        كل نتيجة قاموس يحتوي على: selector, count, matches, error
+        وكل تطابق يحتوي على: element, visible, enabled, class, text
+        """
+        if not selectors:
+            return []
+        return self.driver.execute_script(
+            BATCH_EVALUATE_SCRIPT, list(selectors), first_only, self.max_matches, self.text_limit
+        ) or []
+
+    def evaluate_with_prelude(self, prelude, selectors, first_only=False):
+        """تشغيل سكريبت تمهيدي (مثل بصمة الصفحة) مع تقييم المحددات - يعيد (نتيجة التمهيد، النتائج)"""
+        prelude_result, results = self.driver.execute_script(
+            PRELUDE_TEMPLATE % (prelude, BATCH_EVALUATE_SCRIPT),
+            list(selectors), first_only, self.max_matches, self.text_limit
+        )
+        return prelude_result, results or []
+
+    def bulk_fill(self, fields, installed=False):
+        """ملء حقول النموذج كلها في استدعاء واحد
+
+        fields قائمة قواميس {name, aliases, value} أو نصها بصيغة JSON - يعيد تقريراً لكل حقل
+        يحتوي على: filled, alias, strategy, tag, error
+        installed=True يستدعي الدالة المثبتة مسبقاً في الصفحة (BULK_FILL_INSTALL) بدلاً من إرسالها
+        """
+        if not fields:
+            return {}
+        if installed:
+            report = self.driver.execute_script(BULK_FILL_CALL, fields)
+            if report is not None:
+                return report
+        return self.driver.execute_script(BULK_FILL_SCRIPT, fields) or {}
+
+    def iter_matches(self, selectors, first_only=False, require_visible=True, require_enabled=True):
+        """إرجاع التطابقات المؤهلة مرتبة حسب ترتيب المحددات مع المحدد الذي طابقها"""
+        return self.qualify(self.evaluate(selectors, first_only=first_only), require_visible, require_enabled)
+
+    def qualify(self, entries, require_visible=True, require_enabled=True):
+        """تصفية نتائج evaluate إلى التطابقات المؤهلة مع المحدد الذي طابقها"""
+        matches = []
+        for entry in entries:
+            for match in entry.get('matches', []):
+                if require_visible and not match.get('visible'):
+                    continue
+                if require_enabled and not match.get('enabled'):
+                    continue
+                match['selector'] = entry.get('selector')
+                matches.append(match)
+        return matches
+
+    def first_match(self, selectors, first_only=False, require_visible=True, require_enabled=True):
+        """إرجاع أول تطابق مؤهل أو None"""
+        matches = self.iter_matches(
+            selectors, first_only=first_only,
+            require_visible=require_visible, require_enabled=require_enabled
+        )
+        return matches[0] if matches else None
+
+    def unique_matches(self, selectors, require_visible=True, require_enabled=True, exclude_class=None):
+        """إرجاع التطابقات المؤهلة بدون تكرار نفس العنصر عبر محددات مختلفة"""
+        return self.deduplicate(
+            self.iter_matches(selectors, require_visible=require_visible, require_enabled=require_enabled),
+            exclude_class
+        )
+
+    @staticmethod
+    def deduplicate(matches, exclude_class=None):
+        """إزالة تكرار نفس العنصر واستبعاد العناصر التي تحمل exclude_class"""
+        unique = []
+        seen = set()
+        for match in matches:
+            if exclude_class and exclude_class in (match.get('class') or '').lower():
+                continue
+            element = match.get('element')
+            key = getattr(element, 'id', None) or id(element)
+            if key in seen:
+                continue
+            seen.add(key)
+            unique.append(match)
+        return unique
+
+
+# حقول نموذج الحجز وأسماؤها البديلة بالعربية والإنجليزية
+FORM_FIELD_ALIASES = {
+    'full_name': [
+        'full_name', 'fullName', 'name', 'الاسم الكامل', 'اسم كامل',
+        'first_name', 'firstName', 'fname', 'given_name', 'الاسم الأول',
+        'last_name', 'lastName', 'lname', 'family_name', 'الاسم الأخير'
+    ],
+    'email': [
+        'email', 'email_address', 'البريد الإلكتروني', 'بريد إلكتروني',
+        'e_mail', 'emailAddress'
+    ],
+    'phone_number': [
+        'phone', 'telephone', 'mobile', 'رقم الهاتف', 'هاتف',
+        'phone_number', 'phoneNumber', 'tel', 'contact'
+    ],
+    'passport_number': [
+        'passport', 'passport_number', 'رقم الجواز', 'جواز السفر',
+        'passportNumber', 'passport_no', 'document_number'
+    ],
+    'nationality': [
+        'nationality', 'country', 'الجنسية', 'بلد',
+        'birth_country', 'citizen'
+    ],
+    'birth_date': [
+        'birth_date', 'dob', 'date_of_birth', 'تاريخ الميلاد',
+        'birthDate', 'dateOfBirth', 'birthday'
+    ]
+}
+
+# طرق البحث عن حقول النموذج بحسب الاسم البديل للحقل
+FIELD_SEARCH_STRATEGIES = [
+    ("البحث بالاسم", "//*[@name='{alias}']"),
+    ("البحث بالـ ID", "//*[@id='{alias}']"),
+    ("البحث بالـ placeholder", "//input[@placeholder='{alias}']"),
+    ("البحث بالـ placeholder (يحتوي)", "//input[contains(@placeholder, '{alias}')]"),
+    ("البحث بالـ label", "//input[following-sibling::label[contains(text(), '{alias}')] or preceding-sibling::label[contains(text(), '{alias}')]]"),
+    ("البحث بالنص القريب", "//input[..//*[contains(text(), '{alias}')]]")
+]
+
+
+def field_locators(aliases):
+    """بناء قائمة (اسم الطريقة، XPath) لكل اسم بديل بنفس ترتيب البحث الأصلي"""
+    locators = []
+    for alias in aliases:
+        for method_name, template in FIELD_SEARCH_STRATEGIES:
+            locators.append((method_name, template.format(alias=alias)))
+    return locators
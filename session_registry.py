@@ -0,0 +1,153 @@
+"""
+سجل جلسات المراقبة المتعددة لتطبيق حجز فيزا إسبانيا
+Registry of concurrent monitoring sessions keyed by the bookings.session_id,
+each with its own state, lifecycle and stop signal; the work itself runs as
+scheduler jobs, so sessions hold no threads
+"""
+
+import threading
+from datetime import datetime
+
+# حالات الجلسة
+STATUS_RUNNING = 'running'
+STATUS_STOPPED = 'stopped'
+STATUS_BOOKED = 'booked'
+STATUS_FAILED = 'failed'
+
+
+class MonitoringSession:
+    """جلسة مراقبة واحدة لمستخدم واحد"""
+
+    def __init__(self, session_id, user_data):
+        self.session_id = session_id
+        self.user_data = user_data
+        self.status = STATUS_RUNNING
+        self.stop_event = threading.Event()
+        self.booking_job = None
+        self.booking_payload = None
+        self.consecutive_errors = 0
+        self.started_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        self.finished_at = None
+        self.last_check = None
+        self.checks = 0
+        self.last_error = None
+        self._stop_callbacks = []
+
+    def is_active(self):
+        return self.status == STATUS_RUNNING and not self.stop_event.is_set()
+
+    def stop(self):
+        """إرسال إشارة الإيقاف للجلسة وإلغاء المهام والاشتراكات المرتبطة بها فوراً"""
+        if self.stop_event.is_set():
+            return
+        self.stop_event.set()
+        if self.booking_job:
+            self.booking_job.cancel()
+        for callback in list(self._stop_callbacks):
+            try:
+                callback()
+            except Exception as e:
+                print(f"⚠️ خطأ في إيقاف الجلسة {self.session_id}: {e}")
+
+    def add_stop_callback(self, callback):
+        """تسجيل دالة تُستدعى عند إيقاف الجلسة"""
+        self._stop_callbacks.append(callback)
+
+    def record_check(self):
+        self.checks += 1
+        self.last_check = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+    def finish(self, status, error=None):
+        """إنهاء الجلسة بحالة نهائية"""
+        if self.status == STATUS_RUNNING:
+            self.status = status
+            self.finished_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        if error:
+            self.last_error = str(error)
+        self.stop()
+
+    def to_dict(self):
+        return {
+            'session_id': self.session_id,
+            'status': self.status,
+            'monitoring_active': self.is_active(),
+            'full_name': self.user_data.get('full_name'),
+            'preferred_city': self.user_data.get('preferred_city'),
+            'visa_type': self.user_data.get('visa_type'),
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'last_check': self.last_check,
+            'checks': self.checks,
+            'booking_in_progress': bool(self.booking_job and not self.booking_job.done),
+            'last_error': self.last_error
+        }
+
+
+class SessionRegistry:
+    """تشغيل وإيقاف جلسات المراقبة المتزامنة داخل عملية واحدة"""
+
+    def __init__(self, max_sessions=50):
+        self.max_sessions = max_sessions
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def start(self, session_id, user_data, on_start):
+        """بدء جلسة جديدة واستدعاء on_start(session) لجدولة مهامها - يعيد (الجلسة، هل أنشئت الآن)"""
+        with self._lock:
+            existing = self._sessions.get(session_id)
+            if existing and existing.is_active():
+                return existing, False
+
+            # حذف الجلسات المنتهية القديمة حتى لا يتضخم السجل
+            if len(self._sessions) >= self.max_sessions * 4:
+                self._drop_finished()
+
+            if self.active_count(locked=True) >= self.max_sessions:
+                raise RuntimeError(f"تم الوصول للحد الأقصى من جلسات المراقبة ({self.max_sessions})")
+
+            session = MonitoringSession(session_id, user_data)
+            self._sessions[session_id] = session
+
+        try:
+            on_start(session)
+        except Exception as e:
+            print(f"❌ خطأ غير متوقع في بدء جلسة {session.session_id}: {e}")
+            session.finish(STATUS_FAILED, e)
+        return session, True
+
+    def stop(self, session_id):
+        """إيقاف جلسة - يعيد الجلسة أو None إن لم توجد"""
+        session = self.get(session_id)
+        if session:
+            session.finish(STATUS_STOPPED)
+        return session
+
+    def stop_all(self):
+        with self._lock:
+            sessions = list(self._sessions.values())
+        for session in sessions:
+            session.finish(STATUS_STOPPED)
+
+    def get(self, session_id):
+        with self._lock:
+            return self._sessions.get(session_id)
+
+    def active_count(self, locked=False):
+        if locked:
+            return sum(1 for s in self._sessions.values() if s.is_active())
+        with self._lock:
+            return sum(1 for s in self._sessions.values() if s.is_active())
+
+    def sessions(self):
+        with self._lock:
+            return list(self._sessions.values())
+
+    def prune(self):
+        """حذف الجلسات المنتهية من الذاكرة"""
+        with self._lock:
+            self._drop_finished()
+
+    def _drop_finished(self):
+        for session_id in [k for k, s in self._sessions.items() if not s.is_active()]:
+            del self._sessions[session_id]
+
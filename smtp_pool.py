@@ -0,0 +1,228 @@
+"""
+مجمع اتصالات SMTP دائمة لإرسال الإيميلات
+Pooled SMTP transport - keeps authenticated (STARTTLS + login) connections alive between
+sends, expires idle ones, reconnects on failure and sends many messages per connection
+"""
+
+import logging
+import smtplib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+# أخطاء تعني أن الاتصال نفسه لم يعد صالحاً (وليس رفض الرسالة)
+CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, OSError)
+
+
+class PooledSMTPConnection:
+    """اتصال SMTP مُصادق عليه مع وقت فتحه وآخر استخدام وعدد رسائله"""
+
+    def __init__(self, smtp):
+        self.smtp = smtp
+        self.opened_at = time.time()
+        self.last_used = self.opened_at
+        self.messages = 0
+
+    def close(self):
+        try:
+            self.smtp.quit()
+        except Exception:
+            try:
+                self.smtp.close()
+            except Exception:
+                pass
+
+
+class SMTPPool:
+    """مجمع اتصالات SMTP آمن للخيوط - حتى size اتصالات مفتوحة في الوقت نفسه
+
+    الاتصال الخامل أكثر من idle_timeout ثانية يُغلق، والخامل أكثر من check_after ثانية يُفحص
+    بـ NOOP قبل استخدامه. بعد max_messages رسالة يُفتح اتصال جديد (حدود الخوادم لكل جلسة)
+    """
+
+    def __init__(self, host, port, user='', password='', size=2, idle_timeout=60, check_after=10,
+                 max_messages=100, timeout=30, use_starttls=True, smtp_class=smtplib.SMTP):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.check_after = check_after
+        self.max_messages = max_messages
+        self.timeout = timeout
+        self.use_starttls = use_starttls
+        self.smtp_class = smtp_class
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+        self._handshake_ms = 0.0
+        self.counters = {
+            'connections_opened': 0,
+            'connections_closed': 0,
+            'reused': 0,
+            'reconnects': 0,
+            'messages_sent': 0,
+            'messages_failed': 0,
+            'timeouts': 0
+        }
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def _open(self):
+        """فتح اتصال جديد: الاتصال و STARTTLS وتسجيل الدخول (الجزء المكلف الذي يوفره المجمع)"""
+        started = time.perf_counter()
+        smtp = self.smtp_class(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.use_starttls:
+                smtp.starttls()
+            if self.user:
+                smtp.login(self.user, self.password)
+        except Exception:
+            smtp.close()
+            raise
+        with self._lock:
+            self.counters['connections_opened'] += 1
+            self._handshake_ms += (time.perf_counter() - started) * 1000
+        return PooledSMTPConnection(smtp)
+
+    def _discard(self, conn):
+        conn.close()
+        self._count('connections_closed')
+
+    def _usable(self, conn):
+        idle = time.time() - conn.last_used
+        if idle > self.idle_timeout or conn.messages >= self.max_messages:
+            return False
+        if idle > self.check_after:
+            try:
+                return conn.smtp.noop()[0] == 250
+            except Exception:
+                return False
+        return True
+
+    def _checkout(self):
+        while True:
+            with self._lock:
+                # الأحدث استخداماً أولاً - أقرب للبقاء مفتوحاً عند الخادم
+                conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                return self._open()
+            if self._usable(conn):
+                self._count('reused')
+                return conn
+            self._discard(conn)
+
+    @contextmanager
+    def connection(self):
+        """اتصال من المجمع - يُعاد إليه بعد الاستخدام أو يُغلق إن انقطع"""
+        if not self._slots.acquire(timeout=self.timeout):
+            self._count('timeouts')
+            raise TimeoutError("انتهت مهلة انتظار اتصال SMTP من المجمع")
+        holder = {'conn': None}
+        try:
+            holder['conn'] = self._checkout()
+            yield holder
+        finally:
+            conn = holder['conn']
+            if conn is not None:
+                conn.last_used = time.time()
+                with self._lock:
+                    self._idle.append(conn)
+            self._slots.release()
+
+    def _send_on(self, holder, msg):
+        """إرسال رسالة على اتصال المجمع - عند انقطاعه يُعاد الاتصال وتُعاد المحاولة مرة واحدة"""
+        for attempt in range(2):
+            conn = holder['conn']
+            try:
+                conn.smtp.send_message(msg)
+                conn.messages += 1
+                return True
+            except CONNECTION_ERRORS as e:
+                holder['conn'] = None
+                self._discard(conn)
+                if attempt:
+                    raise
+                logging.warning(f"⚠️ انقطع اتصال SMTP، إعادة الاتصال: {e}")
+                self._count('reconnects')
+                holder['conn'] = self._open()
+
+    def send(self, msg):
+        """إرسال رسالة واحدة - يرفع الاستثناء عند الفشل"""
+        with self.connection() as holder:
+            try:
+                self._send_on(holder, msg)
+            except Exception:
+                self._count('messages_failed')
+                raise
+        self._count('messages_sent')
+        return True
+
+    def _send_chunk(self, messages):
+        results = []
+        try:
+            with self.connection() as holder:
+                for msg in messages:
+                    try:
+                        self._send_on(holder, msg)
+                        results.append(None)
+                    except Exception as e:
+                        results.append(str(e) or type(e).__name__)
+                        if holder['conn'] is None:
+                            holder['conn'] = self._open()
+        except Exception as e:
+            results.extend([str(e) or type(e).__name__] * (len(messages) - len(results)))
+        failed = sum(1 for error in results if error)
+        self._count('messages_sent', len(results) - failed)
+        self._count('messages_failed', failed)
+        return results
+
+    def send_many(self, messages):
+        """إرسال عدة رسائل موزعة على اتصالات المجمع (عدة رسائل لكل اتصال)
+
+        يعيد قائمة بنفس الترتيب: None للرسالة المرسلة أو نص الخطأ
+        """
+        messages = list(messages)
+        if not messages:
+            return []
+        workers = max(1, min(self.size, len(messages)))
+        chunks = [messages[i::workers] for i in range(workers)]
+        if workers == 1:
+            chunk_results = [self._send_chunk(chunks[0])]
+        else:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='smtp-send') as executor:
+                chunk_results = list(executor.map(self._send_chunk, chunks))
+        results = [None] * len(messages)
+        for offset, chunk in enumerate(chunk_results):
+            for index, error in enumerate(chunk):
+                results[offset + index * workers] = error
+        return results
+
+    def prune(self):
+        """إغلاق الاتصالات الخاملة أكثر من idle_timeout"""
+        now = time.time()
+        with self._lock:
+            expired = [conn for conn in self._idle if now - conn.last_used > self.idle_timeout]
+            self._idle = [conn for conn in self._idle if conn not in expired]
+        for conn in expired:
+            self._discard(conn)
+        return len(expired)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            self._discard(conn)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters, idle=len(self._idle), size=self.size)
+            handshake_ms = self._handshake_ms
+        stats['avg_handshake_ms'] = (
+            round(handshake_ms / stats['connections_opened'], 2) if stats['connections_opened'] else None
+        )
+        return stats
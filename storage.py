@@ -0,0 +1,731 @@
+"""
+طبقة تخزين موحدة للحجوزات وسجل الإشعارات
+Unified storage layer - one pooled SQLite/PostgreSQL database (DATABASE_URL) shared by
+the booking app, notification system and dashboard, with versioned schema migrations,
+indexes and batched writes
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import nullcontext
+from datetime import datetime, timedelta
+from db_pool import Database
+
+# قاعدة بيانات الإشعارات القديمة - تُنقل بياناتها مرة واحدة إلى القاعدة الموحدة
+LEGACY_NOTIFICATIONS_DB = 'notifications.db'
+
+# كل ترحيل: (الإصدار، الاسم، أوامر SQL لكل نوع قاعدة بيانات أو دالة (storage, conn))
+MIGRATIONS = [
+    (1, 'create_bookings', {
+        'sqlite': '''
+            CREATE TABLE IF NOT EXISTS bookings (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT UNIQUE,
+                full_name TEXT,
+                passport_number TEXT,
+                birth_date TEXT,
+                phone_number TEXT,
+                email TEXT,
+                visa_type TEXT,
+                preferred_city TEXT,
+                whatsapp_number TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                status TEXT DEFAULT 'active'
+            );
+        ''',
+        'postgres': '''
+            CREATE TABLE IF NOT EXISTS bookings (
+                id SERIAL PRIMARY KEY,
+                session_id VARCHAR(255) UNIQUE,
+                full_name VARCHAR(255),
+                passport_number VARCHAR(50),
+                birth_date VARCHAR(20),
+                phone_number VARCHAR(20),
+                email VARCHAR(255),
+                visa_type VARCHAR(100),
+                preferred_city VARCHAR(100),
+                whatsapp_number VARCHAR(20),
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                status VARCHAR(20) DEFAULT 'active'
+            );
+        '''
+    }),
+    (2, 'create_notification_log', {
+        'sqlite': '''
+            CREATE TABLE IF NOT EXISTS booking_logs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                booking_date TEXT NOT NULL,
+                full_name TEXT NOT NULL,
+                passport_number TEXT,
+                email TEXT,
+                phone TEXT,
+                visa_type TEXT,
+                nationality TEXT,
+                booking_id TEXT,
+                status TEXT DEFAULT 'SUCCESS'
+            );
+            CREATE TABLE IF NOT EXISTS notification_status (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                booking_id TEXT NOT NULL,
+                email_sent BOOLEAN DEFAULT 0,
+                telegram_sent BOOLEAN DEFAULT 0,
+                whatsapp_sent BOOLEAN DEFAULT 0,
+                created_at TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS booking_notifications (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                booking_id TEXT,
+                user_name TEXT,
+                user_email TEXT,
+                visa_type TEXT,
+                appointment_date TEXT,
+                booking_status TEXT,
+                notification_sent BOOLEAN DEFAULT FALSE,
+                email_sent BOOLEAN DEFAULT FALSE,
+                telegram_sent BOOLEAN DEFAULT FALSE,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                notification_details TEXT
+            );
+        ''',
+        'postgres': '''
+            CREATE TABLE IF NOT EXISTS booking_logs (
+                id SERIAL PRIMARY KEY,
+                booking_date VARCHAR(20) NOT NULL,
+                full_name VARCHAR(255) NOT NULL,
+                passport_number VARCHAR(50),
+                email VARCHAR(255),
+                phone VARCHAR(30),
+                visa_type VARCHAR(100),
+                nationality VARCHAR(100),
+                booking_id VARCHAR(100),
+                status VARCHAR(20) DEFAULT 'SUCCESS'
+            );
+            CREATE TABLE IF NOT EXISTS notification_status (
+                id SERIAL PRIMARY KEY,
+                booking_id VARCHAR(100) NOT NULL,
+                email_sent BOOLEAN DEFAULT FALSE,
+                telegram_sent BOOLEAN DEFAULT FALSE,
+                whatsapp_sent BOOLEAN DEFAULT FALSE,
+                created_at VARCHAR(20) NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS booking_notifications (
+                id SERIAL PRIMARY KEY,
+                booking_id VARCHAR(100),
+                user_name VARCHAR(255),
+                user_email VARCHAR(255),
+                visa_type VARCHAR(100),
+                appointment_date VARCHAR(20),
+                booking_status VARCHAR(20),
+                notification_sent BOOLEAN DEFAULT FALSE,
+                email_sent BOOLEAN DEFAULT FALSE,
+                telegram_sent BOOLEAN DEFAULT FALSE,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                notification_details TEXT
+            );
+        '''
+    }),
+    # INSERT OR REPLACE القديم لم يجد قيداً فريداً فكان يضيف صفاً لكل تحديث - يُبقى الأحدث فقط
+    (3, 'notification_log_indexes', {
+        'sqlite': '''
+            DELETE FROM notification_status
+            WHERE id NOT IN (SELECT MAX(id) FROM notification_status GROUP BY booking_id);
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_notification_status_booking ON notification_status (booking_id);
+            CREATE INDEX IF NOT EXISTS idx_booking_logs_date ON booking_logs (booking_date);
+            CREATE INDEX IF NOT EXISTS idx_booking_logs_booking ON booking_logs (booking_id);
+            CREATE INDEX IF NOT EXISTS idx_booking_logs_visa_type ON booking_logs (visa_type, booking_date);
+            CREATE INDEX IF NOT EXISTS idx_booking_notifications_booking ON booking_notifications (booking_id);
+            CREATE INDEX IF NOT EXISTS idx_booking_notifications_created ON booking_notifications (created_at);
+            CREATE INDEX IF NOT EXISTS idx_bookings_status ON bookings (status);
+        ''',
+        'postgres': '''
+            DELETE FROM notification_status
+            WHERE id NOT IN (SELECT MAX(id) FROM notification_status GROUP BY booking_id);
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_notification_status_booking ON notification_status (booking_id);
+            CREATE INDEX IF NOT EXISTS idx_booking_logs_date ON booking_logs (booking_date);
+            CREATE INDEX IF NOT EXISTS idx_booking_logs_booking ON booking_logs (booking_id);
+            CREATE INDEX IF NOT EXISTS idx_booking_logs_visa_type ON booking_logs (visa_type, booking_date);
+            CREATE INDEX IF NOT EXISTS idx_booking_notifications_booking ON booking_notifications (booking_id);
+            CREATE INDEX IF NOT EXISTS idx_booking_notifications_created ON booking_notifications (created_at);
+            CREATE INDEX IF NOT EXISTS idx_bookings_status ON bookings (status);
+        '''
+    }),
+    (4, 'import_legacy_notifications_db', lambda storage, conn: storage.import_legacy_notifications(conn)),
+    (5, 'create_notification_outbox', {
+        'sqlite': '''
+            CREATE TABLE IF NOT EXISTS notification_outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                idempotency_key TEXT NOT NULL UNIQUE,
+                booking_id TEXT NOT NULL,
+                channel TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL,
+                last_error TEXT,
+                created_at TEXT NOT NULL,
+                sent_at TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_notification_outbox_due ON notification_outbox (status, next_attempt_at);
+            CREATE INDEX IF NOT EXISTS idx_notification_outbox_booking ON notification_outbox (booking_id);
+        ''',
+        'postgres': '''
+            CREATE TABLE IF NOT EXISTS notification_outbox (
+                id SERIAL PRIMARY KEY,
+                idempotency_key VARCHAR(200) NOT NULL UNIQUE,
+                booking_id VARCHAR(100) NOT NULL,
+                channel VARCHAR(30) NOT NULL,
+                payload TEXT NOT NULL,
+                status VARCHAR(20) NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at DOUBLE PRECISION NOT NULL,
+                last_error TEXT,
+                created_at VARCHAR(20) NOT NULL,
+                sent_at VARCHAR(20)
+            );
+            CREATE INDEX IF NOT EXISTS idx_notification_outbox_due ON notification_outbox (status, next_attempt_at);
+            CREATE INDEX IF NOT EXISTS idx_notification_outbox_booking ON notification_outbox (booking_id);
+        '''
+    }),
+    # معرف الحجز قد يتكرر بين حجزين - حالة التسليم تُقرأ وتُكتب بمفتاح إشعارات الحجز
+    (6, 'notification_keys', {
+        'sqlite': '''
+            ALTER TABLE notification_outbox ADD COLUMN notification_key TEXT;
+            UPDATE notification_outbox
+            SET notification_key = substr(idempotency_key, 1, length(idempotency_key) - length(channel) - 1);
+            CREATE INDEX IF NOT EXISTS idx_notification_outbox_key ON notification_outbox (notification_key);
+            ALTER TABLE booking_notifications ADD COLUMN notification_key TEXT;
+            CREATE INDEX IF NOT EXISTS idx_booking_notifications_key ON booking_notifications (notification_key);
+        ''',
+        'postgres': '''
+            ALTER TABLE notification_outbox ADD COLUMN IF NOT EXISTS notification_key VARCHAR(100);
+            UPDATE notification_outbox
+            SET notification_key = substr(idempotency_key, 1, length(idempotency_key) - length(channel) - 1);
+            CREATE INDEX IF NOT EXISTS idx_notification_outbox_key ON notification_outbox (notification_key);
+            ALTER TABLE booking_notifications ADD COLUMN IF NOT EXISTS notification_key VARCHAR(100);
+            CREATE INDEX IF NOT EXISTS idx_booking_notifications_key ON booking_notifications (notification_key);
+        '''
+    }),
+    # معرف الرسالة لدى المزود (message_id في تيليجرام، Message-ID في الإيميل) يُحفظ فور نجاح الإرسال
+    (7, 'outbox_receipts', {
+        'sqlite': 'ALTER TABLE notification_outbox ADD COLUMN provider_message_id TEXT;',
+        'postgres': 'ALTER TABLE notification_outbox ADD COLUMN IF NOT EXISTS provider_message_id VARCHAR(200);'
+    })
+]
+
+OUTBOX_PENDING = 'pending'
+OUTBOX_SENT = 'sent'
+OUTBOX_DEAD = 'dead'
+
+_BOOKING_LOG_COLUMNS = ('booking_date', 'full_name', 'passport_number', 'email', 'phone',
+                        'visa_type', 'nationality', 'booking_id', 'status')
+_BOOKING_NOTIFICATION_COLUMNS = ('booking_id', 'user_name', 'user_email', 'visa_type', 'appointment_date',
+                                 'booking_status', 'notification_sent', 'email_sent', 'telegram_sent',
+                                 'created_at', 'notification_details')
+_NOTIFICATION_STATUS_COLUMNS = ('booking_id', 'email_sent', 'telegram_sent', 'whatsapp_sent', 'created_at')
+
+
+def _insert_sql(table, columns):
+    return f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['?'] * len(columns))})"
+
+
+def _now():
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+def booking_id_for(booking_details):
+    """معرف الحجز من تفاصيله أو معرف تلقائي بالتوقيت الحالي"""
+    return booking_details.get('booking_id', 'AUTO-' + str(int(datetime.now().timestamp())))
+
+
+def with_notification_key(booking_details):
+    """تفاصيل الحجز مع مفتاح إشعارات فريد (uuid) - معرف الحجز قد يتكرر (دقته ثانية، ومعرفات ثابتة في العروض)
+
+    المفتاح يُحفظ مع تفاصيل الحجز في السجل، ويبقى نفسه عند إعادة كتابة الدفعة أو استرجاعها من القرص
+    """
+    if booking_details.get('notification_key'):
+        return booking_details
+    return dict(booking_details, notification_key=uuid.uuid4().hex)
+
+
+class BookingRepository:
+    """بيانات المستخدمين لكل جلسة (جدول bookings)"""
+
+    def __init__(self, db):
+        self.db = db
+        db.register('save_user_data',
+            sqlite='''
+                INSERT OR REPLACE INTO bookings (session_id, full_name, passport_number, birth_date,
+                                               phone_number, email, visa_type, preferred_city, whatsapp_number)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''',
+            postgres='''
+                INSERT INTO bookings (session_id, full_name, passport_number, birth_date,
+                                    phone_number, email, visa_type, preferred_city, whatsapp_number)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                ON CONFLICT (session_id) DO UPDATE SET
+                    full_name = EXCLUDED.full_name,
+                    passport_number = EXCLUDED.passport_number,
+                    birth_date = EXCLUDED.birth_date,
+                    phone_number = EXCLUDED.phone_number,
+                    email = EXCLUDED.email,
+                    visa_type = EXCLUDED.visa_type,
+                    preferred_city = EXCLUDED.preferred_city,
+                    whatsapp_number = EXCLUDED.whatsapp_number
+            ''')
+        db.register('load_user_data', sql='SELECT * FROM bookings WHERE session_id = ?')
+
+    def save(self, session_id, data):
+        self.db.execute('save_user_data', (
+            session_id, data.get('full_name'), data.get('passport_number'),
+            data.get('birth_date'), data.get('phone_number'), data.get('email'),
+            data.get('visa_type'), data.get('preferred_city'), data.get('whatsapp_number')
+        ))
+
+    def load(self, session_id):
+        return self.db.execute('load_user_data', (session_id,), fetch='one_dict')
+
+
+class OutboxRepository:
+    """صندوق الإشعارات الصادرة (notification_outbox) - رسالة لكل (حجز، قناة) بمفتاح منع التكرار
+
+    الرسالة المحجوزة للإرسال تبقى pending مع تأجيل next_attempt_at بمدة الحجز، فإذا توقفت
+    العملية أثناء الإرسال تعود الرسالة مستحقة بعد انتهاء المدة
+    """
+
+    def __init__(self, db):
+        self.db = db
+        db.register('enqueue_outbox', sql='''
+            INSERT INTO notification_outbox
+                (idempotency_key, notification_key, booking_id, channel, payload, next_attempt_at, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (idempotency_key) DO NOTHING
+        ''')
+        db.register('due_outbox', sql='''
+            SELECT id, idempotency_key, notification_key, booking_id, channel, payload, attempts, next_attempt_at
+            FROM notification_outbox
+            WHERE status = 'pending' AND next_attempt_at <= ?
+            ORDER BY next_attempt_at
+            LIMIT ?
+        ''')
+        db.register('lease_outbox', sql='''
+            UPDATE notification_outbox SET next_attempt_at = ?, attempts = attempts + 1
+            WHERE id = ? AND status = 'pending' AND next_attempt_at = ?
+        ''')
+        db.register('outbox_sent', sql='''
+            UPDATE notification_outbox SET status = 'sent', sent_at = ?, provider_message_id = ?, last_error = NULL
+            WHERE id = ? AND status = 'pending'
+        ''')
+        # الرسالة المرسلة لا تعود إلى الصندوق ولا تُنقل إلى الرسائل الميتة
+        db.register('outbox_retry', sql='''
+            UPDATE notification_outbox SET next_attempt_at = ?, last_error = ? WHERE id = ? AND status = 'pending'
+        ''')
+        db.register('outbox_dead', sql='''
+            UPDATE notification_outbox SET status = 'dead', last_error = ? WHERE id = ? AND status = 'pending'
+        ''')
+        db.register('outbox_delivery_state', sql='''
+            SELECT channel, status FROM notification_outbox WHERE notification_key = ?
+        ''')
+        db.register('outbox_counts', sql='SELECT status, COUNT(*) FROM notification_outbox GROUP BY status')
+        db.register('outbox_next_due', sql="SELECT MIN(next_attempt_at) FROM notification_outbox WHERE status = 'pending'")
+        db.register('outbox_dead_letters', sql='''
+            SELECT id, idempotency_key, booking_id, channel, attempts, last_error, created_at
+            FROM notification_outbox WHERE status = 'dead' ORDER BY id DESC LIMIT ?
+        ''')
+        db.register('outbox_requeue_dead', sql='''
+            UPDATE notification_outbox SET status = 'pending', attempts = 0, next_attempt_at = ? WHERE status = 'dead'
+        ''')
+        db.register('outbox_requeue_dead_one', sql='''
+            UPDATE notification_outbox SET status = 'pending', attempts = 0, next_attempt_at = ?
+            WHERE status = 'dead' AND id = ?
+        ''')
+
+    @staticmethod
+    def message(booking_id, channel, user_data, booking_details):
+        """صف رسالة للصندوق - المفتاح (مفتاح إشعارات الحجز:القناة) يمنع تكرار الرسالة نفسها فقط"""
+        payload = json.dumps({'user_data': user_data, 'booking_details': booking_details}, ensure_ascii=False)
+        notification_key = booking_details['notification_key']
+        return f"{notification_key}:{channel}", notification_key, booking_id, channel, payload
+
+    def enqueue(self, messages, conn=None):
+        now, created_at = time.time(), _now()
+        rows = [message + (now, created_at) for message in messages]
+        with (nullcontext(conn) if conn is not None else self.db.connection()) as conn:
+            self.db.execute_many('enqueue_outbox', rows, conn=conn)
+        return len(rows)
+
+    def claim(self, limit, lease):
+        """حجز حتى limit رسالة مستحقة لمدة lease ثانية - يعيد الرسائل التي نجح حجزها"""
+        now = time.time()
+        claimed = []
+        with self.db.connection() as conn:
+            for row in self.db.run(conn, 'due_outbox', (now, limit), fetch='all_dicts'):
+                # الشرط على next_attempt_at السابق يمنع عاملاً آخر من حجز الرسالة نفسها
+                if self.db.run(conn, 'lease_outbox', (now + lease, row['id'], row['next_attempt_at'])) == 1:
+                    row['attempts'] += 1
+                    row['payload'] = json.loads(row['payload'])
+                    claimed.append(row)
+        return claimed
+
+    def mark_sent(self, message_id, receipt=None):
+        """تسجيل نجاح إرسال رسالة فور انتهائه مع معرفها لدى المزود - لا تُحجز للإرسال مرة أخرى"""
+        return self.db.execute('outbox_sent', (_now(), receipt, message_id))
+
+    def settle(self, retry=(), dead=()):
+        """حفظ نتائج الإرسال الفاشلة: retry [(next_attempt_at, error, id)]، dead [(error, id)]"""
+        with self.db.connection() as conn:
+            self.db.execute_many('outbox_retry', retry, conn=conn)
+            self.db.execute_many('outbox_dead', dead, conn=conn)
+
+    def delivery_state(self, notification_key):
+        """حالة رسائل حجز واحد لكل قناة {channel: status}"""
+        return dict(self.db.execute('outbox_delivery_state', (notification_key,), fetch='all'))
+
+    def next_due(self):
+        return self.db.execute('outbox_next_due', fetch='one')[0]
+
+    def counts(self):
+        counts = {OUTBOX_PENDING: 0, OUTBOX_SENT: 0, OUTBOX_DEAD: 0}
+        counts.update(dict(self.db.execute('outbox_counts', fetch='all')))
+        return counts
+
+    def dead_letters(self, limit=50):
+        return self.db.execute('outbox_dead_letters', (limit,), fetch='all_dicts')
+
+    def requeue_dead(self, message_id=None):
+        """إعادة الرسائل الميتة (أو رسالة واحدة) إلى الصندوق - يعيد عددها"""
+        if message_id is None:
+            return self.db.execute('outbox_requeue_dead', (time.time(),))
+        return self.db.execute('outbox_requeue_dead_one', (time.time(), message_id))
+
+
+class NotificationLogRepository:
+    """سجل الحجوزات الناجحة وحالة إشعاراتها (booking_logs و booking_notifications و notification_status)
+
+    الاستعلامات بالتاريخ تستخدم نطاقاً على النص (>= و <) بدلاً من DATE() حتى تستفيد من الفهارس
+    """
+
+    def __init__(self, db, outbox=None):
+        self.db = db
+        self.outbox = outbox
+        db.register('insert_booking_log', sql=_insert_sql('booking_logs', _BOOKING_LOG_COLUMNS))
+        db.register('insert_booking_notification', sql=_insert_sql('booking_notifications', (
+            'booking_id', 'user_name', 'user_email', 'visa_type', 'appointment_date',
+            'booking_status', 'notification_details', 'notification_key')))
+        db.register('import_booking_notification', sql=_insert_sql('booking_notifications', _BOOKING_NOTIFICATION_COLUMNS))
+        db.register('upsert_notification_status', sql=_insert_sql('notification_status', _NOTIFICATION_STATUS_COLUMNS) + '''
+            ON CONFLICT (booking_id) DO UPDATE SET
+                email_sent = EXCLUDED.email_sent,
+                telegram_sent = EXCLUDED.telegram_sent,
+                whatsapp_sent = EXCLUDED.whatsapp_sent,
+                created_at = EXCLUDED.created_at
+        ''')
+        db.register('update_booking_notification', sql='''
+            UPDATE booking_notifications
+            SET email_sent = ?, telegram_sent = ?, notification_sent = ?
+            WHERE booking_id = ?
+        ''')
+        db.register('update_booking_notification_by_key', sql='''
+            UPDATE booking_notifications
+            SET email_sent = ?, telegram_sent = ?, notification_sent = ?
+            WHERE notification_key = ?
+        ''')
+        db.register('count_booking_logs', sql='SELECT COUNT(*) FROM booking_logs')
+        db.register('count_booking_logs_by_visa', sql='SELECT COUNT(*) FROM booking_logs WHERE visa_type = ?')
+        db.register('count_booking_logs_since', sql='''
+            SELECT COUNT(*) FROM booking_logs WHERE booking_date >= ? AND booking_date < ?
+        ''')
+        db.register('count_unique_users', sql='SELECT COUNT(DISTINCT full_name) FROM booking_logs')
+        db.register('last_booking_log', sql='SELECT * FROM booking_logs ORDER BY booking_date DESC LIMIT 1')
+        db.register('last_booking_log_by_visa', sql='''
+            SELECT * FROM booking_logs WHERE visa_type = ? ORDER BY booking_date DESC LIMIT 1
+        ''')
+        db.register('recent_booking_logs', sql='''
+            SELECT booking_date, full_name, passport_number, visa_type, 'نجح' as status
+            FROM booking_logs
+            ORDER BY booking_date DESC
+            LIMIT ?
+        ''')
+        db.register('latest_booking_logs', sql='SELECT * FROM booking_logs ORDER BY booking_date DESC LIMIT ?')
+        db.register('all_booking_logs', sql='SELECT * FROM booking_logs ORDER BY booking_date DESC')
+        db.register('booking_logs_by_visa_type', sql='''
+            SELECT visa_type, COUNT(*) as count
+            FROM booking_logs
+            GROUP BY visa_type
+            ORDER BY count DESC
+        ''')
+        db.register('daily_booking_logs', sql='''
+            SELECT substr(booking_date, 1, 10) as date, COUNT(*) as count
+            FROM booking_logs
+            WHERE booking_date >= ?
+            GROUP BY substr(booking_date, 1, 10)
+            ORDER BY date
+        ''')
+        db.register('find_booking_log', sql='SELECT * FROM booking_logs WHERE booking_id = ? AND visa_type = ?')
+        db.register('notification_status', sql='''
+            SELECT email_sent, telegram_sent, whatsapp_sent FROM notification_status WHERE booking_id = ?
+        ''')
+        db.register('count_booking_notifications', sql='SELECT COUNT(*) FROM booking_notifications')
+        db.register('count_successful_notifications', sql='''
+            SELECT COUNT(*) FROM booking_notifications WHERE booking_status = 'SUCCESS'
+        ''')
+        db.register('count_notifications_since', sql='''
+            SELECT COUNT(*) FROM booking_notifications WHERE created_at >= ? AND created_at < ?
+        ''')
+        db.register('count_notifications_sent', sql='SELECT COUNT(*) FROM booking_notifications WHERE notification_sent')
+
+    def _transaction(self, conn):
+        """معاملة جديدة، أو المعاملة المفتوحة conn إن مُررت (لتجميع عدة عمليات)"""
+        return nullcontext(conn) if conn is not None else self.db.connection()
+
+    def log_bookings(self, entries, conn=None):
+        """تسجيل عدة حجوزات ناجحة دفعة واحدة في معاملة واحدة
+
+        entries: [(user_data, booking_details)] أو [(user_data, booking_details, channels)] - رسائل
+        القنوات تُضاف إلى صندوق الإشعارات في المعاملة نفسها. يعيد معرفات الحجوزات بنفس الترتيب
+        """
+        now = _now()
+        booking_ids, logs, notifications, messages = [], [], [], []
+        for user_data, booking_details, *channels in entries:
+            booking_id = booking_id_for(booking_details)
+            if channels and channels[0]:
+                booking_details = with_notification_key(booking_details)
+            for channel in (channels[0] if channels else ()):
+                messages.append(OutboxRepository.message(booking_id, channel, user_data, booking_details))
+            visa_type = user_data.get('visa_type', 'فيزا دراسة')
+            booking_ids.append(booking_id)
+            logs.append((
+                now, user_data.get('full_name', ''), user_data.get('passport_number', ''),
+                user_data.get('email', ''), user_data.get('phone_number', ''), visa_type,
+                user_data.get('nationality', ''), booking_id, 'SUCCESS'
+            ))
+            notifications.append((
+                booking_id, user_data.get('full_name', ''), user_data.get('email', ''), visa_type,
+                now, 'SUCCESS', json.dumps(booking_details, ensure_ascii=False), booking_details.get('notification_key')
+            ))
+        with self._transaction(conn) as conn:
+            self.db.execute_many('insert_booking_log', logs, conn=conn)
+            self.db.execute_many('insert_booking_notification', notifications, conn=conn)
+            if messages:
+                self.outbox.enqueue(messages, conn=conn)
+        return booking_ids
+
+    def log_booking(self, user_data, booking_details, channels=()):
+        return self.log_bookings([(user_data, booking_details, channels)])[0]
+
+    def update_notification_statuses(self, statuses, conn=None):
+        """حفظ حالة الإشعارات لعدة حجوزات (صف واحد لكل حجز) وتحديث booking_notifications في معاملة واحدة
+
+        statuses: [(booking_id, email_sent, telegram_sent, whatsapp_sent[, notification_key])] - آخر حالة
+        للحجز هي المحفوظة في notification_status، ومع notification_key يُحدَّث صف هذا الحجز فقط في
+        booking_notifications (لا كل الحجوزات التي تشاركه المعرف)
+        """
+        now = _now()
+        upserts, updates, keyed_updates = [], [], []
+        for booking_id, email_sent, telegram_sent, whatsapp_sent, *key in statuses:
+            email_sent, telegram_sent, whatsapp_sent = bool(email_sent), bool(telegram_sent), bool(whatsapp_sent)
+            upserts.append((booking_id, email_sent, telegram_sent, whatsapp_sent, now))
+            if key and key[0]:
+                keyed_updates.append((email_sent, telegram_sent, email_sent or telegram_sent, key[0]))
+            else:
+                updates.append((email_sent, telegram_sent, email_sent or telegram_sent, booking_id))
+        with self._transaction(conn) as conn:
+            self.db.execute_many('upsert_notification_status', upserts, conn=conn)
+            self.db.execute_many('update_booking_notification', updates, conn=conn)
+            self.db.execute_many('update_booking_notification_by_key', keyed_updates, conn=conn)
+
+    def update_notification_status(self, booking_id, email_sent, telegram_sent, whatsapp_sent=False,
+                                   notification_key=None):
+        self.update_notification_statuses([(booking_id, email_sent, telegram_sent, whatsapp_sent, notification_key)])
+
+    def _count(self, conn, name, params=()):
+        return self.db.run(conn, name, params, fetch='one')[0]
+
+    def booking_stats(self):
+        with self.db.connection() as conn:
+            last_booking = self.db.run(conn, 'last_booking_log', fetch='one_dict')
+            return {
+                'total_bookings': self._count(conn, 'count_booking_logs'),
+                'last_booking_date': last_booking['booking_date'] if last_booking else 'لا يوجد',
+                'unique_users': self._count(conn, 'count_unique_users')
+            }
+
+    def recent_bookings(self, limit=5):
+        return self.db.execute('recent_booking_logs', (limit,), fetch='all')
+
+    def notification_statistics(self, today=None):
+        today = today or datetime.now().date()
+        tomorrow = today + timedelta(days=1)
+        with self.db.connection() as conn:
+            total_bookings = self._count(conn, 'count_booking_notifications')
+            successful_bookings = self._count(conn, 'count_successful_notifications')
+            return {
+                'total_bookings': total_bookings,
+                'successful_bookings': successful_bookings,
+                'today_bookings': self._count(conn, 'count_notifications_since',
+                                              (today.isoformat(), tomorrow.isoformat())),
+                'notifications_sent': self._count(conn, 'count_notifications_sent'),
+                'success_rate': (successful_bookings / total_bookings * 100) if total_bookings > 0 else 0
+            }
+
+    def dashboard_statistics(self, today=None):
+        """كل إحصائيات لوحة التحكم في اتصال واحد"""
+        today = today or datetime.now().date()
+        tomorrow = (today + timedelta(days=1)).isoformat()
+        week_ago = (today - timedelta(days=7)).isoformat()
+        with self.db.connection() as conn:
+            return {
+                'total_bookings': self._count(conn, 'count_booking_logs'),
+                'today_bookings': self._count(conn, 'count_booking_logs_since', (today.isoformat(), tomorrow)),
+                'week_bookings': self._count(conn, 'count_booking_logs_since', (week_ago, tomorrow)),
+                'unique_users': self._count(conn, 'count_unique_users'),
+                'last_booking': self.db.run(conn, 'last_booking_log', fetch='one_dict'),
+                'visa_types': self.db.run(conn, 'booking_logs_by_visa_type', fetch='all_dicts'),
+                'recent_bookings': self.db.run(conn, 'latest_booking_logs', (10,), fetch='all_dicts'),
+                'daily_stats': self.db.run(conn, 'daily_booking_logs', (week_ago,), fetch='all_dicts')
+            }
+
+    def all_bookings(self):
+        return self.db.execute('all_booking_logs', fetch='all_dicts')
+
+    def find_booking(self, booking_id, visa_type):
+        return self.db.execute('find_booking_log', (booking_id, visa_type), fetch='one_dict')
+
+    def notification_status(self, booking_id):
+        return self.db.execute('notification_status', (booking_id,), fetch='one_dict')
+
+    def count_bookings(self, visa_type=None):
+        if visa_type is None:
+            return self.db.execute('count_booking_logs', fetch='one')[0]
+        return self.db.execute('count_booking_logs_by_visa', (visa_type,), fetch='one')[0]
+
+    def last_booking(self, visa_type):
+        return self.db.execute('last_booking_log_by_visa', (visa_type,), fetch='one_dict')
+
+
+class Storage:
+    """قاعدة البيانات المشتركة ومستودعاتها وترحيلات مخططها"""
+
+    def __init__(self, db, legacy_notifications_db=LEGACY_NOTIFICATIONS_DB):
+        self.db = db
+        self.legacy_notifications_db = legacy_notifications_db
+        self.bookings = BookingRepository(db)
+        self.outbox = OutboxRepository(db)
+        self.notifications = NotificationLogRepository(db, self.outbox)
+        self._schema_version = None
+
+    @property
+    def backend(self):
+        return self.db.backend
+
+    def _applied_versions(self, conn):
+        if self.backend == 'sqlite':
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version INTEGER PRIMARY KEY, name TEXT NOT NULL, applied_at TEXT NOT NULL
+                )
+            ''')
+            return {row[0] for row in conn.execute('SELECT version FROM schema_migrations')}
+        cursor = conn.cursor()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY, name VARCHAR(100) NOT NULL, applied_at VARCHAR(20) NOT NULL
+            )
+        ''')
+        cursor.execute('SELECT version FROM schema_migrations')
+        return {row[0] for row in cursor.fetchall()}
+
+    def migrate(self):
+        """تطبيق الترحيلات غير المطبقة بالترتيب - كل ترحيل في معاملته - يعيد الإصدارات المطبقة الآن"""
+        with self.db.connection() as conn:
+            applied = self._applied_versions(conn)
+        newly_applied = []
+        for version, name, step in MIGRATIONS:
+            if version in applied:
+                continue
+            with self.db.connection() as conn:
+                if callable(step):
+                    step(self, conn)
+                    placeholder = '?' if self.backend == 'sqlite' else '%s'
+                    conn.cursor().execute(
+                        f"INSERT INTO schema_migrations (version, name, applied_at) "
+                        f"VALUES ({placeholder}, {placeholder}, {placeholder})", (version, name, _now())
+                    )
+                elif self.backend == 'sqlite':
+                    # executescript ينهي المعاملة المفتوحة - الأوامر وتسجيل الإصدار في معاملة صريحة واحدة
+                    conn.executescript(
+                        f"BEGIN;\n{step['sqlite']}\n"
+                        f"INSERT INTO schema_migrations (version, name, applied_at) "
+                        f"VALUES ({int(version)}, '{name}', '{_now()}');\nCOMMIT;"
+                    )
+                else:
+                    cursor = conn.cursor()
+                    cursor.execute(step['postgres'])
+                    cursor.execute('INSERT INTO schema_migrations (version, name, applied_at) VALUES (%s, %s, %s)',
+                                   (version, name, _now()))
+            newly_applied.append(version)
+            print(f"🗄️ تم تطبيق ترحيل قاعدة البيانات {version}: {name}")
+        self._schema_version = max([version for version, _, _ in MIGRATIONS if version in applied] + newly_applied,
+                                   default=0)
+        return newly_applied
+
+    def import_legacy_notifications(self, conn):
+        """نقل سجل notifications.db القديم إلى القاعدة الموحدة دفعات (SQLite أو PostgreSQL)"""
+        path = self.legacy_notifications_db
+        if not path or not os.path.exists(path):
+            return 0
+        if self.backend == 'sqlite' and os.path.abspath(path) == os.path.abspath(self.db.pool.path):
+            return 0
+        legacy = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        imported = 0
+        try:
+            tables = {row[0] for row in legacy.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            plan = [
+                ('booking_logs', _BOOKING_LOG_COLUMNS, 'insert_booking_log', ()),
+                ('booking_notifications', _BOOKING_NOTIFICATION_COLUMNS, 'import_booking_notification',
+                 ('notification_sent', 'email_sent', 'telegram_sent')),
+                ('notification_status', _NOTIFICATION_STATUS_COLUMNS, 'upsert_notification_status',
+                 ('email_sent', 'telegram_sent', 'whatsapp_sent'))
+            ]
+            for table, columns, statement, flags in plan:
+                if table not in tables:
+                    continue
+                # قيم BOOLEAN في SQLite أعداد صحيحة - PostgreSQL يحتاج True/False
+                flag_positions = [columns.index(flag) for flag in flags]
+                rows = [
+                    tuple(bool(value) if i in flag_positions else value for i, value in enumerate(row))
+                    for row in legacy.execute(f"SELECT {', '.join(columns)} FROM {table} ORDER BY id")
+                ]
+                imported += self.db.execute_many(statement, rows, conn=conn)
+        finally:
+            legacy.close()
+        if imported:
+            print(f"📦 تم نقل {imported} سجلاً من {path} إلى قاعدة البيانات الموحدة")
+        return imported
+
+    def schema_version(self):
+        return self._schema_version
+
+    def stats(self):
+        return dict(self.db.stats(), schema_version=self._schema_version)
+
+    def close(self):
+        self.db.close()
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_storage():
+    """إرجاع طبقة التخزين المشتركة للعملية (تُنشأ وتُرحَّل عند أول استخدام)"""
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            storage = Storage(Database.from_env())
+            storage.migrate()
+            _storage = storage
+        return _storage
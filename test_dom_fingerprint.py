@@ -0,0 +1,62 @@
+"""
+اختبار بصمة الصفحة: البصمة لا تُعتمد إلا بعد نجاح الفحص، وتغير عدد المواعيد يُسجل دائماً
+FingerprintTracker checks with a fake driver - run with: python -m unittest test_dom_fingerprint
+"""
+
+import unittest
+
+from dom_fingerprint import FingerprintTracker
+
+KEY = ('madrid', 'tourist')
+
+
+class FakeDriver:
+    """يعيد بصمة المناطق المضبوطة في regions"""
+
+    def __init__(self, **regions):
+        self.regions = regions
+
+    def execute_script(self, script, *args):
+        return {name: {'hash': value, 'nodes': 1} for name, value in self.regions.items()}
+
+
+class FingerprintTrackerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tracker = FingerprintTracker()
+        self.driver = FakeDriver(calendar='c1', slots='s1', modal='m1')
+
+    def test_unchanged_page_is_reported_only_after_a_recorded_scan(self):
+        self.assertTrue(self.tracker.observe(KEY, self.driver)['changed'])
+        # الفحص السابق لم يكتمل - البصمة لم تُعتمد بعد
+        self.assertTrue(self.tracker.observe(KEY, self.driver)['changed'])
+        self.tracker.record_scan(KEY, 0)
+        self.assertEqual(self.tracker.observe(KEY, self.driver), {'changed': False, 'regions': []})
+
+    def test_failed_scan_keeps_the_previous_fingerprint(self):
+        self.tracker.observe(KEY, self.driver)
+        self.tracker.record_scan(KEY, 0)
+
+        self.driver.regions['slots'] = 's2'
+        self.assertEqual(self.tracker.observe(KEY, self.driver)['regions'], ['slots'])
+        # فشل الفحص (لا record_scan): الدورة التالية ترى التغير نفسه مرة أخرى
+        change = self.tracker.observe(KEY, self.driver)
+        self.assertEqual((change['changed'], change['regions']), (True, ['slots']))
+
+        event = self.tracker.record_scan(KEY, 3)
+        self.assertEqual((event['regions'], event['available'], event['count']), (['slots'], True, 3))
+        self.assertFalse(self.tracker.observe(KEY, self.driver)['changed'])
+
+    def test_count_change_outside_the_regions_is_logged(self):
+        self.tracker.observe(KEY, self.driver)
+        self.tracker.record_scan(KEY, 0)
+
+        self.assertFalse(self.tracker.observe(KEY, self.driver)['changed'])
+        event = self.tracker.record_scan(KEY, 2)
+        self.assertEqual((event['regions'], event['count']), ([], 2))
+        self.assertIsNone(self.tracker.record_scan(KEY, 2))
+        self.assertEqual([e['count'] for e in self.tracker.history()], [2])
+
+
+if __name__ == '__main__':
+    unittest.main()
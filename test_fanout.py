@@ -0,0 +1,139 @@
+"""
+اختبار توزيع التنبيهات: دلو الرموز وحدود كل محادثة وإعادة الإرسال بعد RetryAfter
+Token bucket, per-chat limit and RetryAfter checks with a fake clock - run with: python -m unittest test_fanout
+"""
+
+import heapq
+import unittest
+from unittest import mock
+
+from fanout import FanOutChannel, FanOutEngine, FanOutJob, RetryAfter, TokenBucket, _ChannelQueue
+
+
+class FakeClock:
+
+    def __init__(self, now=100.0):
+        self.now = now
+
+    def monotonic(self):
+        return self.now
+
+
+def channel(name='telegram', **kwargs):
+    options = dict(address=lambda subscriber: subscriber.get('chat'), send_batch=lambda event, subscribers: [],
+                   rate=10, burst=2, per_chat_rate=1, per_chat_burst=1, batch_size=5, linger=0)
+    options.update(kwargs)
+    return FanOutChannel(name, **options)
+
+
+class TokenBucketTest(unittest.TestCase):
+
+    def test_burst_then_steady_rate(self):
+        bucket = TokenBucket(rate=2, capacity=3)
+        for _ in range(3):
+            self.assertEqual(bucket.available_at(10.0), 10.0)
+            bucket.consume(10.0)
+        # بعد استهلاك رصيد burst يتوفر رمز كل 1/rate ثانية
+        self.assertEqual(bucket.available_at(10.0), 10.5)
+        bucket.consume(10.5)
+        self.assertEqual(bucket.available_at(10.5), 11.0)
+
+    def test_penalize_blocks_until_retry_after(self):
+        bucket = TokenBucket(rate=10, capacity=5)
+        bucket.penalize(20.0)
+        self.assertEqual(bucket.available_at(15.0), 20.0)
+        self.assertEqual(bucket.available_at(25.0), 25.0)
+
+
+class ChannelQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch('fanout.time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def queue_with(self, chats):
+        queue = _ChannelQueue(channel())
+        for seq, chat in enumerate(chats):
+            heapq.heappush(queue.heap, (self.clock.now, seq, {'address': chat, 'name': f"{chat}{seq}"}))
+        return queue
+
+    def test_provider_and_per_chat_limits(self):
+        queue = self.queue_with(['a', 'a', 'b', 'c'])
+
+        batch, send_at, wait = queue.take_batch()
+        # رصيد المزود رسالتان، والرسالة الثانية لنفس المحادثة تنتظر حدها دون أن تحجب غيرها
+        self.assertEqual([item['name'] for item in batch], ['a0', 'b2'])
+        self.assertEqual(send_at, 100.0)
+        self.assertIsNone(wait)
+
+        batch, _, wait = queue.take_batch()
+        self.assertEqual(batch, [])
+        self.assertAlmostEqual(wait, 0.1)
+
+        self.clock.now += 0.1
+        batch, _, _ = queue.take_batch()
+        self.assertEqual([item['name'] for item in batch], ['c3'])
+
+        self.clock.now = 100.9
+        self.assertEqual(queue.take_batch()[0], [])
+        self.clock.now = 101.0
+        self.assertEqual([item['name'] for item in queue.take_batch()[0]], ['a1'])
+        self.assertGreaterEqual(queue.counters['throttled_waits'], 1)
+
+    def test_retry_after_requeues_and_penalizes_the_provider(self):
+        responses = [[RetryAfter(5), None]]
+        engine = FanOutEngine([channel(send_batch=lambda event, subscribers: responses.pop(0), max_retries=1)])
+        self.addCleanup(engine.shutdown, 0)
+        queue = engine._queues['telegram']
+        job = FanOutJob('event')
+        job._expect('telegram', 2)
+        items = [{'job': job, 'subscriber': {'chat': chat}, 'address': chat, 'attempts': 0} for chat in 'ab']
+
+        engine._send(queue, items)
+        self.assertEqual([(ready, item['address']) for ready, _, item in queue.heap], [(105.0, 'a')])
+        self.assertEqual(queue.provider.available_at(100.0), 105.0)
+        self.assertEqual(job.counts['telegram'], {'queued': 2, 'sent': 1, 'failed': 0})
+
+        # بعد max_retries تُحسب الرسالة فاشلة
+        heapq.heappop(queue.heap)
+        responses.append([RetryAfter(5)])
+        engine._send(queue, items[:1])
+        self.assertEqual(queue.heap, [])
+        self.assertEqual(job.counts['telegram'], {'queued': 2, 'sent': 1, 'failed': 1})
+        self.assertTrue(job.wait(0))
+
+
+class FanOutEngineTest(unittest.TestCase):
+
+    def test_fan_out_deduplicates_and_skips_missing_addresses(self):
+        delivered = {'email': [], 'telegram': []}
+
+        def recorder(name):
+            def send_batch(event, subscribers):
+                delivered[name].extend(subscribers)
+                return [None] * len(subscribers)
+            return send_batch
+
+        engine = FanOutEngine([
+            channel('email', address=lambda subscriber: subscriber.get('email'), send_batch=recorder('email'),
+                    rate=1000, burst=1000),
+            channel('telegram', send_batch=recorder('telegram'), rate=1000, burst=1000)
+        ])
+        self.addCleanup(engine.shutdown, 1)
+        job = engine.fan_out('slots', [
+            {'email': 'a@example.com', 'chat': '1'},
+            {'email': 'a@example.com', 'chat': '2'},
+            {'email': 'b@example.com'}
+        ])
+        self.assertTrue(job.wait(5))
+        report = job.report()
+        self.assertEqual(report['recipients'], 4)
+        self.assertEqual(report['channels']['email'], {'queued': 2, 'sent': 2, 'failed': 0})
+        self.assertEqual(sorted(subscriber['chat'] for subscriber in delivered['telegram']), ['1', '2'])
+        self.assertEqual(engine.stats()['skipped'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
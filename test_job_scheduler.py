@@ -0,0 +1,67 @@
+"""
+اختبار مجدول المهام: مهام مجموعة ممتلئة لا تحجب مهام المجموعات الأخرى
+Regression check for JobScheduler group limits - run with: python -m unittest test_job_scheduler
+"""
+
+import threading
+import time
+import unittest
+
+from job_scheduler import Job, JobScheduler, JOB_DONE
+
+
+def wait_until(condition, timeout=5):
+    """انتظار تحقق شرط حتى timeout ثانية بدلاً من مدة ثابتة"""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(0.005)
+    return True
+
+
+class GroupLimitTest(unittest.TestCase):
+
+    def test_full_group_does_not_block_other_groups(self):
+        scheduler = JobScheduler(max_workers=4, group_limits={'booking': 1})
+        release = threading.Event()
+        booking_started = threading.Event()
+        bookings = []
+        observed = []
+        observed_enough = threading.Event()
+
+        def booking(token):
+            booking_started.set()
+            release.wait(5)
+            bookings.append(token)
+            return JOB_DONE
+
+        def observe(token):
+            observed.append(token)
+            if len(observed) >= 4:
+                observed_enough.set()
+
+        try:
+            # حجزان في مجموعة حدها 1: الثاني يبقى مستحقاً ما دام الأول يعمل
+            scheduler.submit(Job('book-1', booking, group='booking', priority=10))
+            scheduler.submit(Job('book-2', booking, group='booking', priority=10))
+            self.assertTrue(booking_started.wait(5))
+            self.assertTrue(wait_until(lambda: scheduler.stats()['parked'] == {'booking': 1}))
+
+            scheduler.submit(Job('observe', observe, interval=0.01, group='observe'))
+            self.assertTrue(observed_enough.wait(5))
+            self.assertEqual(bookings, [])
+            self.assertEqual(scheduler.stats()['parked'], {'booking': 1})
+
+            # عند تحرر المكان تعود المهمة المركونة وتعمل
+            release.set()
+            self.assertTrue(wait_until(lambda: len(bookings) == 2))
+            self.assertTrue(wait_until(lambda: scheduler.stats()['group_running'].get('booking', 0) == 0))
+            self.assertEqual(scheduler.stats()['parked'], {})
+        finally:
+            release.set()
+            scheduler.shutdown(wait=False)
+
+
+if __name__ == '__main__':
+    unittest.main()
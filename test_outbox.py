@@ -0,0 +1,165 @@
+"""
+اختبار صندوق الإشعارات: إعادة المحاولة والرسائل الميتة ومدة الحجز والإرسال المتأخر
+Outbox worker and repository checks with a fake clock and fake senders - run with:
+python -m unittest test_outbox
+"""
+
+import os
+import tempfile
+import unittest
+from concurrent.futures import Future
+from unittest import mock
+
+from db_pool import Database, SQLitePool
+from job_scheduler import ExponentialBackoff
+from outbox import OutboxWorker
+from storage import Storage
+
+
+class FakeClock:
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+class FakeDispatcher:
+    """يرسل القنوات بالتتابع - القنوات في stall تُعامل كأنها تجاوزت مهلتها وما زالت جارية"""
+
+    def __init__(self, stall=()):
+        self.stall = set(stall)
+        self.stalled = []
+
+    def dispatch(self, channels, on_timeout=None):
+        results = {}
+        for name, (send, timeout) in channels.items():
+            if name in self.stall:
+                future = Future()
+                self.stalled.append((future, send))
+                on_timeout(name, future)
+                results[name] = False
+            else:
+                results[name] = bool(send())
+        return results
+
+
+class OutboxTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.storage = Storage(Database(SQLitePool(os.path.join(self.tmp.name, 'test.db'))),
+                               legacy_notifications_db=None)
+        self.storage.migrate()
+        self.repository = self.storage.outbox
+        self.clock = FakeClock()
+        for target in ('storage.time', 'outbox.time'):
+            patcher = mock.patch(target, self.clock)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.storage.db.close()
+        self.tmp.cleanup()
+
+    def log(self, booking_id='ESP-2024-001234', channels=('email',)):
+        self.storage.notifications.log_booking({'email': 'user@example.com'}, {'booking_id': booking_id}, channels)
+
+    def rows(self):
+        self.storage.db.register('test_outbox_rows', sql='''
+            SELECT channel, status, attempts, next_attempt_at, provider_message_id FROM notification_outbox ORDER BY id
+        ''')
+        return self.storage.db.execute('test_outbox_rows', fetch='all_dicts')
+
+    def worker(self, senders, dispatcher=None, **kwargs):
+        return OutboxWorker(self.repository, senders, dispatcher or FakeDispatcher(),
+                            backoff=ExponentialBackoff(base=30, factor=2, max_delay=3600), **kwargs)
+
+    def test_failed_send_is_retried_with_backoff_then_dead_lettered(self):
+        self.log()
+        worker = self.worker({'email': (lambda payload, key: False, 5)}, max_attempts=3)
+
+        self.assertEqual(worker.run_once(), 1)
+        row = self.rows()[0]
+        self.assertEqual((row['status'], row['attempts']), ('pending', 1))
+        self.assertEqual(row['next_attempt_at'], self.clock.now + 30)
+
+        # غير مستحقة قبل انتهاء التأخير
+        self.assertEqual(worker.run_once(), 0)
+        self.clock.now += 30
+        self.assertEqual(worker.run_once(), 1)
+        self.assertEqual(self.rows()[0]['next_attempt_at'], self.clock.now + 60)
+
+        self.clock.now += 60
+        self.assertEqual(worker.run_once(), 1)
+        self.assertEqual(self.rows()[0]['status'], 'dead')
+        self.assertEqual(worker.stats()['dead'], 1)
+
+        self.assertEqual(self.repository.requeue_dead(), 1)
+        self.assertEqual((self.rows()[0]['status'], self.rows()[0]['attempts']), ('pending', 0))
+
+    def test_claim_lease_hides_rows_until_it_expires(self):
+        self.log()
+        self.assertEqual(len(self.repository.claim(10, lease=120)), 1)
+        # عامل آخر (أو العامل نفسه) لا يحجز الرسالة أثناء مدة الحجز
+        self.assertEqual(self.repository.claim(10, lease=120), [])
+        # توقف العملية قبل حفظ النتيجة: تعود الرسالة مستحقة بعد انتهاء المدة
+        self.clock.now += 121
+        claimed = self.repository.claim(10, lease=120)
+        self.assertEqual([row['attempts'] for row in claimed], [2])
+
+    def test_sent_row_records_receipt_and_is_not_claimed_again(self):
+        self.log(channels=('email', 'telegram'))
+        worker = self.worker({'email': (lambda payload, key: '<mid@x>', 5),
+                              'telegram': (lambda payload, key: 4242, 5)})
+        self.assertEqual(worker.run_once(), 2)
+        self.assertEqual(sorted((row['status'], row['provider_message_id']) for row in self.rows()),
+                         [('sent', '4242'), ('sent', '<mid@x>')])
+        self.clock.now += 10000
+        self.assertEqual(worker.run_once(), 0)
+
+    def test_send_past_its_deadline_is_not_retried_while_running(self):
+        self.log(channels=('telegram',))
+        posts = []
+        dispatcher = FakeDispatcher(stall={'telegram'})
+        worker = self.worker({'telegram': (lambda payload, key: posts.append(key) or 77, 1)}, dispatcher)
+
+        worker.run_once()
+        self.assertEqual(self.rows()[0]['status'], 'pending')
+        self.clock.now += 60
+        self.assertEqual(worker.run_once(), 0)
+
+        # الإرسال الجاري ينتهي بنجاح بعد المهلة
+        future, send = dispatcher.stalled[0]
+        future.set_result((send(), 0.0))
+        self.assertEqual(len(posts), 1)
+        self.assertEqual((self.rows()[0]['status'], self.rows()[0]['provider_message_id']), ('sent', '77'))
+        self.assertEqual(worker.stats()['late'], 1)
+
+    def test_late_failure_is_retried(self):
+        self.log(channels=('telegram',))
+        dispatcher = FakeDispatcher(stall={'telegram'})
+        worker = self.worker({'telegram': (lambda payload, key: None, 1)}, dispatcher)
+        worker.run_once()
+        future, send = dispatcher.stalled[0]
+        future.set_result((send(), 0.0))
+        row = self.rows()[0]
+        self.assertEqual((row['status'], row['next_attempt_at']), ('pending', self.clock.now + 30))
+
+    def test_bookings_sharing_an_id_are_delivered_separately(self):
+        self.log()
+        self.log()
+        keys, delivered = [], []
+        worker = self.worker({'email': (lambda payload, key: keys.append(key) or True, 5)},
+                             on_delivered=lambda booking_id, key: delivered.append((booking_id, key)))
+        self.assertEqual(worker.run_once(), 2)
+        self.assertEqual(len(set(keys)), 2)
+        self.assertEqual(len({key for _, key in delivered}), 2)
+        self.assertEqual({booking_id for booking_id, _ in delivered}, {'ESP-2024-001234'})
+        for _, key in delivered:
+            self.assertEqual(self.repository.delivery_state(key), {'email': 'sent'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -14,6 +14,8 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.options import Options
 from selenium.common.exceptions import TimeoutException, NoSuchElementException
+from page_watcher import PageWatcher, modal_appeared
+from browser_pool import BLS_BASE_URL
 
 class VisibleSpainVisaBot:
     def __init__(self):
@@ -144,7 +146,7 @@ class VisibleSpainVisaBot:
         try:
             # فتح الموقع
             print("📱 فتح موقع BLS Spain Morocco...")
-            self.driver.get("https://blsspainmorocco.com")
+            self.driver.get(BLS_BASE_URL)
             time.sleep(5)
             
             # إغلاق نافذة التحذير
@@ -157,11 +159,11 @@ class VisibleSpainVisaBot:
             
             # البحث عن روابط المدن والانتقال إلى طنجة أولاً
             city_links = [
-                ('Tangier', 'https://blsspainmorocco.com/tangier'),
-                ('Agadir', 'https://blsspainmorocco.com/agadir'),
-                ('Casablanca', 'https://blsspainmorocco.com/casablanca'),
-                ('Rabat', 'https://blsspainmorocco.com/rabat'),
-                ('Tetouan', 'https://blsspainmorocco.com/tetouan')
+                ('Tangier', BLS_BASE_URL.rstrip('/') + '/tangier'),
+                ('Agadir', BLS_BASE_URL.rstrip('/') + '/agadir'),
+                ('Casablanca', BLS_BASE_URL.rstrip('/') + '/casablanca'),
+                ('Rabat', BLS_BASE_URL.rstrip('/') + '/rabat'),
+                ('Tetouan', BLS_BASE_URL.rstrip('/') + '/tetouan')
             ]
             
             print("🏙️ البحث عن روابط المدن...")
@@ -196,16 +198,23 @@ class VisibleSpainVisaBot:
                         
                         try:
                             warning_found = False
-                            check_interval = 2  # فحص كل ثانيتين
-                            elapsed_time = 0
+                            check_interval = 2  # أقصى انتظار لحدث من المراقب في كل دورة
+                            
+                            # مراقب داخل الصفحة يسجل ظهور النافذة فور حدوثه بدلاً من إعادة الفحص
+                            watcher = PageWatcher(self.driver)
+                            watcher.install()
                             max_wait_time = 120  # حد أقصى 2 دقيقة للانتظار
+                            # الوقت الفعلي - المراقب قد يعيد قبل انتهاء check_interval عند تغيرات الصفحة المتكررة
+                            started = last_refresh = last_diagnostic = time.monotonic()
                             
                             # مراقبة مستمرة مع حد زمني أقصى
-                            while elapsed_time < max_wait_time:
+                            while time.monotonic() - started < max_wait_time:
+                                elapsed_time = int(time.monotonic() - started)
                                 print(f"⏰ الوقت المنقضي: {elapsed_time} ثانية - مراقبة مستمرة...")
                                 
                                 # تحديث الصفحة تلقائياً كل 60 ثانية إذا لم تظهر النافذة
-                                if elapsed_time > 0 and elapsed_time % 60 == 0:
+                                if time.monotonic() - last_refresh >= 60:
+                                    last_refresh = time.monotonic()
                                     print(f"🔄 تحديث الصفحة تلقائياً بعد {elapsed_time} ثانية لإظهار نافذة التحذير...")
                                     try:
                                         self.driver.refresh()
@@ -230,7 +239,8 @@ class VisibleSpainVisaBot:
                                         print(f"⚠️ خطأ في تحديث الصفحة: {refresh_error}")
                                 
                                 # إضافة رسائل تشخيصية لحالة الشبكة كل 30 ثانية
-                                if elapsed_time > 0 and elapsed_time % 30 == 0:
+                                if time.monotonic() - last_diagnostic >= 30:
+                                    last_diagnostic = time.monotonic()
                                     print(f"🌐 فحص حالة الاتصال... (مرت {elapsed_time} ثانية)")
                                     try:
                                         current_url = self.driver.current_url
@@ -241,8 +251,9 @@ class VisibleSpainVisaBot:
                                     except:
                                         print("⚠️ مشكلة في الاتصال بالصفحة")
                                 
-                                # فحص نافذة التحذير بشكل عادي
-                                window_closed = self.check_and_close_warning_window(city_name)
+                                # انتظار حدث من المراقب ثم فحص النافذة فقط عند رصد ظهورها
+                                events = watcher.wait_for_events(check_interval)
+                                window_closed = modal_appeared(events) and self.check_and_close_warning_window(city_name)
                                 if window_closed:
                                     print("⏳ انتظار 5 ثوانِ للتأكد من عدم ظهور النافذة مرة أخرى...")
                                     time.sleep(5)
@@ -257,9 +268,6 @@ class VisibleSpainVisaBot:
                                     print("🔍 البحث عن زر المواعيد...")
                                     self.find_and_click_appointment_button(city_name)
                                     return  # الخروج من الدالة بعد النجاح
-                                
-                                time.sleep(check_interval)
-                                elapsed_time += check_interval
                             
                             # إذا انتهى الوقت المحدد بدون ظهور نافذة التحذير، ننتقل مباشرة للبحث عن زر المواعيد
                             print(f"⏰ انتهى الوقت المحدد ({max_wait_time} ثانية) - الانتقال إلى البحث عن زر المواعيد...")
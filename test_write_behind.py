@@ -0,0 +1,92 @@
+"""
+اختبار الكتابة المؤجلة: حفظ الدفعات الفاشلة على القرص وإعادة كتابتها عند التشغيل التالي
+Write-behind spill/replay checks with a fake repository - run with: python -m unittest test_write_behind
+"""
+
+import json
+import os
+import tempfile
+import unittest
+from contextlib import contextmanager
+from unittest import mock
+
+from write_behind import WriteBehindBuffer
+
+
+class FakeRepository:
+    """يسجل ما يُكتب في الذاكرة - fail=True يحاكي قاعدة بيانات متوقفة"""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.db = self
+        self.bookings = []
+        self.statuses = []
+
+    @contextmanager
+    def connection(self):
+        yield None
+
+    def log_bookings(self, entries, conn=None):
+        if self.fail:
+            raise RuntimeError('database is down')
+        self.bookings.extend(entries)
+
+    def update_notification_statuses(self, statuses, conn=None):
+        if self.fail:
+            raise RuntimeError('database is down')
+        self.statuses.extend(statuses)
+
+
+class WriteBehindTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.spill_path = os.path.join(self.tmp.name, 'spill.jsonl')
+        # لا انتظار حقيقي بين محاولات الكتابة
+        patcher = mock.patch('write_behind.time.sleep')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def buffer(self, repository):
+        buffer = WriteBehindBuffer(repository, linger=0, max_retries=2, spill_path=self.spill_path)
+        self.addCleanup(buffer.close, 1)
+        return buffer
+
+    def test_failed_batch_is_spilled_and_replayed_with_the_same_keys(self):
+        down = FakeRepository(fail=True)
+        buffer = self.buffer(down)
+        booking_id = buffer.log_booking({'email': 'user@example.com'}, {'booking_id': 'B-1'}, ['email'])
+        buffer.update_notification_status(booking_id, True, False)
+        self.assertTrue(buffer.flush(timeout=5))
+
+        stats = buffer.stats()
+        self.assertEqual(stats['spilled'], 2)
+        self.assertEqual(stats['written'], 0)
+        with open(self.spill_path, encoding='utf-8') as f:
+            spilled = [json.loads(line) for line in f]
+        self.assertEqual([entry['op'] for entry in spilled], ['booking', 'status'])
+        notification_key = spilled[0]['args'][1]['notification_key']
+
+        up = FakeRepository()
+        replay = self.buffer(up)
+        self.assertTrue(replay.flush(timeout=5))
+        self.assertFalse(os.path.exists(self.spill_path))
+        self.assertEqual(replay.stats()['replayed'], 2)
+        user_data, details, channels = up.bookings[0]
+        # مفتاح الإشعارات نفسه - صندوق الإشعارات لا يضيف الرسالة مرتين إذا كُتبت الدفعة سابقاً
+        self.assertEqual((details['booking_id'], details['notification_key'], channels),
+                         ('B-1', notification_key, ['email']))
+        self.assertEqual([tuple(status) for status in up.statuses], [('B-1', True, False, False)])
+
+    def test_writes_after_close_go_straight_to_the_repository(self):
+        repository = FakeRepository()
+        buffer = self.buffer(repository)
+        buffer.close()
+        buffer.log_booking({'email': 'user@example.com'}, {'booking_id': 'B-2'})
+        self.assertEqual([details['booking_id'] for _, details, _ in repository.bookings], ['B-2'])
+        self.assertNotIn('notification_key', repository.bookings[0][1])
+
+
+if __name__ == '__main__':
+    unittest.main()
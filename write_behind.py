@@ -0,0 +1,202 @@
+"""
+كتابة مؤجلة لسجل الحجوزات وحالة الإشعارات
+Write-behind buffer for booking and notification-status writes - callers enqueue and
+return immediately; a background writer groups queued writes into one transaction per
+batch, spills unwritten entries to disk and replays them on the next start
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from storage import booking_id_for, with_notification_key
+
+DEFAULT_SPILL_PATH = '.write_behind_spill.jsonl'
+
+OP_BOOKING = 'booking'
+OP_STATUS = 'status'
+
+
+class WriteBehindBuffer:
+    """طابور كتابة في الذاكرة أمام NotificationLogRepository
+
+    الكاتب ينتظر linger ثانية بعد أول عنصر ليجمع ما يصل بعده (حتى max_batch) ثم يكتب الدفعة
+    في معاملة واحدة: الحجوزات أولاً ثم حالات الإشعارات. الدفعة التي تفشل بعد max_retries
+    محاولات تُحفظ في spill_path وتُعاد كتابتها عند التشغيل التالي. on_commit (إن ضُبط) يُستدعى
+    بعد كل دفعة مكتوبة - يستخدمه عامل صندوق الإشعارات ليبدأ الإرسال فوراً
+    """
+
+    def __init__(self, repository, max_batch=200, linger=0.05, max_retries=3, spill_path=DEFAULT_SPILL_PATH):
+        self.repository = repository
+        self.max_batch = max_batch
+        self.linger = linger
+        self.max_retries = max_retries
+        self.spill_path = spill_path
+        self.on_commit = None
+        self._queue = deque()
+        self._in_flight = 0
+        self._closed = False
+        self._writer = None
+        self._cond = threading.Condition()
+        self._write_ms = deque(maxlen=500)
+        self._lag_ms = deque(maxlen=500)
+        self.counters = {
+            'enqueued': 0,
+            'written': 0,
+            'batches': 0,
+            'peak_queue_depth': 0,
+            'errors': 0,
+            'spilled': 0,
+            'replayed': 0
+        }
+        self._replay_spill()
+
+    def log_booking(self, user_data, booking_details, channels=()):
+        """جدولة تسجيل حجز ناجح (ورسائل قنواته في صندوق الإشعارات) - يعيد معرف الحجز فوراً"""
+        booking_details = dict(booking_details, booking_id=booking_id_for(booking_details))
+        if channels:
+            # المفتاح يُحدد قبل الطابور حتى تبقى إعادة المحاولة والاسترجاع من القرص دون تكرار
+            booking_details = with_notification_key(booking_details)
+        self._enqueue(OP_BOOKING, (dict(user_data), booking_details, list(channels)))
+        return booking_details['booking_id']
+
+    def update_notification_status(self, booking_id, email_sent, telegram_sent, whatsapp_sent=False):
+        """جدولة حفظ حالة الإشعارات لحجز"""
+        self._enqueue(OP_STATUS, (booking_id, bool(email_sent), bool(telegram_sent), bool(whatsapp_sent)))
+
+    def _enqueue(self, op, args):
+        item = (op, args, time.time())
+        with self._cond:
+            if not self._closed:
+                self._queue.append(item)
+                self.counters['enqueued'] += 1
+                self.counters['peak_queue_depth'] = max(self.counters['peak_queue_depth'], len(self._queue))
+                if self._writer is None:
+                    self._writer = threading.Thread(target=self._write_loop, name='write-behind', daemon=True)
+                    self._writer.start()
+                self._cond.notify_all()
+                return
+            self.counters['enqueued'] += 1
+        # بعد الإغلاق تُكتب العمليات مباشرة حتى لا تضيع
+        self._write_batch([item])
+
+    def _write_loop(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                deadline = time.monotonic() + self.linger
+                while len(self._queue) < self.max_batch and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = [self._queue.popleft() for _ in range(min(self.max_batch, len(self._queue)))]
+                self._in_flight = len(batch)
+            try:
+                self._write_batch(batch)
+            finally:
+                with self._cond:
+                    self._in_flight = 0
+                    self._cond.notify_all()
+
+    def _write_batch(self, batch):
+        bookings = [args for op, args, _ in batch if op == OP_BOOKING]
+        statuses = [args for op, args, _ in batch if op == OP_STATUS]
+        for attempt in range(self.max_retries):
+            started = time.perf_counter()
+            try:
+                with self.repository.db.connection() as conn:
+                    if bookings:
+                        self.repository.log_bookings(bookings, conn=conn)
+                    if statuses:
+                        self.repository.update_notification_statuses(statuses, conn=conn)
+            except Exception as e:
+                with self._cond:
+                    self.counters['errors'] += 1
+                logging.warning(f"⚠️ فشل كتابة دفعة السجل ({len(batch)} عملية، محاولة {attempt + 1}): {e}")
+                if attempt + 1 < self.max_retries:
+                    time.sleep(0.5 * 2 ** attempt)
+                continue
+            finished = time.time()
+            with self._cond:
+                self.counters['written'] += len(batch)
+                self.counters['batches'] += 1
+                self._write_ms.append((time.perf_counter() - started) * 1000)
+                self._lag_ms.append((finished - min(enqueued for _, _, enqueued in batch)) * 1000)
+            if bookings and self.on_commit is not None:
+                self.on_commit()
+            return True
+        self._spill(batch)
+        return False
+
+    def _spill(self, batch):
+        """حفظ الدفعة الفاشلة على القرص (سطر JSON لكل عملية)"""
+        try:
+            with open(self.spill_path, 'a', encoding='utf-8') as f:
+                for op, args, enqueued in batch:
+                    f.write(json.dumps({'op': op, 'args': args, 'enqueued_at': enqueued}, ensure_ascii=False) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+        except OSError as e:
+            logging.error(f"❌ تعذر حفظ {len(batch)} عملية سجل غير مكتوبة: {e}")
+            return
+        with self._cond:
+            self.counters['spilled'] += len(batch)
+        logging.error(f"❌ حُفظت {len(batch)} عملية سجل في {self.spill_path} لإعادة كتابتها لاحقاً")
+
+    def _replay_spill(self):
+        if not self.spill_path or not os.path.exists(self.spill_path):
+            return
+        try:
+            with open(self.spill_path, encoding='utf-8') as f:
+                entries = [json.loads(line) for line in f if line.strip()]
+            os.remove(self.spill_path)
+        except (OSError, ValueError) as e:
+            logging.error(f"❌ تعذر قراءة عمليات السجل المحفوظة: {e}")
+            return
+        for entry in entries:
+            self._enqueue(entry['op'], tuple(entry['args']))
+        self.counters['replayed'] += len(entries)
+        logging.info(f"📦 إعادة كتابة {len(entries)} عملية سجل محفوظة من التشغيل السابق")
+
+    def flush(self, timeout=None):
+        """انتظار كتابة كل ما في الطابور - يعيد False عند انتهاء المهلة"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._cond.notify_all()
+            while self._queue or self._in_flight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, timeout=10):
+        """إيقاف الكاتب بعد تفريغ الطابور - ما لم يُكتب خلال المهلة يُحفظ على القرص"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            writer = self._writer
+        if writer is not None:
+            writer.join(timeout)
+        with self._cond:
+            remaining = list(self._queue)
+            self._queue.clear()
+        if remaining:
+            self._spill(remaining)
+
+    def stats(self):
+        with self._cond:
+            write_ms = sorted(self._write_ms)
+            lag_ms = sorted(self._lag_ms)
+            stats = dict(self.counters, queue_depth=len(self._queue), in_flight=self._in_flight, closed=self._closed)
+        stats['avg_batch_size'] = round(stats['written'] / stats['batches'], 2) if stats['batches'] else None
+        stats['flush_ms_avg'] = round(sum(write_ms) / len(write_ms), 3) if write_ms else None
+        stats['flush_ms_p95'] = round(write_ms[min(len(write_ms) - 1, int(0.95 * len(write_ms)))], 3) if write_ms else None
+        stats['lag_ms_max'] = round(lag_ms[-1], 3) if lag_ms else None
+        return stats